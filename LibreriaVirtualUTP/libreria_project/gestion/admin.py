@@ -1,21 +1,346 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.utils.functional import cached_property
 # Importamos todos los modelos que creamos en models.py
-from .models import Categoria, Cliente, Producto, PersonalDelivery, Pedido, DetallePedido
+from .models import (
+    Categoria, Cliente, Producto, PersonalDelivery, Pedido, DetallePedido,
+    MovimientoStock, SnapshotStock, DescuentoCategoria, Promocion, EventoCambio,
+    Almacen, StockAlmacen, EntregaSincronizada,
+)
+from . import archivo, cambios, facetas, inventario
+from .concurrencia import guardar_con_version
 
-# Le decimos a Django que registre estos modelos en el panel de admin
 
-# Mantenimiento de Categorías 
-admin.site.register(Categoria)
+class PaginadorConteoAcotado(Paginator):
+    """
+    Paginador que no cuenta más allá de LIMITE filas.
+    En tablas grandes el COUNT(*) del listado es la consulta más cara;
+    así se cuenta sobre un SELECT ... LIMIT y el costo queda acotado.
 
-# Mantenimiento de Clientes 
-admin.site.register(Cliente)
+    Por eso el listado solo llega hasta la página LIMITE / list_per_page
+    (200 con 50 por página) y muestra "10000+" en lugar del total
+    (templates/admin/gestion/pagination.html). Más allá se llega con la
+    búsqueda, los filtros o la jerarquía por fecha, que achican el conjunto.
+    """
+    LIMITE = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.LIMITE].count()
+
+    @property
+    def acotado(self):
+        """True si el conteo llegó al límite (hay LIMITE filas o más)."""
+        return self.count >= self.LIMITE
+
+
+class AdminListadoGrande(admin.ModelAdmin):
+    """Base para los modelos cuyas tablas crecen mucho."""
+    paginator = PaginadorConteoAcotado
+    show_full_result_count = False  # Evita el segundo COUNT(*) sin filtros
+    list_per_page = 50
+
+
+class AdminSoloLectura(admin.ModelAdmin):
+    """
+    Registros que solo escribe la aplicación (kardex, líneas de venta, feed):
+    el admin los muestra pero no permite crearlos, editarlos ni borrarlos.
+    """
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class AdminConFeedCambios(admin.ModelAdmin):
+    """
+    Altas, cambios y borrados hechos desde el admin: dejan su evento en el
+    feed de cambios (gestion/cambios.py) en la misma transacción, igual que
+    las vistas.
+    """
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if change:
+                concretos = {campo.name: campo.attname for campo in obj._meta.concrete_fields}
+                cambios.registrar(obj, 'modificacion',
+                                  [concretos[nombre] for nombre in form.changed_data if nombre in concretos])
+            else:
+                cambios.registrar(obj, 'alta')
+
+    def delete_model(self, request, obj):
+        pk = obj.pk  # delete() lo deja en None
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            cambios.registrar_lote([cambios.evento(type(obj).__name__, pk, 'baja', {})])
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            pks = list(queryset.values_list('pk', flat=True))
+            super().delete_queryset(request, queryset)
+            cambios.registrar_lote([cambios.evento(queryset.model.__name__, pk, 'baja', {}) for pk in pks])
+
+
+class FormularioConVersion(forms.ModelForm):
+    """Lleva la versión con la que se abrió el formulario (como los de las vistas)."""
+    version_original = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['version_original'].initial = self.instance.version
+
+    def clean(self):
+        datos = super().clean()
+        modelo = type(self.instance)
+        if self.instance.pk and not modelo.todos.filter(pk=self.instance.pk,
+                                                        version=datos.get('version_original')).exists():
+            raise forms.ValidationError("El registro cambió mientras lo editaba (p. ej. por una venta). "
+                                        "Vuelva a abrirlo para ver los datos actuales.")
+        return datos
+
+
+class AdminConVersion(AdminConFeedCambios):
+    """
+    Cliente y Producto: la edición guarda con concurrencia optimista
+    (concurrencia.guardar_con_version) solo los campos modificados en el
+    formulario, sobre la fila bloqueada. Así no pisa una venta ni otra
+    edición hecha mientras tanto, ni escribe campos que el formulario no
+    muestra (el stock). La versión y la baja lógica no se editan a mano.
+
+    Borrar desde el admin es una baja lógica (archivo.eliminar_logico), como
+    en las vistas: los pedidos y el kardex siguen referenciando la fila. El
+    listado muestra también los dados de baja (filtro "eliminado"); el
+    autocompletado de otros formularios, no.
+    """
+    form = FormularioConVersion
+    readonly_fields = ('version', 'eliminado', 'fecha_eliminacion')
+    list_filter = ('eliminado',)
+
+    def get_queryset(self, request):
+        qs = self.model.todos.get_queryset()
+        if request.resolver_match and request.resolver_match.url_name == 'autocomplete':
+            qs = qs.filter(eliminado=False)
+        ordering = self.get_ordering(request)
+        return qs.order_by(*ordering) if ordering else qs
+
+    def get_deleted_objects(self, objs, request):
+        # Solo se marcan las filas: la confirmación no lista (ni frena por PROTECT) pedidos ni kardex
+        objs = list(objs)
+        permisos = set() if self.has_delete_permission(request) else {self.opts.verbose_name}
+        return [str(obj) for obj in objs], {self.opts.verbose_name_plural: len(objs)}, permisos, []
+
+    def delete_model(self, request, obj):
+        archivo.eliminar_logico(self.model, obj.pk)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for pk in queryset.filter(eliminado=False).values_list('pk', flat=True):
+                archivo.eliminar_logico(self.model, pk)
+
+    def claves_facetas(self, obj):
+        """Filas de ConteoFaceta donde cuenta 'obj' (ninguna fuera de Producto)."""
+        return []
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if not change:
+                obj.save()
+                cambios.registrar(obj, 'alta')
+                facetas.registrar([], self.claves_facetas(obj))
+                return
+
+            actual = type(obj).todos.select_for_update().get(pk=obj.pk)
+            antes = self.claves_facetas(actual)
+            valores = {}
+            for nombre in form.changed_data:
+                campo = obj._meta.get_field(nombre) if nombre != 'version_original' else None
+                if campo is not None and campo.concrete:
+                    valores[campo.attname] = getattr(obj, campo.attname)
+            campos = guardar_con_version(actual, form.cleaned_data['version_original'], valores)
+            if campos:
+                cambios.registrar(actual, 'modificacion', campos + ['version'])
+                facetas.registrar(antes, self.claves_facetas(actual))
+            obj.version = actual.version
+
+
+# Mantenimiento de Categorías
+@admin.register(Categoria)
+class CategoriaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'descripcion')
+    search_fields = ('^nombre',)
+
+
+# Mantenimiento de Clientes
+@admin.register(Cliente)
+class ClienteAdmin(AdminConVersion, AdminListadoGrande):
+    list_display = ('dni', 'nombres', 'apellidos', 'distrito', 'correo', 'celular')
+    # '=' y '^' usan los índices (igualdad / "empieza con"), '%valor%' no podría
+    search_fields = ('=dni', '^apellidos', '^nombres', '=correo')
+
+
+# Mantenimiento de Productos
+class StockAlmacenInline(admin.TabularInline):
+    model = StockAlmacen
+    # El stock cambia solo por el kardex (ventas, ajustes): aquí es de consulta
+    fields = ('almacen', 'stock')
+    readonly_fields = fields
+    extra = 0
+    max_num = 0
+    can_delete = False
+
+
+@admin.register(Producto)
+class ProductoAdmin(AdminConVersion, AdminListadoGrande):
+    list_display = ('numero_serie', 'nombre', 'categoria', 'precio', 'stock')
+    list_select_related = ('categoria',)
+    list_filter = ('categoria', 'eliminado')
+    search_fields = ('=numero_serie', '^nombre')
+    autocomplete_fields = ('categoria',)
+    # El stock es el total de los almacenes (ver StockAlmacenInline)
+    readonly_fields = AdminConVersion.readonly_fields + ('stock',)
+    inlines = [StockAlmacenInline]
+
+    # Los conteos de facetas (gestion/facetas.py) siguen a los cambios hechos desde aquí
+    def claves_facetas(self, obj):
+        return facetas.de_producto(obj)
 
-# Mantenimiento de Productos 
-admin.site.register(Producto)
 
 # Mantenimiento de Personal (Implícito)
-admin.site.register(PersonalDelivery)
+@admin.register(PersonalDelivery)
+class PersonalDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('dni', 'nombres', 'apellidos', 'celular', 'capacidad', 'usuario')
+    search_fields = ('=dni', '^apellidos', '^nombres')
+    raw_id_fields = ('usuario',)
+
 
 # Formularios de Pedidos
-admin.site.register(Pedido)
-admin.site.register(DetallePedido)
\ No newline at end of file
+class DetallePedidoInline(admin.TabularInline):
+    model = DetallePedido
+    # Las líneas son el registro de la venta (y del kardex): solo lectura aquí
+    fields = ('producto', 'cantidad', 'precio_unitario', 'descuento')
+    readonly_fields = fields
+    extra = 0
+    max_num = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        # Todas las líneas con su producto en UNA consulta
+        return super().get_queryset(request).select_related('producto')
+
+
+@admin.register(Pedido)
+class PedidoAdmin(AdminConFeedCambios, AdminListadoGrande):
+    list_display = ('numero_pedido', 'fecha_pedido', 'cliente', 'personal_delivery', 'estado_pedido', 'fecha_entrega')
+    list_select_related = ('cliente', 'personal_delivery')
+    list_filter = ('estado_pedido',)
+    date_hierarchy = 'fecha_pedido'
+    search_fields = ('=numero_pedido', '=cliente__dni', '^cliente__apellidos')
+    autocomplete_fields = ('cliente', 'personal_delivery')
+    # El estado cambia con la entrega o con la acción de cancelar (devuelve el stock), no a mano
+    readonly_fields = ('estado_pedido',)
+    inlines = [DetallePedidoInline]
+    actions = ['cancelar_pedidos']
+
+    def get_readonly_fields(self, request, obj=None):
+        # Cambiar el cliente de un pedido ya grabado descuadra su resumen (ResumenCliente)
+        return self.readonly_fields + ('cliente',) if obj else self.readonly_fields
+
+    def has_delete_permission(self, request, obj=None):
+        return False  # Borrar no devuelve el stock: se usa la acción "cancelar_pedidos"
+
+    @admin.action(description="Cancelar los pedidos pendientes seleccionados (devuelve el stock)")
+    def cancelar_pedidos(self, request, queryset):
+        cancelados, rechazados = 0, []
+        for pedido in queryset.order_by('numero_pedido'):
+            try:
+                inventario.cancelar_pedido(pedido, f"Cancelado desde el admin por {request.user.get_username()}")
+                cancelados += 1
+            except ValueError:
+                rechazados.append(str(pedido.numero_pedido))
+        if cancelados:
+            self.message_user(request, f"{cancelados} pedido(s) cancelado(s); su stock volvió a los almacenes.",
+                              messages.SUCCESS)
+        if rechazados:
+            self.message_user(request, f"No estaban pendientes (no se cancelaron): {', '.join(rechazados)}.",
+                              messages.WARNING)
+
+
+@admin.register(DetallePedido)
+class DetallePedidoAdmin(AdminSoloLectura, AdminListadoGrande):
+    # Cambiar una línea descuadraría el pedido, el kardex y el stock: solo consulta
+    list_display = ('id', 'pedido', 'producto', 'cantidad', 'precio_unitario', 'descuento')
+    # __str__ de Pedido usa cliente.nombres: por eso 'pedido__cliente'
+    list_select_related = ('pedido__cliente', 'producto')
+    search_fields = ('=pedido__numero_pedido', '=producto__numero_serie')
+    raw_id_fields = ('pedido', 'producto')
+
+
+# Kardex (solo consulta: es de solo inserción y las fotos las arma el comando)
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(AdminSoloLectura, AdminListadoGrande):
+    list_display = ('id', 'fecha', 'producto', 'tipo', 'cantidad', 'pedido_id', 'observaciones')
+    list_select_related = ('producto',)
+    list_filter = ('tipo',)
+    date_hierarchy = 'fecha'
+    search_fields = ('=producto__numero_serie',)
+    raw_id_fields = ('producto',)
+
+
+@admin.register(SnapshotStock)
+class SnapshotStockAdmin(AdminSoloLectura, AdminListadoGrande):
+    list_display = ('producto', 'stock', 'ultimo_movimiento', 'fecha')
+    list_select_related = ('producto',)
+    search_fields = ('=producto__numero_serie',)
+    raw_id_fields = ('producto',)
+
+
+# Reglas del motor de precios (al guardar se recompila la tabla de precios)
+@admin.register(DescuentoCategoria)
+class DescuentoCategoriaAdmin(admin.ModelAdmin):
+    list_display = ('categoria', 'porcentaje', 'activo')
+    list_select_related = ('categoria',)
+    list_filter = ('activo',)
+    autocomplete_fields = ('categoria',)
+
+
+@admin.register(Promocion)
+class PromocionAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'producto', 'categoria', 'porcentaje', 'cantidad_minima',
+                    'fecha_inicio', 'fecha_fin', 'activo')
+    list_select_related = ('producto', 'categoria')
+    list_filter = ('activo',)
+    search_fields = ('^nombre',)
+    autocomplete_fields = ('producto', 'categoria')
+
+
+@admin.register(Almacen)
+class AlmacenAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'distrito', 'prioridad', 'activo')
+    list_editable = ('prioridad', 'activo')
+
+
+# Feed de cambios (solo consulta)
+@admin.register(EventoCambio)
+class EventoCambioAdmin(AdminSoloLectura, AdminListadoGrande):
+    # Los consumidores dependen de que el feed no cambie: ni altas, ni ediciones, ni huecos
+    list_display = ('id', 'fecha', 'entidad', 'clave', 'operacion')
+    list_filter = ('entidad', 'operacion')
+    search_fields = ('=clave',)
+
+
+# Entregas subidas por la app del repartidor (solo consulta: son la respuesta a los reintentos)
+@admin.register(EntregaSincronizada)
+class EntregaSincronizadaAdmin(AdminSoloLectura, AdminListadoGrande):
+    list_display = ('fecha_registro', 'repartidor', 'pedido_id', 'fecha_entrega', 'resultado', 'motivo')
+    list_filter = ('resultado', 'motivo')
+    search_fields = ('=pedido__numero_pedido', '=repartidor__dni')
+    list_select_related = ('repartidor',)
@@ -0,0 +1,313 @@
+"""
+Analítica de ventas sobre Pedido/DetallePedido (y el archivo histórico).
+
+Las líneas de pedido se leen por bloques (paginación por id, 'values_list')
+y cada bloque se pasa a arreglos de NumPy, columna por columna. Todas las
+agregaciones son vectorizadas (bincount, unique, cumsum...) y la memoria
+queda acotada: por bloque, más los acumuladores por producto, cliente, etc.
+
+Los importes viajan en céntimos enteros (calculados en la BD) para que las
+sumas sean exactas; se vuelven Decimal solo en el resultado.
+
+Calcula:
+  - ingresos por mes, por categoría, por distrito y por repartidor;
+  - clasificación ABC de productos (A: 80% de los ingresos, B: 15%, C: 5%);
+  - retención por cohorte de clientes (mes de la primera compra).
+
+NumPy es opcional para el resto de la aplicación: si no está instalado,
+solo este módulo deja de funcionar (AnaliticaNoDisponible).
+"""
+from decimal import Decimal
+
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Cast, Coalesce, ExtractMonth, ExtractYear, Round
+
+from .models import Categoria, PersonalDelivery, Producto, DetallePedido, DetallePedidoArchivado
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+TAMANO_BLOQUE = 50000
+UMBRALES_ABC = (0.80, 0.95)  # Participación acumulada hasta donde llega cada clase
+MESES_RETENCION = 12         # Columnas de la tabla de cohortes que se muestran
+SIN_DATO = '(sin dato)'
+
+
+class AnaliticaNoDisponible(RuntimeError):
+    """Falta NumPy en el servidor."""
+
+
+def _requiere_numpy():
+    if np is None:
+        raise AnaliticaNoDisponible("La analítica de ventas necesita NumPy (pip install numpy).")
+
+
+def _etiqueta_mes(periodo):
+    anio, mes = divmod(int(periodo), 12)
+    return f"{anio:04d}-{mes + 1:02d}"
+
+
+def _soles(centimos):
+    return Decimal(int(centimos)).scaleb(-2)  # 4550 -> Decimal('45.50')
+
+
+class Codificador:
+    """Asigna un entero estable (0, 1, 2...) a cada valor distinto de una columna."""
+
+    def __init__(self):
+        self.indice = {}
+        self.valores = []
+
+    def __len__(self):
+        return len(self.valores)
+
+    def codificar(self, columna):
+        indice = self.indice
+        try:
+            return np.fromiter(map(indice.__getitem__, columna), dtype=np.int64, count=len(columna))
+        except KeyError:
+            # Hay valores nuevos: se registran (pocos por bloque) y se reintenta
+            for valor in set(columna):
+                if valor not in indice:
+                    indice[valor] = len(self.valores)
+                    self.valores.append(valor)
+            return np.fromiter(map(indice.__getitem__, columna), dtype=np.int64, count=len(columna))
+
+
+class Acumulador:
+    """Suma de pesos por código, creciendo a medida que aparecen códigos nuevos."""
+
+    def __init__(self, columnas=1):
+        self.datos = np.zeros((0, columnas), dtype=np.int64)
+
+    def sumar(self, codigos, *pesos):
+        n = int(codigos.max()) + 1 if len(codigos) else 0
+        if n > len(self.datos):
+            self.datos = np.vstack([self.datos, np.zeros((n - len(self.datos), self.datos.shape[1]), np.int64)])
+        for j, peso in enumerate(pesos):
+            # bincount con pesos devuelve float64: exacto mientras las sumas no pasen de 2**53
+            self.datos[:n, j] += np.rint(np.bincount(codigos, weights=peso, minlength=n)).astype(np.int64)
+
+
+class Analizador:
+    """
+    Acumula bloques de líneas y arma el reporte.
+    No toca la BD: cada bloque es un dict de columnas, así también se puede
+    usar (y medir) con datos sintéticos. Columnas de un bloque:
+        periodo (año*12 + mes-1), cliente, distrito, repartidor, producto,
+        categoria (id, -1 sin categoría), cantidad, importe (céntimos)
+    """
+
+    def __init__(self):
+        _requiere_numpy()
+        self.lineas = 0
+        self.clientes = Codificador()
+        self.distritos = Codificador()
+        self.repartidores = Codificador()
+        self.productos = Codificador()
+        self.por_periodo = {}                 # periodo -> [unidades, céntimos]
+        self.por_categoria = {}               # categoria_id -> [unidades, céntimos]
+        self.por_distrito = Acumulador(2)
+        self.por_repartidor = Acumulador(2)
+        self.por_producto = Acumulador(2)
+        # Matriz cliente x mes: True si el cliente compró ese mes (1 byte por celda)
+        self._activos = np.zeros((0, 0), dtype=bool)
+        self._periodo_base = None
+
+    @staticmethod
+    def _sumar_enteros(destino, claves, unidades, importes):
+        """Agrupa por una columna entera de pocos valores (mes, categoría)."""
+        valores, inversa = np.unique(claves, return_inverse=True)
+        u = np.bincount(inversa, weights=unidades)
+        i = np.bincount(inversa, weights=importes)
+        for clave, uu, ii in zip(valores.tolist(), u.tolist(), i.tolist()):
+            acumulado = destino.setdefault(clave, [0, 0])
+            acumulado[0] += int(round(uu))
+            acumulado[1] += int(round(ii))
+
+    def agregar_bloque(self, bloque):
+        n = len(bloque['importe'])
+        if not n:
+            return
+        self.lineas += n
+        periodo = np.asarray(bloque['periodo'], dtype=np.int64)
+        categoria = np.asarray(bloque['categoria'], dtype=np.int64)
+        cantidad = np.asarray(bloque['cantidad'], dtype=np.int64)
+        importe = np.asarray(bloque['importe'], dtype=np.int64)
+
+        clientes = self.clientes.codificar(bloque['cliente'])
+        self.por_distrito.sumar(self.distritos.codificar(bloque['distrito']), cantidad, importe)
+        self.por_repartidor.sumar(self.repartidores.codificar(bloque['repartidor']), cantidad, importe)
+        self.por_producto.sumar(self.productos.codificar(bloque['producto']), cantidad, importe)
+        self._sumar_enteros(self.por_periodo, periodo, cantidad, importe)
+        self._sumar_enteros(self.por_categoria, categoria, cantidad, importe)
+
+        self._marcar_actividad(clientes, periodo)
+
+    def _marcar_actividad(self, clientes, periodo):
+        minimo, maximo = int(periodo.min()), int(periodo.max())
+        filas, columnas = self._activos.shape
+        if self._periodo_base is None:
+            base, fin = minimo, maximo + 1
+        else:
+            base = min(self._periodo_base, minimo)
+            fin = max(maximo + 1, self._periodo_base + columnas)
+        n_clientes = len(self.clientes)
+        if n_clientes > filas or base != self._periodo_base or fin - base > columnas:
+            # Crecer por duplicación (filas) para no copiar la matriz en cada bloque
+            nuevas_filas = max(n_clientes, 2 * filas) if n_clientes > filas else filas
+            ampliada = np.zeros((nuevas_filas, fin - base), dtype=bool)
+            if filas and columnas:
+                desde = self._periodo_base - base
+                ampliada[:filas, desde:desde + columnas] = self._activos
+            self._activos = ampliada
+            self._periodo_base = base
+        self._activos[clientes, periodo - self._periodo_base] = True
+
+    # --- Resultados ---
+
+    def _filas(self, etiquetas, unidades, importes):
+        total = int(importes.sum()) or 1
+        orden = np.argsort(-importes, kind='stable')
+        return [
+            {'nombre': etiquetas[k], 'unidades': int(unidades[k]), 'ingresos': _soles(importes[k]),
+             'participacion': round(float(importes[k]) * 100 / total, 2)}
+            for k in orden.tolist()
+        ]
+
+    def _agrupar_etiquetas(self, codificador, acumulador, normalizar):
+        """Junta códigos cuyo valor normalizado coincide (p. ej. 'Lince ' y 'LINCE')."""
+        etiquetas = [normalizar(v) for v in codificador.valores]
+        nombres, grupo = np.unique(np.array(etiquetas, dtype=object), return_inverse=True)
+        datos = acumulador.datos[:len(etiquetas)]
+        unidades = np.bincount(grupo, weights=datos[:, 0], minlength=len(nombres)).astype(np.int64)
+        importes = np.bincount(grupo, weights=datos[:, 1], minlength=len(nombres)).astype(np.int64)
+        return self._filas(list(nombres), unidades, importes)
+
+    def clasificacion_abc(self):
+        """Devuelve (series, clase por producto 'A'/'B'/'C', ingresos en céntimos), de mayor a menor ingreso."""
+        importes = self.por_producto.datos[:, 1]
+        orden = np.argsort(-importes, kind='stable')
+        acumulado = np.cumsum(importes[orden]) / max(int(importes.sum()), 1)
+        # Un producto es A si el acumulado ANTES de él no llegó al 80% (el que cruza el umbral también es A)
+        previo = acumulado - importes[orden] / max(int(importes.sum()), 1)
+        clases = np.array(['A', 'B', 'C'])[np.searchsorted(UMBRALES_ABC, previo, side='right')]
+        return [self.productos.valores[k] for k in orden.tolist()], clases, importes[orden]
+
+    def retencion_cohortes(self):
+        """
+        Por cohorte (mes de la primera compra): clientes y % que volvió a
+        comprar 0, 1, 2... meses después.
+        """
+        activos = self._activos[:len(self.clientes)]
+        con_compras = activos.any(axis=1)
+        if not con_compras.any():
+            return []
+        primera = np.where(con_compras, activos.argmax(axis=1), -1)
+
+        filas = []
+        # Un paso vectorizado por cohorte (hay tantas como meses, no como clientes)
+        for cohorte in np.unique(primera[primera >= 0]).tolist():
+            conteo = activos[primera == cohorte, cohorte:].sum(axis=0)
+            filas.append({
+                'cohorte': _etiqueta_mes(self._periodo_base + cohorte),
+                'clientes': int(conteo[0]),
+                'retencion': [round(float(x) * 100 / conteo[0], 1) for x in conteo.tolist()],
+            })
+        return filas
+
+    def resultado(self, nombres_categoria=None, nombres_repartidor=None):
+        nombres_categoria = nombres_categoria or {}
+        nombres_repartidor = nombres_repartidor or {}
+        series, clases, importes_abc = self.clasificacion_abc()
+        total = int(self.por_producto.datos[:, 1].sum())
+
+        periodos = sorted(self.por_periodo)
+        categorias = list(self.por_categoria)
+        return {
+            'lineas': self.lineas,
+            'ingresos_total': _soles(total),
+            'por_periodo': [
+                {'nombre': _etiqueta_mes(p), 'unidades': self.por_periodo[p][0],
+                 'ingresos': _soles(self.por_periodo[p][1])}
+                for p in periodos
+            ],
+            'por_categoria': self._filas(
+                [nombres_categoria.get(c, SIN_DATO) for c in categorias],
+                np.array([self.por_categoria[c][0] for c in categorias], dtype=np.int64),
+                np.array([self.por_categoria[c][1] for c in categorias], dtype=np.int64),
+            ),
+            'por_distrito': self._agrupar_etiquetas(
+                self.distritos, self.por_distrito, lambda d: (d or '').strip().upper() or SIN_DATO),
+            'por_repartidor': self._agrupar_etiquetas(
+                self.repartidores, self.por_repartidor, lambda dni: nombres_repartidor.get(dni, dni or SIN_DATO)),
+            'abc': {
+                clase: {'productos': int((clases == clase).sum()),
+                        'ingresos': _soles(importes_abc[clases == clase].sum())}
+                for clase in 'ABC'
+            },
+            'productos_abc': [
+                {'serie': serie, 'clase': str(clase), 'ingresos': _soles(importe)}
+                for serie, clase, importe in zip(series, clases.tolist(), importes_abc.tolist())
+            ],
+            'cohortes': self.retencion_cohortes(),
+        }
+
+
+COLUMNAS = ('id', 'periodo', 'cliente', 'distrito', 'repartidor', 'producto', 'categoria', 'cantidad', 'importe')
+
+
+def _consulta(modelo, desde=None, hasta=None):
+    lineas = modelo.objects.exclude(pedido__estado_pedido='Cancelado')
+    if desde:
+        lineas = lineas.filter(pedido__fecha_pedido__date__gte=desde)
+    if hasta:
+        lineas = lineas.filter(pedido__fecha_pedido__date__lte=hasta)
+    return lineas.annotate(
+        periodo_mes=ExtractYear('pedido__fecha_pedido') * 12 + ExtractMonth('pedido__fecha_pedido') - 1,
+        categoria_cod=Coalesce('producto__categoria_id', Value(-1)),
+        importe_cent=Cast(Round((F('precio_unitario') * F('cantidad') - F('descuento')) * 100), IntegerField()),
+    ).values_list(
+        'id', 'periodo_mes', 'pedido__cliente_id', 'pedido__cliente__distrito',
+        'pedido__personal_delivery_id', 'producto_id', 'categoria_cod', 'cantidad', 'importe_cent',
+    ).order_by('id')
+
+
+def bloques_de_lineas(desde=None, hasta=None, incluir_archivo=True, tamano=TAMANO_BLOQUE):
+    """
+    Genera las líneas de pedido (no canceladas) en bloques columnares:
+    dicts {columna: tupla}. Pagina por id (WHERE id > último ... LIMIT n),
+    así ningún bloque obliga a la BD a recorrer las filas ya leídas.
+    """
+    modelos = [DetallePedido] + ([DetallePedidoArchivado] if incluir_archivo else [])
+    for modelo in modelos:
+        consulta = _consulta(modelo, desde, hasta)
+        ultimo = None
+        while True:
+            pagina = consulta if ultimo is None else consulta.filter(id__gt=ultimo)
+            filas = list(pagina[:tamano])
+            if not filas:
+                break
+            ultimo = filas[-1][0]
+            yield dict(zip(COLUMNAS, zip(*filas)))
+
+
+def reporte_ventas(desde=None, hasta=None, incluir_archivo=True, tamano=TAMANO_BLOQUE):
+    """Reporte completo (ver Analizador.resultado) sobre la BD."""
+    analizador = Analizador()
+    for bloque in bloques_de_lineas(desde, hasta, incluir_archivo, tamano):
+        analizador.agregar_bloque(bloque)
+    return analizador.resultado(
+        nombres_categoria=dict(Categoria.objects.values_list('id', 'nombre')),
+        nombres_repartidor={
+            dni: f"{nombres} {apellidos}"
+            for dni, nombres, apellidos in PersonalDelivery.objects.values_list('dni', 'nombres', 'apellidos')
+        },
+    )
+
+
+def nombres_productos(series):
+    """Nombre de los productos indicados (para mostrar el top del ABC)."""
+    return dict(Producto.todos.filter(numero_serie__in=series).values_list('numero_serie', 'nombre'))
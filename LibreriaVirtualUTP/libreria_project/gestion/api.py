@@ -0,0 +1,258 @@
+"""
+API JSON para integraciones (e-commerce, partners).
+
+Autenticación: sesión de Django (POST /login/ antes de llamar a la API).
+Las llamadas deben enviar 'Content-Type: application/json'; un navegador no
+puede mandar ese tipo a otro sitio sin preflight CORS, por eso estas vistas
+no usan el token CSRF de los formularios.
+"""
+import json
+import zlib
+from functools import wraps
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import pedidos, precios, limitador, cambios, reparto, disponibilidad
+from .models import PersonalDelivery
+
+# Límite del cuerpo ya descomprimido (protege contra "gzip bombs")
+MAX_CUERPO_DESCOMPRIMIDO = 20 * 1024 * 1024
+MAX_PEDIDOS_POR_LLAMADA = 5000
+
+
+class CuerpoInvalido(ValueError):
+    pass
+
+
+def api_login_required(vista):
+    """Como @login_required, pero responde 401 en JSON en lugar de redirigir al login."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Autenticación requerida.'}, status=401)
+        return vista(request, *args, **kwargs)
+    return envoltura
+
+
+def leer_json(request):
+    """Lee el cuerpo JSON de la petición, descomprimiéndolo si viene en gzip."""
+    if request.content_type != 'application/json':
+        raise CuerpoInvalido("Content-Type debe ser application/json.")
+
+    cuerpo = request.body
+    codificacion = request.headers.get('Content-Encoding', '').strip().lower()
+    if codificacion == 'gzip':
+        descompresor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            cuerpo = descompresor.decompress(cuerpo, MAX_CUERPO_DESCOMPRIMIDO)
+        except zlib.error:
+            raise CuerpoInvalido("El cuerpo gzip está dañado.")
+        if descompresor.unconsumed_tail:
+            raise CuerpoInvalido("El cuerpo descomprimido es demasiado grande.")
+    elif codificacion not in ('', 'identity'):
+        raise CuerpoInvalido(f"Content-Encoding no soportado: {codificacion}.")
+
+    try:
+        return json.loads(cuerpo)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise CuerpoInvalido("El cuerpo no es JSON válido.")
+
+
+def _montos(datos, campos):
+    # Los montos van como texto para no perder precisión (Decimal)
+    return {**datos, **{campo: f"{datos[campo]:.2f}" for campo in campos}}
+
+
+def _json_resultado(resultado):
+    if not resultado['ok']:
+        return resultado
+    return _montos(resultado, ('descuento', 'subtotal', 'igv', 'total'))
+
+
+@csrf_exempt
+@require_POST
+@api_login_required
+def api_pedidos_view(request):
+    """
+    POST /api/pedidos/
+    Crea varios pedidos en una llamada:
+        {"pedidos": [{"cliente_dni": "...", "personal_dni": "..." (opcional),
+                      "fecha_entrega": "AAAA-MM-DD", "observaciones": "...",
+                      "productos": [{"serie": "...", "cantidad": 2}, ...]}, ...]}
+    Responde un resultado por pedido, en el mismo orden.
+    Acepta el cuerpo comprimido con 'Content-Encoding: gzip'.
+    """
+    try:
+        datos = leer_json(request)
+    except CuerpoInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    solicitudes = datos.get('pedidos') if isinstance(datos, dict) else None
+    if not isinstance(solicitudes, list) or not solicitudes:
+        return JsonResponse({'error': "Se espera {'pedidos': [...]} con al menos un pedido."}, status=400)
+    if len(solicitudes) > MAX_PEDIDOS_POR_LLAMADA:
+        return JsonResponse({'error': f"Máximo {MAX_PEDIDOS_POR_LLAMADA} pedidos por llamada."}, status=400)
+
+    resultados = pedidos.crear_pedidos(solicitudes)
+    creados = sum(1 for r in resultados if r['ok'])
+    return JsonResponse({
+        'creados': creados,
+        'rechazados': len(resultados) - creados,
+        'resultados': [_json_resultado(r) for r in resultados],
+    }, status=201 if creados else 400)
+
+
+@csrf_exempt
+@require_POST
+@api_login_required
+def api_cotizar_view(request):
+    """
+    POST /api/cotizar/
+    Cotiza un carrito completo en una llamada (no reserva stock):
+        {"productos": [{"serie": "...", "cantidad": 2}, ...]}
+    Responde el precio, descuento e importe de cada línea y los totales con IGV.
+    La usa el formulario de registro de pedidos para mostrar los totales.
+    """
+    try:
+        datos = leer_json(request)
+    except CuerpoInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        productos = pedidos.leer_productos(datos.get('productos') if isinstance(datos, dict) else None)
+        cotizacion = precios.cotizar_carrito(productos)
+    except (pedidos.SolicitudInvalida, precios.ProductoNoEncontrado) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        **_montos(cotizacion, ('descuento', 'subtotal', 'igv', 'total')),
+        'tasa_igv': str(cotizacion['tasa_igv']),
+        'lineas': [_montos(linea, ('precio_unitario', 'descuento', 'importe')) for linea in cotizacion['lineas']],
+    })
+
+
+@require_GET
+@api_login_required
+def api_stock_view(request):
+    """
+    GET /api/stock/?serie=<serie>&serie=<serie>...
+    Stock disponible de varios productos en una llamada, desde el cache que
+    se refresca con cada cambio de stock (gestion/disponibilidad.py):
+        {"stock": {"<serie>": 12, "<serie dada de baja>": null}}
+    Es orientativo: el stock se valida de nuevo al grabar el pedido.
+    El formulario de registro de pedidos la consulta antes de enviar.
+    """
+    series = [serie for serie in request.GET.getlist('serie') if serie]
+    if not series:
+        return JsonResponse({'error': "Indique al menos un 'serie'."}, status=400)
+    if len(series) > disponibilidad.MAX_SERIES:
+        return JsonResponse({'error': f"Máximo {disponibilidad.MAX_SERIES} series por consulta."}, status=400)
+    return JsonResponse({'stock': disponibilidad.consultar(series)})
+
+
+@require_GET
+@api_login_required
+def api_metricas_login_view(request):
+    """
+    GET /api/metricas/login/
+    Intentos de login bloqueados por el limitador (solo personal 'staff').
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Permiso denegado.'}, status=403)
+    return JsonResponse(limitador.metricas())
+
+
+@require_GET
+@api_login_required
+def api_cambios_view(request):
+    """
+    GET /api/cambios/?desde=<seq>&limite=1000&entidad=Pedido&entidad=Cliente
+    Feed de cambios de Pedido, Producto y Cliente desde el cursor 'desde'
+    (el 'seq' del último evento ya procesado; 0 la primera vez). Se vuelve a
+    llamar con 'siguiente' mientras 'hay_mas' sea true. Solo personal 'staff'.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Permiso denegado.'}, status=403)
+    try:
+        desde = int(request.GET.get('desde', 0))
+        limite = int(request.GET.get('limite', 1000))
+    except ValueError:
+        return JsonResponse({'error': "'desde' y 'limite' deben ser enteros."}, status=400)
+
+    eventos, siguiente = cambios.leer(desde, limite, request.GET.getlist('entidad'))
+    return JsonResponse({
+        'cambios': [cambios.como_dict(e) for e in eventos],
+        'siguiente': siguiente,
+        'hay_mas': len(eventos) == max(1, min(limite, cambios.LIMITE_MAXIMO)),
+    })
+
+
+def _repartidor(request):
+    """
+    (dni, None) con el repartidor de la sesión, o (None, respuesta de error).
+    El personal 'staff' puede indicar ?repartidor=<dni> (debe existir).
+    """
+    if request.user.is_staff and request.GET.get('repartidor'):
+        dni = request.GET['repartidor']
+        if not PersonalDelivery.objects.filter(dni=dni).exists():
+            return None, JsonResponse({'error': f"No existe el repartidor {dni}."}, status=404)
+        return dni, None
+    try:
+        return request.user.repartidor.dni, None
+    except PersonalDelivery.DoesNotExist:
+        return None, JsonResponse({'error': 'El usuario no es un repartidor.'}, status=403)
+
+
+@require_GET
+@api_login_required
+def api_repartidor_pedidos_view(request):
+    """
+    GET /api/repartidor/pedidos/?token=<token de la sincronización anterior>
+    Pedidos pendientes del repartidor: la lista completa la primera vez y,
+    con token, solo los cambios. Ver gestion/reparto.py.
+    """
+    dni, error = _repartidor(request)
+    if error is not None:
+        return error
+    token = request.GET.get('token')
+    try:
+        token = int(token) if token not in (None, '') else None
+    except ValueError:
+        return JsonResponse({'error': "'token' inválido."}, status=400)
+    return JsonResponse(reparto.pedidos_pendientes(dni, token))
+
+
+@csrf_exempt
+@require_POST
+@api_login_required
+def api_repartidor_entregas_view(request):
+    """
+    POST /api/repartidor/entregas/
+    Sube las entregas registradas sin conexión:
+        {"entregas": [{"id": "<uuid>", "numero_pedido": 12, "fecha_entrega": "AAAA-MM-DD",
+                       "observaciones": "..."}, ...]}
+    Responde un resultado por entrega ('aplicada', 'conflicto' con su motivo
+    o 'invalida'), en el mismo orden. Reintentar el mismo lote es seguro.
+    """
+    dni, error = _repartidor(request)
+    if error is not None:
+        return error
+    try:
+        datos = leer_json(request)
+    except CuerpoInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    entregas = datos.get('entregas') if isinstance(datos, dict) else None
+    if not isinstance(entregas, list) or not entregas:
+        return JsonResponse({'error': "Se espera {'entregas': [...]} con al menos una entrega."}, status=400)
+    if len(entregas) > reparto.MAX_ENTREGAS_POR_LOTE:
+        return JsonResponse({'error': f"Máximo {reparto.MAX_ENTREGAS_POR_LOTE} entregas por llamada."}, status=400)
+
+    resultados = reparto.aplicar_entregas(dni, entregas)
+    return JsonResponse({
+        'aplicadas': sum(1 for r in resultados if r['resultado'] == 'aplicada'),
+        'conflictos': sum(1 for r in resultados if r['resultado'] == 'conflicto'),
+        'resultados': resultados,
+    })
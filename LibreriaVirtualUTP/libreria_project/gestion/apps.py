@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GestionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestion'
+
+    def ready(self):
+        # Registra las señales que invalidan la tabla de precios y las que mueven los conteos de facetas
+        from . import facetas, precios  # noqa: F401
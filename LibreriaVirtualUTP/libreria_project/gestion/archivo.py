@@ -0,0 +1,112 @@
+"""
+Archivo histórico de pedidos y borrado lógico.
+
+Los pedidos entregados o cancelados más antiguos que un corte se mueven
+(en lotes acotados, cada uno en su transacción) a PedidoArchivado y
+DetallePedidoArchivado. Así las consultas de uso diario trabajan sobre
+tablas chicas, y las búsquedas pueden incluir el archivo si se les pide.
+"""
+import heapq
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Pedido, DetallePedido, PedidoArchivado, DetallePedidoArchivado, Producto
+from . import cambios, disponibilidad, facetas
+
+ESTADOS_ARCHIVABLES = ('Entregado', 'Cancelado')
+LIMITE_RESULTADOS = 500  # Pedidos por búsqueda (vigentes y archivados juntos)
+
+CAMPOS_PEDIDO = ('numero_pedido', 'fecha_pedido', 'fecha_entrega', 'observaciones',
+                 'estado_pedido', 'cliente_id', 'personal_delivery_id')
+CAMPOS_DETALLE = ('id', 'pedido_id', 'producto_id', 'cantidad', 'precio_unitario', 'descuento')
+
+
+def archivar_lote(antes_de, lote=500):
+    """
+    Mueve al archivo hasta 'lote' pedidos cerrados con fecha_pedido < antes_de.
+    Devuelve cuántos pedidos se archivaron (0 = no queda nada por archivar).
+    """
+    with transaction.atomic():
+        # Bloqueamos el lote y volvemos a verificar el estado dentro de la transacción
+        pedidos = list(
+            Pedido.objects
+            .select_for_update()
+            .filter(estado_pedido__in=ESTADOS_ARCHIVABLES, fecha_pedido__lt=antes_de)
+            .order_by('numero_pedido')
+            .values(*CAMPOS_PEDIDO)[:lote]
+        )
+        if not pedidos:
+            return 0
+        numeros = [p['numero_pedido'] for p in pedidos]
+        detalles = DetallePedido.objects.filter(pedido_id__in=numeros).values(*CAMPOS_DETALLE)
+
+        PedidoArchivado.objects.bulk_create([PedidoArchivado(**p) for p in pedidos])
+        DetallePedidoArchivado.objects.bulk_create([DetallePedidoArchivado(**d) for d in detalles])
+
+        DetallePedido.objects.filter(pedido_id__in=numeros).delete()
+        Pedido.objects.filter(numero_pedido__in=numeros).delete()
+    return len(pedidos)
+
+
+def archivar_pedidos(antes_de, lote=500):
+    """Archiva por lotes hasta que no quede nada; devuelve el total archivado."""
+    total = 0
+    while True:
+        archivados = archivar_lote(antes_de, lote=lote)
+        if not archivados:
+            return total
+        total += archivados
+
+
+def eliminar_logico(modelo, pk):
+    """
+    Da de baja un Cliente o Producto sin borrar la fila (los pedidos y el
+    kardex lo siguen referenciando). Devuelve False si no existía.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        # El producto deja de contar en las facetas: se leen (y bloquean) sus datos antes de la baja
+        producto = Producto.objects.select_for_update().filter(pk=pk).first() if modelo is Producto else None
+        filas = modelo.objects.filter(pk=pk).update(
+            eliminado=True, fecha_eliminacion=ahora, version=F('version') + 1,
+        )
+        if filas:
+            cambios.registrar_lote([cambios.evento(modelo.__name__, pk, 'baja',
+                                                   {'eliminado': True, 'fecha_eliminacion': ahora})])
+            facetas.registrar(facetas.de_producto(producto), [])
+            if modelo is Producto:
+                transaction.on_commit(lambda: disponibilidad.olvidar([pk]))
+    return filas > 0
+
+
+def pedidos_con_archivo(filtros, orden='-fecha_pedido', incluir_archivo=False, limite=LIMITE_RESULTADOS):
+    """
+    Aplica los mismos filtros (Q o dict) a los pedidos vigentes y, si se pide,
+    a los archivados; devuelve los primeros 'limite' según 'orden'.
+
+    Con el archivo, cada tabla se ordena y se corta en la BD (a lo sumo
+    'limite' filas de cada una) y las dos listas ya ordenadas se intercalan;
+    nunca se carga el archivo completo para ordenarlo en Python.
+    """
+    campo = orden.lstrip('-')
+    descendente = orden.startswith('-')
+    # Los NULL al final en los dos motores, y el número de pedido como desempate: el
+    # mismo orden en la BD y en la mezcla de abajo
+    if descendente:
+        orden_bd = (F(campo).desc(nulls_last=True), F('numero_pedido').desc())
+    else:
+        orden_bd = (F(campo).asc(nulls_first=True), F('numero_pedido').asc())
+
+    def consulta(modelo):
+        return modelo.objects.filter(filtros).select_related('cliente', 'personal_delivery').order_by(*orden_bd)
+
+    vigentes = consulta(Pedido)[:limite]
+    if not incluir_archivo:
+        return vigentes
+
+    archivados = consulta(PedidoArchivado)[:limite]
+    clave = lambda p: (getattr(p, campo) is not None, getattr(p, campo), p.numero_pedido)
+    return list(islice(heapq.merge(vigentes, archivados, key=clave, reverse=descendente), limite))
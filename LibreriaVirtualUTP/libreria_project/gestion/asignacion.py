@@ -0,0 +1,238 @@
+"""
+Motor de asignación de pedidos a repartidores (Personal Delivery).
+
+Agrupa los pedidos pendientes por distrito del cliente y los reparte entre
+los repartidores según su carga pendiente y su capacidad. Para no consultar
+la BD en cada decisión se mantiene un índice en memoria de la carga, que se
+actualiza cuando se crean, entregan o cancelan pedidos.
+"""
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import PersonalDelivery, Pedido
+from . import cambios
+
+# Cada cuánto se recarga el índice desde la BD (corrige la deriva entre
+# procesos: cada worker tiene su propio índice en memoria)
+SEGUNDOS_RECARGA = 300
+
+
+def _clave_distrito(distrito):
+    return (distrito or '').strip().upper()
+
+
+class IndiceCarga:
+    """
+    Carga pendiente por repartidor, en memoria.
+    No toca la BD: se alimenta con 'cargar' y con los eventos de pedidos,
+    así también se puede usar (y medir) con datos sintéticos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.capacidad = {}                   # dni -> capacidad
+        self.pendientes = Counter()           # dni -> pedidos pendientes
+        self.por_distrito = defaultdict(Counter)  # distrito -> {dni: pedidos pendientes allí}
+        self.cargado_en = None
+
+    def cargar(self, repartidores, pendientes):
+        """
+        repartidores: iterable de (dni, capacidad)
+        pendientes: iterable de (dni, distrito, cantidad)
+        """
+        with self._lock:
+            self.capacidad = dict(repartidores)
+            self.pendientes = Counter()
+            self.por_distrito = defaultdict(Counter)
+            for dni, distrito, cantidad in pendientes:
+                if dni in self.capacidad:
+                    self.pendientes[dni] += cantidad
+                    self.por_distrito[_clave_distrito(distrito)][dni] += cantidad
+            self.cargado_en = time.monotonic()
+
+    def pedido_creado(self, dni, distrito):
+        with self._lock:
+            self.pendientes[dni] += 1
+            self.por_distrito[_clave_distrito(distrito)][dni] += 1
+
+    def pedido_cerrado(self, dni, distrito):
+        """Pedido entregado o cancelado: libera la carga del repartidor."""
+        with self._lock:
+            if self.pendientes[dni] > 0:
+                self.pendientes[dni] -= 1
+            zona = self.por_distrito[_clave_distrito(distrito)]
+            if zona[dni] > 0:
+                zona[dni] -= 1
+
+    def planificar(self, grupos, aplicar=False):
+        """
+        grupos: dict distrito -> lista de pedidos (ids) sin repartidor.
+        Devuelve dict pedido -> dni. Los pedidos que no entran en la
+        capacidad disponible quedan sin asignar. Con aplicar=True la carga
+        planificada se suma al índice en el acto.
+
+        Primero se llenan los repartidores que ya tienen pedidos en el mismo
+        distrito (arma rutas), y el resto va al repartidor con más espacio
+        libre (heap), en lotes por distrito.
+        """
+        asignacion = {}
+        with self._lock:
+            libres = {dni: cap - self.pendientes[dni] for dni, cap in self.capacidad.items()}
+            heap = [(-libre, dni) for dni, libre in libres.items() if libre > 0]
+            heapq.heapify(heap)
+
+            def asignar(dni, distrito, restantes):
+                n = min(libres[dni], len(restantes))
+                for pedido in restantes[-n:]:
+                    asignacion[pedido] = dni
+                del restantes[-n:]
+                libres[dni] -= n
+                if aplicar:
+                    self.pendientes[dni] += n
+                    self.por_distrito[distrito][dni] += n
+
+            # Los distritos con más pedidos primero: son los que arman rutas más largas
+            for distrito, pedidos in sorted(grupos.items(), key=lambda kv: -len(kv[1])):
+                distrito = _clave_distrito(distrito)
+                restantes = list(pedidos)
+
+                # 1. Afinidad: repartidores que ya van a ese distrito
+                zona = self.por_distrito.get(distrito)
+                if zona:
+                    for dni in sorted(zona, key=lambda d: -libres.get(d, 0)):
+                        if not restantes:
+                            break
+                        if zona[dni] > 0 and libres.get(dni, 0) > 0:
+                            asignar(dni, distrito, restantes)
+
+                # 2. El repartidor con más espacio libre
+                while restantes and heap:
+                    negativo, dni = heapq.heappop(heap)
+                    if -negativo != libres[dni]:
+                        # Entrada desactualizada (ya se le asignó algo): reinsertar con su valor real
+                        if libres[dni] > 0:
+                            heapq.heappush(heap, (-libres[dni], dni))
+                        continue
+                    asignar(dni, distrito, restantes)
+                    if libres[dni] > 0:
+                        heapq.heappush(heap, (-libres[dni], dni))
+
+        return asignacion
+
+    def elegir(self, distrito):
+        """Repartidor para UN pedido nuevo del distrito (o None si todos están llenos)."""
+        return self.planificar({distrito: [None]}).get(None)
+
+
+# Índice compartido por el proceso
+indice = IndiceCarga()
+_lock_carga = threading.Lock()
+
+
+def obtener_indice():
+    """Devuelve el índice del proceso, cargándolo desde la BD si hace falta."""
+    if indice.cargado_en is None or time.monotonic() - indice.cargado_en > SEGUNDOS_RECARGA:
+        with _lock_carga:
+            if indice.cargado_en is None or time.monotonic() - indice.cargado_en > SEGUNDOS_RECARGA:
+                repartidores = PersonalDelivery.objects.values_list('dni', 'capacidad')
+                pendientes = (
+                    Pedido.objects
+                    .filter(estado_pedido='Pendiente', personal_delivery__isnull=False)
+                    .values_list('personal_delivery_id', 'cliente__distrito')
+                    .annotate(total=Count('numero_pedido'))
+                    .order_by()
+                )
+                indice.cargar(list(repartidores), list(pendientes))
+    return indice
+
+
+def invalidar():
+    """Fuerza recargar el índice (p. ej. al cambiar el personal o su capacidad)."""
+    indice.cargado_en = None
+
+
+@contextmanager
+def reserva(grupos):
+    """
+    Plan {pedido: dni} para los grupos {distrito: [pedidos]} con la carga YA
+    sumada al índice: un lote simultáneo del mismo proceso ve esos lugares
+    ocupados y no pasa la capacidad del repartidor. La reserva debe envolver
+    la transacción que crea los pedidos (ver pedidos.crear_pedidos): si el
+    bloque termina con una excepción (rollback, o falla el commit) la carga
+    reservada se devuelve. Con commit no hay que llamar a
+    registrar_creado para estos pedidos. Si una transacción externa revierte
+    después, la reserva queda hasta la próxima recarga del índice.
+    """
+    indice = obtener_indice()
+    plan = indice.planificar(grupos, aplicar=True)
+    try:
+        yield plan
+    except BaseException:
+        for distrito, pedidos in grupos.items():
+            for pedido in pedidos:
+                if pedido in plan:
+                    indice.pedido_cerrado(plan[pedido], distrito)
+        raise
+
+
+def registrar_creado(dni, distrito):
+    """Avisar al índice (tras el commit) de un pedido nuevo con el repartidor ya indicado."""
+    transaction.on_commit(lambda: obtener_indice().pedido_creado(dni, distrito))
+
+
+def registrar_cerrado(dni, distrito):
+    """Avisar al índice (tras el commit) de un pedido entregado o cancelado."""
+    if dni:
+        transaction.on_commit(lambda: obtener_indice().pedido_cerrado(dni, distrito))
+
+
+def asignar_pendientes(chunk_size=2000):
+    """
+    Asigna repartidor a todos los pedidos pendientes que no tienen uno.
+    Devuelve (asignados, sin_asignar).
+    """
+    grupos = defaultdict(list)
+    filas = (
+        Pedido.objects
+        .filter(estado_pedido='Pendiente', personal_delivery__isnull=True)
+        .values_list('numero_pedido', 'cliente__distrito')
+    )
+    for numero, distrito in filas.iterator(chunk_size=chunk_size):
+        grupos[_clave_distrito(distrito)].append(numero)
+    total = sum(len(pedidos) for pedidos in grupos.values())
+
+    asignacion = obtener_indice().planificar(grupos)
+
+    # Un UPDATE por repartidor (no uno por pedido). Entre la lectura y el UPDATE
+    # otro proceso pudo asignar o cancelar alguno: se bloquean los que siguen
+    # sin repartidor y solo esos se actualizan (y llevan evento)
+    por_repartidor = defaultdict(list)
+    for numero, dni in asignacion.items():
+        por_repartidor[dni].append(numero)
+    asignados = []
+    with transaction.atomic():
+        for dni, numeros in por_repartidor.items():
+            for i in range(0, len(numeros), chunk_size):
+                libres = list(
+                    Pedido.objects.select_for_update()
+                    .filter(numero_pedido__in=numeros[i:i + chunk_size],
+                            estado_pedido='Pendiente', personal_delivery__isnull=True)
+                    .values_list('numero_pedido', flat=True)
+                )
+                if libres:
+                    Pedido.objects.filter(numero_pedido__in=libres).update(personal_delivery_id=dni)
+                    asignados += [(numero, dni) for numero in libres]
+        cambios.registrar_lote([
+            cambios.evento('Pedido', numero, 'modificacion', {'personal_delivery_id': dni})
+            for numero, dni in asignados
+        ])
+    # Hubo cambios masivos: más simple recargar que sumar uno por uno
+    invalidar()
+
+    return len(asignados), total - len(asignados)
@@ -0,0 +1,127 @@
+"""
+Feed de cambios (outbox) de Pedido, Producto y Cliente para el data
+warehouse y las herramientas de BI.
+
+Cada escritura deja una fila en EventoCambio dentro de la MISMA transacción:
+si la escritura se revierte, el evento también. Los consumidores leen por
+cursor (el id del evento) con GET /api/cambios/?desde=<último id> o con el
+comando 'exportar_cambios', y aplican cada evento como upsert (alta,
+modificación) o baja lógica. Así sincronizan en O(cambios) en lugar de
+volver a leer las tablas completas.
+
+Los ids se asignan al insertar, pero las transacciones pueden hacer commit
+en otro orden: un evento con id menor puede hacerse visible después de uno
+mayor. Por eso la lectura solo entrega eventos con más de MARGEN_LECTURA de
+antigüedad (la misma idea que los snapshots del kardex).
+
+El stock de un producto lo cambia el kardex: su transacción deja un evento
+'movimiento' por producto con la variación ({'delta', 'tipo'}), que se
+revierte con ella. El total recalculado (Producto.stock y su versión) llega
+después como 'modificacion', cuando se actualizan los totales tras el commit.
+
+Los pedidos que pasan al archivo histórico no generan eventos: para el
+warehouse siguen existiendo igual.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Producto, EventoCambio
+
+MARGEN_LECTURA = timedelta(seconds=10)
+LIMITE_MAXIMO = 5000
+
+
+def fila(instancia, campos=None):
+    """Valores de la instancia (las FK como <campo>_id); solo 'campos' si se indican."""
+    return {
+        campo.attname: getattr(instancia, campo.attname)
+        for campo in instancia._meta.concrete_fields
+        if campos is None or campo.attname in campos
+    }
+
+
+def evento(entidad, clave, operacion, datos):
+    """EventoCambio sin guardar (para juntarlos en un bulk_create)."""
+    return EventoCambio(entidad=entidad, clave=str(clave), operacion=operacion, datos=datos)
+
+
+def evento_de(instancia, operacion, campos=None, **extra):
+    datos = fila(instancia, campos)
+    datos.update(extra)
+    return evento(type(instancia).__name__, instancia.pk, operacion, datos)
+
+
+def registrar(instancia, operacion, campos=None, **extra):
+    """
+    Registra el cambio de una instancia. Debe llamarse dentro de la
+    transacción que hizo el cambio. Con 'campos' vacío no registra nada.
+    """
+    if campos is not None and not campos:
+        return None
+    nuevo = evento_de(instancia, operacion, campos, **extra)
+    nuevo.save()
+    return nuevo
+
+
+def registrar_lote(eventos):
+    EventoCambio.objects.bulk_create(eventos, batch_size=1000)
+
+
+def registrar_variaciones(deltas, tipo):
+    """Un evento 'movimiento' por producto con {'delta', 'tipo'}; dentro de la transacción del kardex."""
+    registrar_lote([evento('Producto', serie, 'movimiento', {'delta': delta, 'tipo': tipo})
+                    for serie, delta in deltas.items()])
+
+
+def registrar_stock(series):
+    """
+    Registra el stock (y la versión) actual de los productos indicados.
+    Lo usa el kardex después de sus UPDATE con F(): el valor nuevo solo lo
+    conoce la BD, así que se lee de vuelta (una consulta por bloque).
+    Devuelve {serie: (stock, version)} con lo leído.
+    """
+    series = list(series)
+    leidos = {}
+    for i in range(0, len(series), 500):
+        filas = Producto.todos.filter(pk__in=series[i:i + 500]).values_list('pk', 'stock', 'version')
+        registrar_lote([evento('Producto', serie, 'modificacion', {'stock': stock, 'version': version})
+                        for serie, stock, version in filas])
+        leidos.update((serie, (stock, version)) for serie, stock, version in filas)
+    return leidos
+
+
+def leer(desde=0, limite=1000, entidades=None):
+    """
+    Eventos con id > desde (a lo sumo 'limite'), en orden de id.
+    Devuelve (eventos, siguiente_cursor).
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    eventos = EventoCambio.objects.filter(id__gt=desde, fecha__lte=timezone.now() - MARGEN_LECTURA)
+    if entidades:
+        eventos = eventos.filter(entidad__in=entidades)
+    eventos = list(eventos.order_by('id')[:limite])
+    return eventos, (eventos[-1].id if eventos else desde)
+
+
+def cursor_actual():
+    """
+    Cursor para empezar a leer después de una lectura completa hecha ahora:
+    el último evento fuera del margen. Los más nuevos se volverán a entregar
+    (aplicarlos dos veces no cambia el resultado).
+    """
+    return (
+        EventoCambio.objects.filter(fecha__lte=timezone.now() - MARGEN_LECTURA)
+        .order_by('-id').values_list('id', flat=True).first()
+    ) or 0
+
+
+def como_dict(evento):
+    return {
+        'seq': evento.id,
+        'fecha': evento.fecha,
+        'entidad': evento.entidad,
+        'clave': evento.clave,
+        'operacion': evento.operacion,
+        'datos': evento.datos,
+    }
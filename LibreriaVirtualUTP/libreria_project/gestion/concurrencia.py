@@ -0,0 +1,62 @@
+"""
+Control de concurrencia optimista para las ediciones de los formularios.
+
+El formulario envía la 'version' que tenía el registro al abrirse. Al guardar
+se hace un UPDATE condicional (... WHERE pk = x AND version = n) que solo
+toca los campos modificados; si otra operación cambió la fila mientras
+tanto, el UPDATE no afecta ninguna fila y la edición se rechaza en lugar
+de pisar los datos nuevos (por ejemplo, el stock descontado por una venta).
+"""
+from django.db.models import F
+
+
+class EdicionConcurrenteError(Exception):
+    """El registro fue modificado por otra operación después de abrir el formulario."""
+
+
+def campos_modificados(instancia, valores):
+    """
+    Compara los valores del formulario (texto) con los de la instancia y
+    devuelve solo los que cambiaron, ya convertidos al tipo del campo.
+    Para las FK usar el attname (p. ej. 'categoria_id').
+    """
+    cambios = {}
+    for nombre, valor in valores.items():
+        campo = instancia._meta.get_field(nombre)
+        valor = campo.to_python(valor)
+        actual = getattr(instancia, campo.attname)
+        # Un campo opcional vacío llega como '' aunque en la BD esté en NULL
+        if campo.null and valor in ('', None) and actual in ('', None):
+            continue
+        if actual != valor:
+            cambios[campo.attname] = valor
+    return cambios
+
+
+def guardar_con_version(instancia, version, valores):
+    """
+    Guarda en 'instancia' solo los campos de 'valores' que cambiaron, siempre
+    que la fila siga en la 'version' indicada. Devuelve la lista de campos
+    actualizados (vacía si no había nada que guardar).
+    Lanza EdicionConcurrenteError si la versión ya no coincide.
+    """
+    version = int(version)
+    cambios = campos_modificados(instancia, valores)
+    modelo = type(instancia)
+
+    if not cambios:
+        # Nada que escribir, pero igual avisamos si el formulario estaba desactualizado
+        if not modelo.objects.filter(pk=instancia.pk, version=version).exists():
+            raise EdicionConcurrenteError()
+        return []
+
+    filas = modelo.objects.filter(pk=instancia.pk, version=version).update(
+        version=F('version') + 1, **cambios
+    )
+    if filas == 0:
+        raise EdicionConcurrenteError()
+
+    for attname, valor in cambios.items():
+        setattr(instancia, attname, valor)
+    instancia.version = version + 1
+    return list(cambios)
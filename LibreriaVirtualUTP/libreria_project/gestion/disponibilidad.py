@@ -0,0 +1,75 @@
+"""
+Stock disponible por producto, servido desde el cache (GET /api/stock/).
+
+El formulario de pedidos muestra el stock de cuando se abrió la página; si
+otro pedido se lleva las unidades, el faltante recién aparecía al grabar
+(StockInsuficiente y rollback del pedido completo). El formulario consulta
+aquí el stock de su carrito cada cierto tiempo y antes de enviarlo.
+
+Hay una clave por producto con (versión, stock). Se refresca con el valor ya
+grabado cada vez que cambia el total (inventario.actualizar_totales, que
+corre después del commit de la venta o el ajuste), así que una consulta
+normalmente no toca la BD. Dos refrescos del mismo producto pueden llegar al
+cache en otro orden que sus commits: cada uno solo escribe si trae una
+versión más nueva que la guardada. Entre esa lectura y la escritura queda
+una ventana mínima en la que el viejo aún puede ganar; el vencimiento corto
+acota cuánto dura. Las claves que faltan se leen de la BD en UNA consulta y
+se guardan con cache.add: si justo entre la lectura y el guardado llegó un
+refresco, gana el refresco y no el valor viejo.
+
+Es una guía para la interfaz, no una reserva: al grabar, crear_pedidos
+vuelve a validar el stock con el UPDATE condicional de inventario.reservar_lote.
+"""
+from django.core.cache import cache
+
+from .models import Producto
+
+PREFIJO = 'stock_version'
+# Los cambios de la aplicación refrescan la clave al instante; el vencimiento
+# acota cuánto dura un valor que cambió por fuera (cargas directas en la BD) o
+# que perdió la carrera contra un refresco más nuevo
+SEGUNDOS_CACHE = 300
+MAX_SERIES = 200
+
+
+def _clave(serie):
+    return f"{PREFIJO}:{serie}"
+
+
+def consultar(series):
+    """{serie: stock}; None para las que no existen o están dadas de baja."""
+    series = list(dict.fromkeys(series))
+    en_cache = cache.get_many([_clave(serie) for serie in series])
+    resultado, faltan = {}, []
+    for serie in series:
+        guardado = en_cache.get(_clave(serie))   # (version, stock)
+        resultado[serie] = guardado[1] if guardado is not None else None
+        if guardado is None:
+            faltan.append(serie)
+    if faltan:
+        for serie, stock, version in Producto.objects.filter(pk__in=faltan).values_list('pk', 'stock', 'version'):
+            resultado[serie] = stock
+            cache.add(_clave(serie), (version, stock), SEGUNDOS_CACHE)
+    return resultado
+
+
+def refrescar(stocks):
+    """
+    Guarda {serie: (stock, version)} recién grabados. Llamar después del
+    commit. No pisa una versión más nueva que ya esté en el cache.
+    """
+    if not stocks:
+        return
+    en_cache = cache.get_many([_clave(serie) for serie in stocks])
+    nuevos = {}
+    for serie, (stock, version) in stocks.items():
+        guardado = en_cache.get(_clave(serie))
+        if guardado is None or guardado[0] < version:
+            nuevos[_clave(serie)] = (version, stock)
+    if nuevos:
+        cache.set_many(nuevos, SEGUNDOS_CACHE)
+
+
+def olvidar(series):
+    """Quita las claves (p. ej. productos dados de baja: dejan de estar disponibles)."""
+    cache.delete_many([_clave(serie) for serie in series])
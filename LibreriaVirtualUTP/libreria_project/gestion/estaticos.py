@@ -0,0 +1,140 @@
+"""
+Almacenamiento de archivos estáticos para producción ('collectstatic').
+
+Sobre ManifestStaticFilesStorage (nombres con hash del contenido, p. ej.
+base.3f2a9c1b7d4e.css, que se pueden cachear "para siempre" porque un
+cambio produce otro nombre) añade:
+
+- Minificado de CSS (propio, conservador) y de JS (con 'rjsmin', si está
+  instalado; si no, el JS se copia tal cual).
+- Versiones precomprimidas .gz (y .br con el paquete 'brotli') junto a
+  cada archivo, para que WhiteNoise o nginx (gzip_static) las sirvan sin
+  comprimir en cada request.
+
+El hash se calcula sobre el archivo fuente: cambia cuando cambia el fuente,
+que es lo que importa para invalidar la caché del navegador.
+"""
+import gzip
+import logging
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+
+logger = logging.getLogger(__name__)
+_sin_manifiesto_avisado = False
+
+EXTENSIONES_COMPRIMIBLES = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.xml')
+TAMANO_MINIMO_COMPRESION = 512  # bytes: por debajo, la cabecera gzip no compensa
+
+# Cadenas y comentarios de CSS (las cadenas se copian tal cual; los comentarios se
+# quitan salvo los /*! ... */ de licencia)
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|(/\*.*?\*/)', re.S)
+_CSS_ESPACIOS = re.compile(r'\s+')
+_CSS_SEPARADORES = re.compile(r'\s*([{};,>])\s*')
+
+
+def minificar_css(texto):
+    partes = []
+    pendiente = []  # Texto entre cadenas: sin comentarios, se compacta junto
+    posicion = 0
+    for token in _CSS_TOKENS.finditer(texto):
+        pendiente.append(texto[posicion:token.start()])
+        cadena, comentario = token.groups()
+        if cadena or comentario.startswith('/*!'):
+            partes.append(_compactar_css(''.join(pendiente)))
+            partes.append(token.group())
+            pendiente = []
+        posicion = token.end()
+    pendiente.append(texto[posicion:])
+    partes.append(_compactar_css(''.join(pendiente)))
+    return ''.join(partes).strip()
+
+
+def _compactar_css(fragmento):
+    # Antes de ':' no se quita el espacio (en "a :hover" cambia el selector)
+    fragmento = _CSS_SEPARADORES.sub(r'\1', _CSS_ESPACIOS.sub(' ', fragmento))
+    return fragmento.replace(': ', ':').replace(';}', '}')
+
+
+def minificar_js(texto):
+    try:
+        import rjsmin
+    except ImportError:
+        return texto  # Sin minificador confiable: gzip ya reduce la mayor parte
+    return rjsmin.jsmin(texto, keep_bang_comments=True)
+
+
+MINIFICADORES = {
+    '.css': minificar_css,
+    '.js': minificar_js,
+}
+
+
+def comprimir(datos):
+    """Versiones comprimidas que valen la pena: {extensión: bytes}."""
+    versiones = {'.gz': gzip.compress(datos, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        versiones['.br'] = brotli.compress(datos)
+    # Si casi no se reduce (imágenes ya comprimidas, archivos chicos), no se guarda
+    return {ext: comprimido for ext, comprimido in versiones.items() if len(comprimido) < len(datos) * 0.95}
+
+
+class EstaticosComprimidos(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        procesados = set()
+        for original, con_hash, procesado in super().post_process(paths, dry_run, **options):
+            if con_hash and not isinstance(procesado, Exception):
+                procesados.add(original)
+                procesados.add(con_hash)
+            yield original, con_hash, procesado
+
+        if dry_run:
+            return
+        for nombre in sorted(procesados):
+            self.optimizar(nombre)
+
+    def optimizar(self, nombre):
+        """Minifica (si corresponde) y escribe las versiones precomprimidas de un archivo."""
+        if not nombre.endswith(EXTENSIONES_COMPRIMIBLES):
+            return
+        ruta = self.path(nombre)
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+
+        extension = nombre[nombre.rfind('.'):]
+        minificar = MINIFICADORES.get(extension)
+        if minificar and '.min.' not in nombre:
+            try:
+                minificado = minificar(datos.decode('utf-8')).encode('utf-8')
+            except UnicodeDecodeError:
+                minificado = datos
+            if len(minificado) < len(datos):
+                datos = minificado
+                with open(ruta, 'wb') as f:
+                    f.write(datos)
+
+        if len(datos) < TAMANO_MINIMO_COMPRESION:
+            return
+        for sufijo, comprimido in comprimir(datos).items():
+            with open(ruta + sufijo, 'wb') as f:
+                f.write(comprimido)
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            if self.hashed_files:
+                raise  # Hay manifiesto pero falta el archivo: error real de despliegue
+            # Sin 'collectstatic' todavía (p. ej. pruebas con DEBUG=False): URL sin hash
+            global _sin_manifiesto_avisado
+            if not _sin_manifiesto_avisado:
+                _sin_manifiesto_avisado = True
+                logger.warning("Sin manifiesto de estáticos; se sirve '%s' sin versionar. "
+                               "Ejecute 'manage.py collectstatic'.", name)
+            return FileSystemStorage.url(self, name)
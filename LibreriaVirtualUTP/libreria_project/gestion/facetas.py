@@ -0,0 +1,223 @@
+"""
+Navegación del catálogo por facetas: categoría, color, rango de precio,
+dimensiones y si hay stock.
+
+Los conteos NO salen de un GROUP BY sobre Producto por cada faceta (con un
+millón de productos son segundos por página): se leen de ConteoFaceta, que
+guarda cuántos productos activos hay por (categoría, faceta, valor) y se
+actualiza con deltas en la misma transacción que el cambio del producto:
+
+- alta, modificación y baja (vistas de productos, admin, archivo.eliminar_logico);
+- stock: solo cuando el total pasa por cero (inventario.actualizar_totales).
+
+Los conteos están condicionados a la categoría elegida, no al resto de los
+filtros: con la categoría X, "rojo (12)" son los productos rojos de X, aunque
+además se haya filtrado por precio. Es lo que permite responder con una
+consulta sobre unas pocas filas; contar cruzando todas las facetas exigiría
+una fila por combinación de valores.
+
+Si alguna vez se desfasan (cargas directas en la BD), 'manage.py
+recalcular_facetas' los rehace desde los productos.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Lower, Trim
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Categoria, ConteoFaceta, Producto
+
+FACETAS = ('color', 'precio', 'dimensiones', 'stock')
+# Límites de los rangos de precio (S/): "0-10", "10-25", ..., "250+"
+LIMITES_PRECIO = (10, 25, 50, 100, 250)
+MAX_VALORES = 30  # Valores por faceta en la página (los de más productos)
+TAMANO_PAGINA = 50
+
+
+def _rangos():
+    anterior = 0
+    for limite in LIMITES_PRECIO:
+        yield f"{anterior}-{limite}", anterior, limite
+        anterior = limite
+    yield f"{anterior}+", anterior, None
+
+
+RANGOS_PRECIO = tuple(_rangos())
+
+
+def rango_precio(precio):
+    precio = Decimal(str(precio))
+    for etiqueta, _, hasta in RANGOS_PRECIO:
+        if hasta is None or precio < hasta:
+            return etiqueta
+
+
+def normalizar(texto):
+    """'  Rojo ' -> 'rojo'; vacío o None -> '' (se muestra como "sin dato")."""
+    return (texto or '').strip().lower()
+
+
+def claves(categoria_id, precio, color, dimensiones, stock):
+    """Las filas de ConteoFaceta donde cuenta un producto con estos datos."""
+    categoria = categoria_id or 0
+    return [
+        (categoria, 'color', normalizar(color)),
+        (categoria, 'precio', rango_precio(precio)),
+        (categoria, 'dimensiones', normalizar(dimensiones)),
+        (categoria, 'stock', 'si' if stock > 0 else 'no'),
+    ]
+
+
+def de_producto(producto):
+    """Claves del producto; ninguna si está dado de baja."""
+    if producto is None or producto.eliminado:
+        return []
+    return claves(producto.categoria_id, producto.precio, producto.color, producto.dimensiones, producto.stock)
+
+
+def _aplicar(deltas):
+    # En orden de clave: dos transacciones que tocan las mismas filas no se bloquean en cruz
+    for (categoria, faceta, valor), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        filtro = ConteoFaceta.objects.filter(categoria=categoria, faceta=faceta, valor=valor)
+        if not filtro.update(productos=F('productos') + delta):
+            # Primer producto con ese valor: se crea la fila y se vuelve a sumar
+            ConteoFaceta.objects.get_or_create(categoria=categoria, faceta=faceta, valor=valor)
+            filtro.update(productos=F('productos') + delta)
+
+
+def registrar(antes, despues):
+    """
+    Aplica el cambio de un producto: 'antes' y 'despues' son sus claves
+    (de_producto) antes y después de guardarlo. Llamar dentro de la transacción.
+    """
+    deltas = Counter(despues)
+    deltas.subtract(antes)
+    _aplicar(deltas)
+
+
+def stock_actualizado(antes, despues):
+    """
+    Cambios de stock: 'antes' son (serie, stock, categoria_id) de los
+    productos activos leídos antes del UPDATE y 'despues' es {serie: stock}.
+    Solo cuentan los que pasan por cero.
+    """
+    deltas = Counter()
+    for serie, stock, categoria_id in antes:
+        nuevo = despues.get(serie, stock)
+        if (stock > 0) != (nuevo > 0):
+            categoria = categoria_id or 0
+            deltas[(categoria, 'stock', 'si')] += 1 if nuevo > 0 else -1
+            deltas[(categoria, 'stock', 'no')] += -1 if nuevo > 0 else 1
+    _aplicar(deltas)
+
+
+def contar(categoria=None):
+    """
+    {'categoria': {id: n}, 'color': [(valor, n)], 'precio': [...], 'dimensiones': [...], 'stock': [...]}.
+    Con categoría es UNA consulta: sus filas más las de stock de todas las
+    categorías (si + no = productos de cada una).
+    """
+    if categoria is not None:
+        filas = ConteoFaceta.objects.filter(Q(categoria=categoria) | Q(faceta='stock'), productos__gt=0)
+        filas = list(filas.values_list('categoria', 'faceta', 'valor', 'productos'))
+        propias = [(faceta, valor, n) for cat, faceta, valor, n in filas if cat == categoria]
+    else:
+        filas = list(ConteoFaceta.objects.filter(faceta='stock', productos__gt=0)
+                     .values_list('categoria', 'faceta', 'valor', 'productos'))
+        propias = (ConteoFaceta.objects.filter(productos__gt=0).values('faceta', 'valor')
+                   .annotate(total=Sum('productos')).values_list('faceta', 'valor', 'total'))
+
+    por_categoria = defaultdict(int)
+    for cat, faceta, _, n in filas:
+        if faceta == 'stock':
+            por_categoria[cat] += n
+    valores = defaultdict(list)
+    for faceta, valor, n in propias:
+        if n > 0:
+            valores[faceta].append((valor, n))
+
+    orden_precio = {etiqueta: i for i, (etiqueta, _, _) in enumerate(RANGOS_PRECIO)}
+    resultado = {'categoria': dict(por_categoria)}
+    for faceta in FACETAS:
+        if faceta == 'precio':
+            resultado[faceta] = sorted(valores[faceta], key=lambda par: orden_precio.get(par[0], 0))
+        elif faceta == 'stock':
+            resultado[faceta] = sorted(valores[faceta], reverse=True)  # 'si' primero
+        else:
+            resultado[faceta] = sorted(valores[faceta], key=lambda par: (-par[1], par[0]))[:MAX_VALORES]
+    return resultado
+
+
+def filtrar(productos, categoria=None, color=None, precio=None, dimensiones=None, stock=None):
+    """Aplica a un queryset de productos los valores elegidos (los mismos que devuelve contar)."""
+    if categoria is not None:
+        productos = productos.filter(categoria_id=categoria or None)
+    for campo, valor in (('color', color), ('dimensiones', dimensiones)):
+        if valor is None:
+            continue
+        # Igual que normalizar(): ' Rojo' y 'rojo' son el mismo valor, y '  ' es "sin dato" como NULL
+        normalizado = productos.alias(**{f'{campo}_normalizado': Lower(Trim(campo))})
+        if normalizar(valor) == '':
+            productos = normalizado.filter(Q(**{f'{campo}__isnull': True}) | Q(**{f'{campo}_normalizado': ''}))
+        else:
+            productos = normalizado.filter(**{f'{campo}_normalizado': normalizar(valor)})
+    if precio is not None:
+        rango = next(((desde, hasta) for etiqueta, desde, hasta in RANGOS_PRECIO if etiqueta == precio), None)
+        if rango is None:
+            raise ValueError(f"Rango de precio desconocido: {precio}")
+        productos = productos.filter(precio__gte=rango[0])
+        if rango[1] is not None:
+            productos = productos.filter(precio__lt=rango[1])
+    if stock is not None:
+        productos = productos.filter(stock__gt=0) if stock == 'si' else productos.filter(stock=0)
+    return productos
+
+
+def pagina_productos(elegidos, despues=None, tamano=TAMANO_PAGINA):
+    """
+    Productos con los valores 'elegidos' (kwargs de filtrar), por número de
+    serie. 'despues' es el cursor: número de serie del último de la página
+    anterior (keyset: usa la clave primaria, no recorre las páginas previas
+    como un OFFSET). Devuelve (productos, cursor_siguiente o None).
+    """
+    productos = filtrar(Producto.objects.select_related('categoria'), **elegidos)
+    if despues:
+        productos = productos.filter(numero_serie__gt=despues)
+    # Uno de más para saber si hay otra página
+    productos = list(productos.order_by('numero_serie')[:tamano + 1])
+    siguiente = None
+    if len(productos) > tamano:
+        productos = productos[:tamano]
+        siguiente = productos[-1].numero_serie
+    return productos, siguiente
+
+
+def recalcular(chunk_size=5000):
+    """
+    Rehace ConteoFaceta desde los productos activos (una pasada, en streaming).
+    Devuelve cuántas filas quedaron.
+    """
+    conteos = Counter()
+    filas = Producto.objects.order_by().values_list('categoria_id', 'precio', 'color', 'dimensiones', 'stock')
+    for fila in filas.iterator(chunk_size=chunk_size):
+        conteos.update(claves(*fila))
+    with transaction.atomic():
+        ConteoFaceta.objects.all().delete()
+        ConteoFaceta.objects.bulk_create(
+            [ConteoFaceta(categoria=c, faceta=f, valor=v, productos=n) for (c, f, v), n in conteos.items()],
+            batch_size=2000,
+        )
+    return len(conteos)
+
+
+@receiver(post_delete, sender=Categoria)
+def _categoria_eliminada(sender, instance, **kwargs):
+    # Sus productos quedan sin categoría (SET_NULL): sus conteos pasan a la categoría 0
+    filas = ConteoFaceta.objects.filter(categoria=instance.pk)
+    _aplicar({(0, faceta, valor): n for faceta, valor, n in filas.values_list('faceta', 'valor', 'productos')})
+    filas.delete()
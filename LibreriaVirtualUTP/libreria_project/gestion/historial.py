@@ -0,0 +1,178 @@
+"""
+Historial de pedidos de un cliente y sus totales históricos.
+
+La página del historial carga cabeceras, líneas y productos con un número
+fijo de consultas (select_related + Prefetch), sin importar cuántos pedidos
+o líneas muestre. Se pagina por cursor (keyset): "pedidos con número menor
+que el último mostrado", que usa el índice y no recorre las páginas
+anteriores como un OFFSET.
+
+Los totales del cliente (pedidos, unidades, importe) vienen de
+ResumenCliente, que se actualiza con F() en la misma transacción que crea o
+cancela el pedido (un lote de pedidos: un UPDATE ... CASE por bloque de
+clientes, no uno por cliente). Si alguna vez se desfasan (cargas manuales en la BD), se
+rehacen con 'manage.py recalcular_resumenes'.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Min, Prefetch, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import (
+    Pedido, DetallePedido, PedidoArchivado, DetallePedidoArchivado, ResumenCliente,
+)
+
+TAMANO_PAGINA = 20
+TAMANO_BLOQUE = 500  # Clientes por UPDATE de los resúmenes
+
+
+def pagina_pedidos(dni, antes=None, incluir_archivo=True, tamano=TAMANO_PAGINA):
+    """
+    Pedidos del cliente, del más nuevo al más antiguo, con sus líneas y productos.
+    'antes' es el cursor: número de pedido del último de la página anterior.
+    Devuelve (pedidos, cursor_siguiente); el cursor es None en la última página.
+    """
+    filtros = Q(cliente_id=dni)
+    if antes is not None:
+        filtros &= Q(numero_pedido__lt=antes)
+
+    # Un pedido de más para saber si hay otra página
+    pedidos = list(_pagina(Pedido, DetallePedido, filtros, tamano + 1))
+    if incluir_archivo:
+        # Los archivados conservan su número: se mezclan por número de pedido
+        pedidos += _pagina(PedidoArchivado, DetallePedidoArchivado, filtros, tamano + 1)
+        pedidos.sort(key=lambda p: p.numero_pedido, reverse=True)
+
+    siguiente = None
+    if len(pedidos) > tamano:
+        pedidos = pedidos[:tamano]
+        siguiente = pedidos[-1].numero_pedido
+    for pedido in pedidos:
+        pedido.importe = sum((d.importe for d in pedido.detalles.all()), Decimal('0'))
+    return pedidos, siguiente
+
+
+def _pagina(modelo, modelo_detalle, filtros, limite):
+    # Las líneas con su producto (también los dados de baja) en UNA consulta
+    detalles = modelo_detalle.objects.select_related('producto').order_by('id')
+    return (
+        modelo.objects.filter(filtros)
+        .select_related('personal_delivery')
+        .prefetch_related(Prefetch('detalles', queryset=detalles))
+        .order_by('-numero_pedido')[:limite]
+    )
+
+
+def obtener_resumen(cliente):
+    """Totales del cliente; un resumen en cero si todavía no tiene pedidos."""
+    try:
+        return cliente.resumen
+    except ResumenCliente.DoesNotExist:
+        return ResumenCliente(cliente=cliente)
+
+
+def _por_cliente(valores, campo, default):
+    """CASE cliente_id WHEN <dni> THEN <valor> ... (el valor de cada cliente en UN UPDATE)."""
+    tipo = ResumenCliente._meta.get_field(campo)
+    return Case(*[When(cliente_id=dni, then=Value(valor, output_field=tipo)) for dni, valor in valores.items()],
+                default=default, output_field=tipo)
+
+
+def _sumar(deltas, fechas=None):
+    """
+    Suma {dni: {campo: delta}} a los resúmenes y, con 'fechas' ({dni: fecha}),
+    mueve primer/último pedido. Por bloque de clientes son tres consultas:
+    crea en cero las filas que faltan (las que ya existen se ignoran, aunque
+    otra transacción las acabe de crear), las bloquea en orden de dni (dos
+    lotes con clientes en común no se bloquean en cruz) y las actualiza con
+    UN UPDATE ... CASE.
+    """
+    dnis = sorted(deltas)
+    campos = sorted({campo for valores in deltas.values() for campo in valores})
+    for i in range(0, len(dnis), TAMANO_BLOQUE):
+        bloque = dnis[i:i + TAMANO_BLOQUE]
+        ResumenCliente.objects.bulk_create([ResumenCliente(cliente_id=dni) for dni in bloque], ignore_conflicts=True)
+        filas = ResumenCliente.objects.filter(cliente_id__in=bloque)
+        if connection.features.has_select_for_update:
+            list(filas.select_for_update().order_by('pk').values_list('pk', flat=True))
+        cambios = {
+            campo: F(campo) + _por_cliente({dni: deltas[dni].get(campo, 0) for dni in bloque}, campo, Value(0))
+            for campo in campos
+        }
+        if fechas:
+            del_bloque = {dni: fechas[dni] for dni in bloque if dni in fechas}
+            cambios['primer_pedido'] = Coalesce(F('primer_pedido'),
+                                                _por_cliente(del_bloque, 'primer_pedido', Value(None)))
+            cambios['ultimo_pedido'] = _por_cliente(del_bloque, 'ultimo_pedido', F('ultimo_pedido'))
+        filas.update(**cambios)
+
+
+def registrar_pedidos(pedidos):
+    """
+    Suma los pedidos nuevos [(pedido, unidades, importe), ...] al resumen de
+    sus clientes (un UPDATE por bloque de clientes). Llamar dentro de la transacción.
+    """
+    deltas = defaultdict(lambda: {'pedidos': 0, 'unidades': 0, 'importe': Decimal('0')})
+    fechas = {}
+    for pedido, unidades, importe in pedidos:
+        totales = deltas[pedido.cliente_id]
+        totales['pedidos'] += 1
+        totales['unidades'] += unidades
+        totales['importe'] += importe
+        if pedido.fecha_pedido is not None:
+            fechas[pedido.cliente_id] = max(filter(None, (fechas.get(pedido.cliente_id), pedido.fecha_pedido)))
+    _sumar(deltas, fechas)
+
+
+def registrar_cancelacion(pedido, unidades, importe):
+    """El pedido cancelado deja de contar en pedidos, unidades e importe."""
+    _sumar({pedido.cliente_id: {'pedidos': -1, 'cancelados': 1, 'unidades': -unidades, 'importe': -importe}})
+
+
+def recalcular(dnis=None):
+    """
+    Rehace los resúmenes desde los pedidos (vigentes y archivados).
+    Sin 'dnis', los de todos los clientes. Devuelve cuántos se escribieron.
+    """
+    totales = defaultdict(lambda: {'pedidos': 0, 'cancelados': 0, 'unidades': 0, 'importe': Decimal('0'),
+                                   'primer_pedido': None, 'ultimo_pedido': None})
+    for modelo, modelo_detalle in ((Pedido, DetallePedido), (PedidoArchivado, DetallePedidoArchivado)):
+        pedidos = modelo.objects.all()
+        detalles = modelo_detalle.objects.exclude(pedido__estado_pedido='Cancelado')
+        if dnis is not None:
+            pedidos = pedidos.filter(cliente_id__in=dnis)
+            detalles = detalles.filter(pedido__cliente_id__in=dnis)
+
+        filas = pedidos.values('cliente_id').annotate(
+            cancelados=Count('pk', filter=Q(estado_pedido='Cancelado')),
+            total=Count('pk'),
+            primero=Min('fecha_pedido'),
+            ultimo=Max('fecha_pedido'),
+        )
+        for fila in filas:
+            t = totales[fila['cliente_id']]
+            t['pedidos'] += fila['total'] - fila['cancelados']
+            t['cancelados'] += fila['cancelados']
+            t['primer_pedido'] = min(filter(None, (t['primer_pedido'], fila['primero'])))
+            t['ultimo_pedido'] = max(filter(None, (t['ultimo_pedido'], fila['ultimo'])))
+
+        filas = detalles.values('pedido__cliente_id').annotate(
+            unidades=Sum('cantidad'),
+            importe=Sum(F('cantidad') * F('precio_unitario') - F('descuento'),
+                        output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+        for fila in filas:
+            t = totales[fila['pedido__cliente_id']]
+            t['unidades'] += fila['unidades']
+            t['importe'] += fila['importe']
+
+    with transaction.atomic():
+        resumenes = ResumenCliente.objects.all()
+        if dnis is not None:
+            resumenes = resumenes.filter(cliente_id__in=dnis)
+        resumenes.delete()
+        ResumenCliente.objects.bulk_create(
+            [ResumenCliente(cliente_id=dni, **t) for dni, t in totales.items()], batch_size=1000)
+    return len(totales)
@@ -0,0 +1,131 @@
+"""
+Límite de intentos de login (fuerza bruta / credential stuffing).
+
+El hash de la contraseña es caro a propósito, así que los intentos de más se
+rechazan ANTES de llamar a authenticate(). Se cuentan dos cosas en el cache
+de Django (compartido entre workers si el cache lo es: Redis, Memcached...):
+  - por IP: todos los intentos (una IP probando muchos usuarios);
+  - por usuario: los intentos fallidos (muchas IPs probando un usuario).
+
+Cada contador es una ventana deslizante aproximada con dos ventanas fijas:
+    estimado = anterior * (1 - transcurrido / ventana) + actual
+Son dos claves por contador y una lectura (get_many) por intento.
+"""
+import hashlib
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# (intentos, segundos) por tipo de clave; se puede cambiar en settings.LIMITES_LOGIN
+LIMITES_POR_DEFECTO = {
+    'ip': (30, 300),
+    'usuario': (5, 900),
+}
+PREFIJO = 'limitador:login'
+
+
+def _limites():
+    return {**LIMITES_POR_DEFECTO, **getattr(settings, 'LIMITES_LOGIN', {})}
+
+
+def _clave(tipo, valor):
+    # Hash: el usuario viene del formulario y no sirve tal cual como clave de cache
+    resumen = hashlib.sha256(valor.encode('utf-8')).hexdigest()[:32]
+    return f"{PREFIJO}:{tipo}:{resumen}"
+
+
+def _ventanas(tipo, valor, ahora):
+    maximo, ventana = _limites()[tipo]
+    numero, transcurrido = divmod(ahora, ventana)
+    clave = _clave(tipo, valor)
+    return maximo, ventana, transcurrido, f"{clave}:{int(numero)}", f"{clave}:{int(numero) - 1}"
+
+
+def _espera(maximo, ventana, transcurrido, anterior, actual):
+    """Segundos (aprox.) hasta que el estimado vuelva a quedar bajo el máximo."""
+    if actual >= maximo:
+        # Hay que esperar a la próxima ventana y a que 'actual' (ya como anterior) pese menos
+        falta = (ventana - transcurrido) + ventana * (1 - maximo / actual)
+    else:
+        falta = ventana * (1 - (maximo - actual) / anterior) - transcurrido
+    return max(1, math.ceil(falta))
+
+
+def _incrementar(clave, ventana):
+    # La clave vive dos ventanas: mientras es la actual y mientras es la anterior
+    if cache.add(clave, 1, timeout=2 * ventana):
+        return
+    try:
+        cache.incr(clave)
+    except ValueError:  # Expiró entre el add y el incr
+        cache.add(clave, 1, timeout=2 * ventana)
+
+
+def _claves_del_intento(ip, usuario):
+    claves = [('ip', ip)]
+    if usuario:
+        claves.append(('usuario', usuario.strip().lower()))
+    return claves
+
+
+def verificar(ip, usuario):
+    """
+    Devuelve None si el intento puede seguir, o los segundos que hay que
+    esperar si alguna de sus claves (IP o usuario) superó su límite.
+    """
+    ahora = time.time()
+    ventanas = {tipo: _ventanas(tipo, valor, ahora) for tipo, valor in _claves_del_intento(ip, usuario)}
+    valores = cache.get_many([c for v in ventanas.values() for c in v[3:]])
+
+    espera = None
+    for tipo, (maximo, ventana, transcurrido, actual, anterior) in ventanas.items():
+        n_actual = valores.get(actual, 0)
+        n_anterior = valores.get(anterior, 0)
+        estimado = n_anterior * (1 - transcurrido / ventana) + n_actual
+        if estimado >= maximo:
+            espera = max(espera or 0, _espera(maximo, ventana, transcurrido, n_anterior, n_actual))
+            _incrementar(f"{PREFIJO}:bloqueos:{tipo}", 365 * 24 * 3600)
+    if espera is not None:
+        _incrementar(f"{PREFIJO}:bloqueos:total", 365 * 24 * 3600)
+        logger.warning("Login bloqueado por exceso de intentos (ip=%s, espera=%ss)", ip, espera)
+    return espera
+
+
+def registrar_intento(ip, usuario, exitoso):
+    """Cuenta un intento que llegó a authenticate()."""
+    ahora = time.time()
+    _, ventana, _, actual, _ = _ventanas('ip', ip, ahora)
+    _incrementar(actual, ventana)
+    if usuario:
+        clave_usuario = usuario.strip().lower()
+        if exitoso:
+            # El dueño de la cuenta entró: se olvidan sus fallos previos
+            _, _, _, actual, anterior = _ventanas('usuario', clave_usuario, ahora)
+            cache.delete_many([actual, anterior])
+        else:
+            _, ventana, _, actual, _ = _ventanas('usuario', clave_usuario, ahora)
+            _incrementar(actual, ventana)
+
+
+def ip_cliente(request):
+    """
+    IP del cliente. Solo se usa X-Forwarded-For si settings.LOGIN_CONFIAR_PROXY
+    es True (detrás de un proxy propio); si no, cualquiera podría falsearla.
+    """
+    if getattr(settings, 'LOGIN_CONFIAR_PROXY', False):
+        reenviada = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if reenviada:
+            return reenviada.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def metricas():
+    """Intentos bloqueados desde que arrancó el cache (total, por IP y por usuario)."""
+    tipos = ('total', 'ip', 'usuario')
+    valores = cache.get_many([f"{PREFIJO}:bloqueos:{tipo}" for tipo in tipos])
+    return {f"bloqueos_{tipo}": valores.get(f"{PREFIJO}:bloqueos:{tipo}", 0) for tipo in tipos}
@@ -0,0 +1,36 @@
+"""
+Utilidades compartidas por los comandos bench_* (no es un comando: Django
+ignora los módulos que empiezan con '_').
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def base_de_datos_temporal(verbosity=0):
+    """
+    Crea una BD de pruebas vacía (test_<nombre>) con las migraciones aplicadas
+    y la elimina al terminar: los benchmarks nunca tocan los datos reales.
+    """
+    nombre_original = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity)
+        teardown_test_environment()
+
+
+class Cronometro:
+    """with Cronometro() as c: ...  ->  c.segundos"""
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.segundos = time.perf_counter() - self.inicio
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gestion import archivo
+
+
+class Command(BaseCommand):
+    help = "Mueve al archivo histórico los pedidos entregados o cancelados más antiguos que el corte."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=365,
+                            help="Archivar pedidos con más de N días (por defecto 365).")
+        parser.add_argument('--lote', type=int, default=500,
+                            help="Pedidos por transacción (por defecto 500).")
+
+    def handle(self, *args, **options):
+        corte = timezone.now() - timedelta(days=options['dias'])
+        total = archivo.archivar_pedidos(corte, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"{total} pedido(s) anteriores al {corte:%d/%m/%Y} archivados."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from gestion import asignacion
+
+
+class Command(BaseCommand):
+    help = "Asigna personal de delivery a los pedidos pendientes sin asignar (agrupando por distrito)."
+
+    def handle(self, *args, **options):
+        asignados, sin_asignar = asignacion.asignar_pendientes()
+        self.stdout.write(self.style.SUCCESS(f"{asignados} pedido(s) asignados."))
+        if sin_asignar:
+            self.stdout.write(self.style.WARNING(f"{sin_asignar} pedido(s) sin asignar: no hay capacidad libre."))
@@ -0,0 +1,120 @@
+import random
+import resource
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion import analitica
+from ._bench import base_de_datos_temporal, Cronometro
+
+
+class Command(BaseCommand):
+    help = ("Benchmark de la analítica de ventas: N líneas sintéticas por bloques (sin BD) y, "
+            "opcionalmente, la lectura desde la BD en una BD temporal.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, default=10_000_000)
+        parser.add_argument('--bloque', type=int, default=analitica.TAMANO_BLOQUE)
+        parser.add_argument('--clientes', type=int, default=200_000)
+        parser.add_argument('--productos', type=int, default=20_000)
+        parser.add_argument('--meses', type=int, default=36)
+        parser.add_argument('--bd', type=int, default=0,
+                            help="Líneas a insertar en una BD temporal para medir también la lectura (0 = no).")
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+            analitica._requiere_numpy()
+        except (ImportError, analitica.AnaliticaNoDisponible) as e:
+            raise CommandError(str(e))
+
+        rng = np.random.default_rng(options['semilla'])
+        clientes = np.array([f"{10000000 + i}" for i in range(options['clientes'])], dtype=object)
+        distritos = np.array([f"DISTRITO {i:02d}" for i in range(43)] + [None], dtype=object)
+        repartidores = np.array([f"{70000000 + i}" for i in range(150)] + [None], dtype=object)
+        productos = np.array([f"SERIE-{i:06d}" for i in range(options['productos'])], dtype=object)
+        categoria_de = rng.integers(1, 200, size=len(productos))
+        distrito_de = rng.integers(0, len(distritos), size=len(clientes))
+        # Popularidad tipo Zipf: pocos productos concentran la mayoría de las ventas
+        pesos = 1 / np.arange(1, len(productos) + 1)
+        pesos /= pesos.sum()
+        inicio_periodo = 2023 * 12
+
+        def bloques():
+            restantes = options['lineas']
+            while restantes > 0:
+                n = min(options['bloque'], restantes)
+                restantes -= n
+                c = rng.integers(0, len(clientes), size=n)
+                p = rng.choice(len(productos), size=n, p=pesos)
+                cantidad = rng.integers(1, 6, size=n)
+                yield {
+                    'periodo': inicio_periodo + rng.integers(0, options['meses'], size=n),
+                    'cliente': clientes[c],
+                    'distrito': distritos[distrito_de[c]],
+                    'repartidor': repartidores[rng.integers(0, len(repartidores), size=n)],
+                    'producto': productos[p],
+                    'categoria': categoria_de[p],
+                    'cantidad': cantidad,
+                    'importe': cantidad * rng.integers(500, 20000, size=n),
+                }
+
+        # Generar los datos también cuesta: se mide aparte para restarlo
+        with Cronometro() as generacion:
+            for _ in bloques():
+                pass
+
+        rss_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        with Cronometro() as c:
+            analizador = analitica.Analizador()
+            for bloque in bloques():
+                analizador.agregar_bloque(bloque)
+            reporte = analizador.resultado()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_final = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        neto = max(c.segundos - generacion.segundos, 1e-9)
+        self.stdout.write(f"Líneas: {reporte['lineas']:,}  Bloque: {options['bloque']:,}  "
+                          f"Clientes: {len(clientes):,}  Productos: {len(productos):,}")
+        self.stdout.write(f"Generación sintética: {generacion.segundos:.1f} s")
+        self.stdout.write(f"Analítica (sin generación): {neto:.1f} s -> {reporte['lineas'] / neto:,.0f} líneas/s")
+        self.stdout.write(f"Memoria: pico Python/NumPy {pico / 2 ** 20:.0f} MiB, "
+                          f"RSS máx. {rss_final / 1024:.0f} MiB (antes {rss_inicial / 1024:.0f} MiB)")
+        self.stdout.write(f"ABC: " + ", ".join(f"{k}={v['productos']}" for k, v in reporte['abc'].items())
+                          + f"  Cohortes: {len(reporte['cohortes'])}")
+
+        if options['bd']:
+            self.medir_bd(options['bd'], random.Random(options['semilla']))
+
+    def medir_bd(self, n, rnd):
+        from gestion.models import Categoria, Cliente, Producto, PersonalDelivery, Pedido, DetallePedido
+
+        with base_de_datos_temporal():
+            categoria = Categoria.objects.create(nombre="Bench")
+            Cliente.objects.bulk_create([
+                Cliente(dni=f"{40000000 + i}", nombres="Cliente", apellidos="Bench", correo=f"c{i}@bench.pe",
+                        distrito=f"Distrito {i % 43}") for i in range(2000)
+            ])
+            PersonalDelivery.objects.create(dni='70000000', nombres='Repartidor', apellidos='Bench')
+            Producto.objects.bulk_create([
+                Producto(numero_serie=f"BENCH-{i:05d}", nombre=f"Producto {i}", precio=10, categoria=categoria)
+                for i in range(1000)
+            ])
+            Pedido.objects.bulk_create([
+                Pedido(cliente_id=f"{40000000 + rnd.randrange(2000)}", personal_delivery_id='70000000')
+                for _ in range(n // 4)
+            ], batch_size=5000)
+            numeros = list(Pedido.objects.values_list('numero_pedido', flat=True))
+            DetallePedido.objects.bulk_create([
+                DetallePedido(pedido_id=numeros[i // 4], producto_id=f"BENCH-{rnd.randrange(1000):05d}",
+                              cantidad=rnd.randint(1, 5), precio_unitario=10)
+                for i in range(len(numeros) * 4)
+            ], batch_size=5000)
+
+            with Cronometro() as c:
+                reporte = analitica.reporte_ventas(incluir_archivo=False)
+            self.stdout.write(f"Desde la BD: {reporte['lineas']:,} líneas en {c.segundos:.1f} s "
+                              f"-> {reporte['lineas'] / c.segundos:,.0f} líneas/s")
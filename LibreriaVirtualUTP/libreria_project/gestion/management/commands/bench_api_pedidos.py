@@ -0,0 +1,91 @@
+import gzip
+import json
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from gestion import inventario
+from gestion.models import Categoria, Cliente, Producto, PersonalDelivery, StockAlmacen
+from ._bench import base_de_datos_temporal, Cronometro
+
+
+class Command(BaseCommand):
+    help = "Benchmark de POST /api/pedidos/ con 1, 100 y 1000 pedidos por llamada (en una BD temporal)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', default='1,100,1000',
+                            help="Pedidos por llamada, separados por coma.")
+        parser.add_argument('--pedidos-por-tamano', type=int, default=2000,
+                            help="Pedidos a crear en total por cada tamaño (por defecto 2000).")
+        parser.add_argument('--lineas', type=int, default=3, help="Productos por pedido.")
+        parser.add_argument('--semilla', type=int, default=7)
+
+    def handle(self, *args, **options):
+        tamanos = [int(t) for t in options['tamanos'].split(',')]
+        with base_de_datos_temporal():
+            self.preparar_datos()
+            cliente_http = Client()
+            cliente_http.force_login(User.objects.create_superuser('bench', 'bench@correo.com', 'bench'))
+            rnd = random.Random(options['semilla'])
+
+            self.stdout.write(f"{'pedidos/llamada':>16} {'gzip':>5} {'llamadas':>9} {'consultas/llamada':>18} "
+                              f"{'ms/llamada':>11} {'pedidos/s':>10}")
+            for tamano in tamanos:
+                llamadas = max(1, options['pedidos_por_tamano'] // tamano)
+                for comprimir in (False, True):
+                    cuerpos = [self.cuerpo(rnd, tamano, options['lineas'], comprimir) for _ in range(llamadas)]
+                    consultas = 0
+                    with Cronometro() as c:
+                        for cuerpo in cuerpos:
+                            connection.queries_log.clear()
+                            with CaptureQueriesContext(connection) as ctx:
+                                respuesta = cliente_http.post(
+                                    '/api/pedidos/', cuerpo, content_type='application/json',
+                                    **({'HTTP_CONTENT_ENCODING': 'gzip'} if comprimir else {}))
+                            consultas += len(ctx)
+                            if respuesta.status_code != 201:
+                                self.stderr.write(respuesta.content.decode()[:300])
+                    self.stdout.write(
+                        f"{tamano:>16} {'sí' if comprimir else 'no':>5} {llamadas:>9} {consultas / llamadas:>18.1f} "
+                        f"{c.segundos / llamadas * 1000:>11.1f} {tamano * llamadas / c.segundos:>10.0f}")
+
+    def preparar_datos(self):
+        categoria = Categoria.objects.create(nombre="Bench")
+        Cliente.objects.bulk_create([
+            Cliente(dni=f"{40000000 + i}", nombres=f"Cliente {i}", apellidos="Bench",
+                    correo=f"c{i}@bench.pe", distrito=f"Distrito {i % 40}")
+            for i in range(500)
+        ])
+        PersonalDelivery.objects.bulk_create([
+            PersonalDelivery(dni=f"{70000000 + i}", nombres=f"Repartidor {i}", apellidos="Bench", capacidad=10 ** 6)
+            for i in range(30)
+        ])
+        Producto.objects.bulk_create([
+            Producto(numero_serie=f"BENCH-{i:05d}", nombre=f"Producto {i}", precio=10 + i % 90,
+                     stock=10 ** 8, categoria=categoria)
+            for i in range(1000)
+        ])
+        # El stock que se vende es el de los almacenes (Producto.stock es su total)
+        principal = inventario.almacen_principal()
+        StockAlmacen.objects.bulk_create([
+            StockAlmacen(producto_id=f"BENCH-{i:05d}", almacen_id=principal, stock=10 ** 8) for i in range(1000)
+        ])
+
+    def cuerpo(self, rnd, tamano, lineas, comprimir):
+        datos = {'pedidos': [
+            {
+                'cliente_dni': f"{40000000 + rnd.randrange(500)}",
+                'fecha_entrega': '2030-01-15',
+                'productos': [
+                    {'serie': f"BENCH-{rnd.randrange(1000):05d}", 'cantidad': rnd.randint(1, 3)}
+                    for _ in range(lineas)
+                ],
+            }
+            for _ in range(tamano)
+        ]}
+        cuerpo = json.dumps(datos).encode()
+        return gzip.compress(cuerpo) if comprimir else cuerpo
@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from gestion.asignacion import IndiceCarga
+
+
+class Command(BaseCommand):
+    help = "Benchmark del motor de asignación con distritos y pedidos sintéticos (no usa la BD)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pedidos', type=int, default=5000)
+        parser.add_argument('--repartidores', type=int, default=150)
+        parser.add_argument('--distritos', type=int, default=43)  # Lima Metropolitana
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        distritos = [f"DISTRITO-{i:02d}" for i in range(options['distritos'])]
+        # Unos pocos distritos concentran la mayoría de los pedidos
+        pesos = [1 / (i + 1) for i in range(len(distritos))]
+
+        repartidores = [(f"{10000000 + i}", rnd.randint(20, 60)) for i in range(options['repartidores'])]
+        carga_inicial = [
+            (dni, rnd.choice(distritos), rnd.randint(0, cap // 2)) for dni, cap in repartidores
+        ]
+
+        grupos = {}
+        for numero in range(options['pedidos']):
+            grupos.setdefault(rnd.choices(distritos, pesos)[0], []).append(numero)
+
+        tiempos = []
+        for _ in range(options['repeticiones']):
+            indice = IndiceCarga()
+            indice.cargar(repartidores, carga_inicial)
+            inicio = time.perf_counter()
+            resultado = indice.planificar(grupos, aplicar=True)
+            tiempos.append(time.perf_counter() - inicio)
+
+        # Eventos incrementales: crear/cerrar pedidos uno por uno
+        eventos = 100000
+        inicio = time.perf_counter()
+        for i in range(eventos):
+            dni, _ = repartidores[i % len(repartidores)]
+            distrito = distritos[i % len(distritos)]
+            indice.pedido_creado(dni, distrito)
+            indice.pedido_cerrado(dni, distrito)
+        tiempo_eventos = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for i in range(10000):
+            indice.elegir(distritos[i % len(distritos)])
+        tiempo_elegir = time.perf_counter() - inicio
+
+        self.stdout.write(f"Pedidos: {options['pedidos']}  Repartidores: {len(repartidores)}  Distritos: {len(distritos)}")
+        self.stdout.write(f"Asignados: {len(resultado)}  Sin capacidad: {options['pedidos'] - len(resultado)}")
+        self.stdout.write(f"planificar(): mejor {min(tiempos) * 1000:.1f} ms, peor {max(tiempos) * 1000:.1f} ms")
+        self.stdout.write(f"Eventos crear+cerrar: {eventos / tiempo_eventos:,.0f} pares/s")
+        self.stdout.write(f"elegir() para un pedido: {tiempo_elegir / 10000 * 1e6:.1f} µs")
@@ -0,0 +1,101 @@
+import statistics
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from gestion import pedidos
+from gestion.models import Almacen, Categoria, Cliente, PersonalDelivery, Producto, StockAlmacen
+from ._bench import base_de_datos_temporal, Cronometro
+
+
+class Command(BaseCommand):
+    help = ("Contención de stock: pedidos en paralelo sobre los mismos productos con todo el stock en "
+            "UNA fila vs. repartido en varios almacenes (en una BD temporal). Medir en MySQL/PostgreSQL: "
+            "SQLite bloquea toda la BD en cada escritura.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help="Pedidos simultáneos.")
+        parser.add_argument('--pedidos', type=int, default=200, help="Pedidos por hilo.")
+        parser.add_argument('--almacenes', type=int, default=8, help="Almacenes del modo repartido.")
+        parser.add_argument('--productos', type=int, default=1, help="Productos 'calientes' por pedido.")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stderr.write("Aviso: con SQLite las escrituras se serializan igual en ambos modos; "
+                              "los números solo son representativos en MySQL/PostgreSQL.")
+        with base_de_datos_temporal():
+            PersonalDelivery.objects.create(dni='70000000', nombres='Repartidor', apellidos='Bench', capacidad=10 ** 6)
+            categoria = Categoria.objects.create(nombre='Bench')
+
+            self.stdout.write(f"{'modo':>12} {'filas':>6} {'pedidos/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'errores':>8}")
+            for modo, almacenes in (('fila única', 1), ('por almacén', options['almacenes'])):
+                series, clientes = self.preparar(modo, almacenes, categoria, options)
+                tiempos, errores, segundos = self.correr(series, clientes, options)
+                self.stdout.write(
+                    f"{modo:>12} {almacenes:>6} {len(tiempos) / segundos:>10.0f} "
+                    f"{statistics.median(tiempos) * 1000:>8.2f} "
+                    f"{statistics.quantiles(tiempos, n=20)[18] * 1000:>8.2f} {errores:>8}"
+                )
+
+    def preparar(self, modo, almacenes, categoria, options):
+        """Productos con stock de sobra, repartido en 'almacenes' filas; un cliente por hilo."""
+        prefijo = 'U' if almacenes == 1 else 'R'
+        lista = [Almacen.objects.create(nombre=f"{modo} {a}", distrito=f"Distrito {prefijo}{a}", prioridad=1)
+                 for a in range(almacenes)]
+        total = options['hilos'] * options['pedidos'] * 10
+        series = [f"{prefijo}-{i}" for i in range(options['productos'])]
+        for serie in series:
+            producto = Producto.objects.create(numero_serie=serie, nombre=serie, precio=10, stock=total,
+                                               categoria=categoria)
+            StockAlmacen.objects.bulk_create([
+                StockAlmacen(producto=producto, almacen=almacen, stock=total // almacenes) for almacen in lista
+            ])
+        # Cada hilo compra desde un distrito: en el modo repartido le toca "su" almacén
+        clientes = [
+            Cliente.objects.create(dni=f"{prefijo}{h}", nombres='Cliente', apellidos='Bench',
+                                   correo=f"{prefijo}{h}@bench.pe", distrito=f"Distrito {prefijo}{h % almacenes}").dni
+            for h in range(options['hilos'])
+        ]
+        return series, clientes
+
+    def correr(self, series, clientes, options):
+        tiempos = []
+        errores = [0]
+        primer_error = []
+        candado = threading.Lock()
+        inicio = threading.Barrier(len(clientes) + 1)
+
+        def comprar(dni):
+            propios = []
+            try:
+                inicio.wait()
+                solicitud = [{'cliente_dni': dni, 'personal_dni': '70000000',
+                              'productos': [{'serie': serie, 'cantidad': 1} for serie in series]}]
+                for _ in range(options['pedidos']):
+                    with Cronometro() as c:
+                        try:
+                            resultado = pedidos.crear_pedidos(solicitud)[0]
+                            ok, error = resultado['ok'], resultado.get('error')
+                        except Exception as e:
+                            ok, error = False, repr(e)  # Bloqueos mutuos o tiempo de espera agotado
+                    propios.append(c.segundos)
+                    if not ok:
+                        with candado:
+                            errores[0] += 1
+                            primer_error[:] = primer_error or [error]
+            finally:
+                connections.close_all()  # Conexiones propias del hilo
+                with candado:
+                    tiempos.extend(propios)
+
+        hilos = [threading.Thread(target=comprar, args=(dni,)) for dni in clientes]
+        for hilo in hilos:
+            hilo.start()
+        with Cronometro() as total:
+            inicio.wait()
+            for hilo in hilos:
+                hilo.join()
+        if primer_error:
+            self.stderr.write(f"Primer error: {primer_error[0]}")
+        return tiempos, errores[0], total.segundos
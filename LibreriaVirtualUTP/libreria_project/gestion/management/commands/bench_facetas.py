@@ -0,0 +1,89 @@
+import random
+import statistics
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from gestion import facetas
+from gestion.models import Categoria, Producto
+from ._bench import base_de_datos_temporal, Cronometro
+
+COLORES = ['Azul', 'Negro', 'Rojo', 'Verde', 'Blanco', 'Amarillo', 'Rosado', 'Surtido', 'Gris', None]
+DIMENSIONES = ['A4', 'A5', 'Oficio', 'Carta', '15 cm', '30 cm', '50 cm', 'Unitalla', None]
+
+
+class Command(BaseCommand):
+    help = ("Facetas del catálogo: conteos leídos de ConteoFaceta vs. un GROUP BY por faceta sobre "
+            "Producto, y páginas por cursor, con un catálogo sintético (en una BD temporal).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=200000)
+        parser.add_argument('--categorias', type=int, default=50)
+        parser.add_argument('--repeticiones', type=int, default=50)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        with base_de_datos_temporal():
+            categorias = Categoria.objects.bulk_create(
+                [Categoria(nombre=f"Categoría {i}") for i in range(options['categorias'])])
+            with Cronometro() as carga:
+                for inicio in range(0, options['productos'], 10000):
+                    with transaction.atomic():
+                        Producto.objects.bulk_create([
+                            Producto(numero_serie=f"B-{i:08d}", nombre=f"Producto {i}",
+                                     precio=Decimal(rnd.randint(100, 50000)) / 100,
+                                     stock=rnd.choice((0, 0, rnd.randint(1, 500))),
+                                     categoria=rnd.choice(categorias), color=rnd.choice(COLORES),
+                                     dimensiones=rnd.choice(DIMENSIONES))
+                            for i in range(inicio, min(inicio + 10000, options['productos']))
+                        ], batch_size=2000)
+            with Cronometro() as rehacer:
+                filas = facetas.recalcular()
+            self.stdout.write(f"{options['productos']} productos cargados en {carga.segundos:.0f} s; "
+                              f"recalcular_facetas: {filas} filas en {rehacer.segundos:.1f} s")
+
+            categoria = categorias[len(categorias) // 2].pk
+            repeticiones = options['repeticiones']
+            self.medir("contar() con categoría", repeticiones, lambda: facetas.contar(categoria))
+            self.medir("contar() sin categoría", repeticiones, lambda: facetas.contar())
+            self.medir("GROUP BY por faceta", max(1, repeticiones // 10), lambda: self.agrupar(categoria))
+            elegidos = {'categoria': categoria, 'color': 'rojo', 'stock': 'si'}
+            _, medio = facetas.pagina_productos(elegidos, tamano=options['productos'] // len(categorias) // 40)
+            self.medir("página por cursor (filtrada)", repeticiones,
+                       lambda: facetas.pagina_productos(elegidos, despues=medio))
+
+            series = list(Producto.objects.filter(categoria_id=categoria).values_list('pk', flat=True)[:1000])
+
+            def modificar():
+                with transaction.atomic():
+                    producto = Producto.objects.select_for_update().get(pk=rnd.choice(series))
+                    antes = facetas.de_producto(producto)
+                    producto.color = rnd.choice(COLORES)
+                    producto.save(update_fields=['color'])
+                    facetas.registrar(antes, facetas.de_producto(producto))
+            self.medir("modificar un producto (con facetas)", repeticiones, modificar)
+
+    def agrupar(self, categoria):
+        """Lo mismo que contar(categoria), pero con un GROUP BY sobre Producto por faceta."""
+        productos = Producto.objects.order_by()
+        bandas = {etiqueta: Count('pk', filter=Q(precio__gte=desde) & (Q(precio__lt=hasta) if hasta else Q()))
+                  for etiqueta, desde, hasta in facetas.RANGOS_PRECIO}
+        return (
+            list(productos.values('categoria_id').annotate(n=Count('pk'))),
+            list(productos.filter(categoria_id=categoria).values('color').annotate(n=Count('pk'))),
+            list(productos.filter(categoria_id=categoria).values('dimensiones').annotate(n=Count('pk'))),
+            productos.filter(categoria_id=categoria).aggregate(si=Count('pk', filter=Q(stock__gt=0)),
+                                                               no=Count('pk', filter=Q(stock=0)), **bandas),
+        )
+
+    def medir(self, nombre, repeticiones, funcion):
+        tiempos = []
+        for _ in range(repeticiones):
+            with Cronometro() as c:
+                funcion()
+            tiempos.append(c.segundos * 1000)
+        p95 = statistics.quantiles(tiempos, n=20)[18] if len(tiempos) > 1 else tiempos[0]
+        self.stdout.write(f"{nombre:>38}: p50 {statistics.median(tiempos):8.2f} ms  p95 {p95:8.2f} ms")
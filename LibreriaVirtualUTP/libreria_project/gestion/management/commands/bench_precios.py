@@ -0,0 +1,71 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from gestion.precios import TablaPrecios
+
+
+class Command(BaseCommand):
+    help = "Benchmark del motor de precios con catálogo, reglas y carritos sintéticos (no usa la BD)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carritos', type=int, default=50000)
+        parser.add_argument('--productos', type=int, default=20000)
+        parser.add_argument('--categorias', type=int, default=200)
+        parser.add_argument('--promociones', type=int, default=2000)
+        parser.add_argument('--max-lineas', type=int, default=8)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        categorias = list(range(1, options['categorias'] + 1))
+        catalogo = [
+            (f"SERIE-{i:06d}", rnd.choice(categorias), Decimal(rnd.randint(100, 50000)) / 100)
+            for i in range(options['productos'])
+        ]
+
+        descuentos = [(cat, Decimal(rnd.choice([5, 10, 15]))) for cat in rnd.sample(categorias, len(categorias) // 5)]
+        promociones = []
+        for i in range(options['promociones']):
+            serie, cat, _ = rnd.choice(catalogo)
+            alcance = rnd.random()
+            general = alcance >= 0.995  # Pocas y solo por volumen (si no, todo tendría descuento)
+            promociones.append((
+                f"Promo {i}",
+                serie if alcance < 0.8 else None,
+                cat if 0.8 <= alcance < 0.995 else None,
+                Decimal(rnd.choice([5, 10, 20, 30])),
+                6 if general else rnd.choice([1, 1, 2, 3, 6]),
+            ))
+
+        inicio = time.perf_counter()
+        tabla = TablaPrecios('0.18', descuentos, promociones)
+        tiempo_compilar = time.perf_counter() - inicio
+
+        # Unos pocos productos concentran la mayoría de las ventas
+        pesos = [1 / (i + 1) for i in range(len(catalogo))]
+        carritos = []
+        lineas_total = 0
+        for _ in range(options['carritos']):
+            n = rnd.randint(1, options['max_lineas'])
+            elegidos = {p[0]: p for p in rnd.choices(catalogo, pesos, k=n)}
+            carrito = [(serie, cat, precio, rnd.randint(1, 6)) for serie, cat, precio in elegidos.values()]
+            carritos.append(carrito)
+            lineas_total += len(carrito)
+
+        inicio = time.perf_counter()
+        con_descuento = 0
+        for carrito in carritos:
+            if tabla.cotizar(carrito)['descuento']:
+                con_descuento += 1
+        tiempo = time.perf_counter() - inicio
+
+        self.stdout.write(f"Productos: {len(catalogo)}  Categorías con descuento: {len(descuentos)}  "
+                          f"Promociones: {len(promociones)}")
+        self.stdout.write(f"Compilar la tabla: {tiempo_compilar * 1000:.1f} ms")
+        self.stdout.write(f"Carritos: {len(carritos)}  Líneas promedio: {lineas_total / len(carritos):.1f}  "
+                          f"Con descuento: {con_descuento}")
+        self.stdout.write(f"cotizar(): {len(carritos) / tiempo:,.0f} carritos/s "
+                          f"({tiempo / len(carritos) * 1e6:.1f} µs por carrito)")
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from gestion.models import Cliente, PersonalDelivery, Pedido
+from ._bench import base_de_datos_temporal, Cronometro
+
+
+class Command(BaseCommand):
+    help = ("Consultas a la BD por request en registrar_entrega_view con cada motor de sesiones "
+            "(en una BD temporal).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help="Requests por motor y por tipo (por defecto 500).")
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        with base_de_datos_temporal():
+            usuario = User.objects.create_user('bench', password='bench')
+            cliente = Cliente.objects.create(dni='40000000', nombres='Cliente', apellidos='Bench',
+                                             correo='c@bench.pe', distrito='Lince')
+            personal = PersonalDelivery.objects.create(dni='70000000', nombres='Repartidor', apellidos='Bench')
+            Pedido.objects.bulk_create([
+                Pedido(cliente=cliente, personal_delivery=personal) for _ in range(n * len(settings.MOTORES_SESION))
+            ])
+            pendientes = iter(list(Pedido.objects.order_by('numero_pedido').values_list('numero_pedido', flat=True)))
+            # La búsqueda se hace sobre otro cliente con pocos pedidos: así la página
+            # pesa lo mismo en todas las pasadas y solo cambia el motor de sesiones
+            buscado = Cliente.objects.create(dni='40000001', nombres='Otro', apellidos='Bench',
+                                             correo='o@bench.pe', distrito='Lince')
+            Pedido.objects.bulk_create([Pedido(cliente=buscado, personal_delivery=personal) for _ in range(10)])
+
+            self.stdout.write(f"{'motor':>10} {'request':>16} {'consultas':>10} {'de sesión':>10} {'ms':>7}")
+            for nombre, motor in settings.MOTORES_SESION.items():
+                with override_settings(SESSION_ENGINE=motor):
+                    cliente_http = Client()
+                    cliente_http.force_login(usuario)
+                    busqueda = {'buscar': '1', 'tipo_busqueda': 'dni_cliente', 'valor_busqueda': buscado.dni}
+
+                    def buscar():
+                        return cliente_http.get('/pedidos/registrar-entrega/', busqueda)
+
+                    def entregar():
+                        # POST + redirect con el mensaje de éxito (el mensaje va y vuelve)
+                        return cliente_http.post('/pedidos/registrar-entrega/', {
+                            'registrar': '1', 'pedido_id': next(pendientes),
+                            'fecha_entrega': '2030-01-15', 'observaciones_entrega': 'Bench',
+                        }, follow=True)
+
+                    for etiqueta, hacer in (('GET búsqueda', buscar), ('POST + redirect', entregar)):
+                        consultas = de_sesion = 0
+                        with Cronometro() as c:
+                            for _ in range(n):
+                                connection.queries_log.clear()
+                                with CaptureQueriesContext(connection) as ctx:
+                                    respuesta = hacer()
+                                consultas += len(ctx)
+                                de_sesion += sum('django_session' in q['sql'] for q in ctx.captured_queries)
+                        if respuesta.status_code != 200:
+                            self.stderr.write(f"{nombre}: respuesta {respuesta.status_code}")
+                        self.stdout.write(f"{nombre:>10} {etiqueta:>16} {consultas / n:>10.1f} "
+                                          f"{de_sesion / n:>10.1f} {c.segundos / n * 1000:>7.2f}")
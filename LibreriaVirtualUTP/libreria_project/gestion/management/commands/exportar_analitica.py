@@ -0,0 +1,81 @@
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from gestion import analitica
+
+
+class Command(BaseCommand):
+    help = "Exporta el reporte de ventas (una tabla por archivo) en CSV o Parquet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help="Carpeta donde se escriben los archivos.")
+        parser.add_argument('--formato', choices=('csv', 'parquet'), default='csv',
+                            help="Parquet requiere el paquete 'pyarrow'.")
+        parser.add_argument('--desde', help="AAAA-MM-DD")
+        parser.add_argument('--hasta', help="AAAA-MM-DD")
+        parser.add_argument('--sin-archivo', action='store_true',
+                            help="No incluir los pedidos archivados.")
+        parser.add_argument('--bloque', type=int, default=analitica.TAMANO_BLOQUE,
+                            help="Líneas de pedido por consulta.")
+
+    def handle(self, *args, **options):
+        escribir = self.escribir_csv
+        if options['formato'] == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise CommandError("Para exportar en Parquet instale 'pyarrow' (pip install pyarrow).")
+            escribir = self.escribir_parquet
+
+        fechas = {}
+        for nombre in ('desde', 'hasta'):
+            if options[nombre]:
+                fechas[nombre] = parse_date(options[nombre])
+                if fechas[nombre] is None:
+                    raise CommandError(f"Fecha inválida en --{nombre}: {options[nombre]}")
+
+        try:
+            reporte = analitica.reporte_ventas(incluir_archivo=not options['sin_archivo'],
+                                               tamano=options['bloque'], **fechas)
+        except analitica.AnaliticaNoDisponible as e:
+            raise CommandError(str(e))
+
+        salida = Path(options['salida'])
+        salida.mkdir(parents=True, exist_ok=True)
+        meses = max((len(c['retencion']) for c in reporte['cohortes']), default=0)
+        tablas = {
+            'ventas_por_mes': reporte['por_periodo'],
+            'ventas_por_categoria': reporte['por_categoria'],
+            'ventas_por_distrito': reporte['por_distrito'],
+            'ventas_por_repartidor': reporte['por_repartidor'],
+            'productos_abc': reporte['productos_abc'],
+            'retencion_cohortes': [
+                {'cohorte': c['cohorte'], 'clientes': c['clientes'],
+                 **{f"mes_{m}": (c['retencion'][m] if m < len(c['retencion']) else None) for m in range(meses)}}
+                for c in reporte['cohortes']
+            ],
+        }
+        for nombre, filas in tablas.items():
+            archivo = salida / f"{nombre}.{options['formato']}"
+            escribir(archivo, filas)
+            self.stdout.write(f"  {archivo} ({len(filas)} filas)")
+        self.stdout.write(self.style.SUCCESS(
+            f"{reporte['lineas']} líneas de pedido analizadas; ingresos S/ {reporte['ingresos_total']:.2f}."))
+
+    def escribir_csv(self, archivo, filas):
+        with open(archivo, 'w', newline='', encoding='utf-8') as f:
+            if not filas:
+                return
+            escritor = csv.DictWriter(f, fieldnames=list(filas[0]))
+            escritor.writeheader()
+            escritor.writerows(filas)
+
+    def escribir_parquet(self, archivo, filas):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Los montos (Decimal) se guardan como decimal128 de pyarrow: sin pérdida
+        pq.write_table(pa.Table.from_pylist(filas), archivo)
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from gestion import cambios
+
+
+class Command(BaseCommand):
+    help = ("Escribe el feed de cambios desde un cursor, un evento JSON por línea, por lotes. "
+            "Al final informa el cursor para la próxima ejecución.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=int, default=0,
+                            help="Último 'seq' ya procesado (0 = desde el principio).")
+        parser.add_argument('--lote', type=int, default=1000, help="Eventos por consulta.")
+        parser.add_argument('--entidad', action='append', choices=[e for e, _ in cambios.EventoCambio.ENTIDAD_CHOICES],
+                            help="Solo estas entidades (se puede repetir).")
+        parser.add_argument('--salida', help="Archivo .jsonl (por defecto, la salida estándar).")
+
+    def handle(self, *args, **options):
+        salida = open(options['salida'], 'a', encoding='utf-8') if options['salida'] else self.stdout
+        cursor = options['desde']
+        # leer() no devuelve más de LIMITE_MAXIMO por consulta: un lote más grande no es el final del feed
+        lote = max(1, min(options['lote'], cambios.LIMITE_MAXIMO))
+        total = 0
+        try:
+            while True:
+                eventos, cursor = cambios.leer(cursor, lote, options['entidad'])
+                for evento in eventos:
+                    salida.write(json.dumps(cambios.como_dict(evento), cls=DjangoJSONEncoder,
+                                            ensure_ascii=False) + '\n')
+                total += len(eventos)
+                if len(eventos) < lote:
+                    break
+        finally:
+            if options['salida']:
+                salida.close()
+        # El cursor va a stderr para no mezclarse con los eventos
+        self.stderr.write(f"{total} evento(s). Siguiente cursor: {cursor}")
@@ -0,0 +1,42 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ("Borra las sesiones vencidas de la tabla django_session por lotes "
+            "(a diferencia de 'clearsessions', que lo hace en un solo DELETE).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help="Sesiones por DELETE (por defecto 1000).")
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help="Segundos de espera entre lotes, para no competir con el tráfico.")
+
+    def handle(self, *args, **options):
+        motor = import_module(settings.SESSION_ENGINE)
+        # Solo db y cached_db guardan en la tabla; en cache y cookie las sesiones vencen solas
+        if not hasattr(motor.SessionStore, 'get_model_class'):
+            self.stdout.write(f"El motor de sesiones {settings.SESSION_ENGINE} no usa la BD: nada que limpiar.")
+            return
+
+        Session = motor.SessionStore.get_model_class()
+        ahora = timezone.now()
+        total = 0
+        while True:
+            # DELETE por clave primaria: cada lote bloquea solo sus filas
+            claves = list(
+                Session.objects.filter(expire_date__lt=ahora)
+                .values_list('session_key', flat=True)[:options['lote']]
+            )
+            if not claves:
+                break
+            Session.objects.filter(session_key__in=claves).delete()
+            total += len(claves)
+            self.stdout.write(f"  ... {total} sesión(es) borradas")
+            if options['pausa']:
+                time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f"{total} sesión(es) vencidas borradas."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from gestion import facetas
+
+
+class Command(BaseCommand):
+    help = ("Rehace los conteos de las facetas del catálogo (ConteoFaceta) desde los productos activos. "
+            "Ejecutar con poco tráfico: un cambio de producto durante la pasada puede quedar fuera.")
+
+    def handle(self, *args, **options):
+        total = facetas.recalcular()
+        self.stdout.write(self.style.SUCCESS(f"{total} conteo(s) de faceta recalculado(s)."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from gestion import historial
+
+
+class Command(BaseCommand):
+    help = ("Rehace los totales históricos de los clientes (ResumenCliente) desde sus pedidos, "
+            "vigentes y archivados. Ejecutar con poco tráfico: no bloquea los pedidos nuevos.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('dni', nargs='*', help="Solo estos clientes (por defecto, todos).")
+
+    def handle(self, *args, **options):
+        total = historial.recalcular(options['dni'] or None)
+        self.stdout.write(self.style.SUCCESS(f"{total} resumen(es) de cliente recalculado(s)."))
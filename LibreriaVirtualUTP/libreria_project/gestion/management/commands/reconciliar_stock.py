@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion import inventario
+
+
+class Command(BaseCommand):
+    help = ("Verifica Producto.stock contra el kardex (snapshot + movimientos) en una sola pasada, "
+            "y contra la suma de su stock por almacén.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=2000,
+                            help="Filas leídas por viaje a la BD (por defecto 2000).")
+        parser.add_argument('--corregir-totales', action='store_true',
+                            help="Recalcula Producto.stock desde los almacenes donde no coincida.")
+
+    def handle(self, *args, **options):
+        desfasados = list(inventario.totales_desfasados(chunk_size=options['chunk']))
+        for serie, stock, en_almacenes in desfasados:
+            self.stdout.write(f"{serie}: Producto.stock={stock} almacenes={en_almacenes}")
+        if desfasados and options['corregir_totales']:
+            inventario.actualizar_totales([serie for serie, _, _ in desfasados])
+            self.stdout.write(self.style.SUCCESS(f"{len(desfasados)} total(es) recalculado(s)."))
+            desfasados = []
+
+        diferencias = 0
+        for serie, stock, esperado in inventario.reconciliar(chunk_size=options['chunk']):
+            diferencias += 1
+            self.stdout.write(f"{serie}: Producto.stock={stock} kardex={esperado} (diferencia {stock - esperado:+d})")
+
+        if diferencias or desfasados:
+            # Código de salida != 0 para que cron/CI lo detecte
+            raise CommandError(f"{diferencias} producto(s) no cuadran con el kardex y "
+                               f"{len(desfasados)} con sus almacenes.")
+        else:
+            self.stdout.write(self.style.SUCCESS("El stock de todo el catálogo cuadra con el kardex y con sus almacenes."))
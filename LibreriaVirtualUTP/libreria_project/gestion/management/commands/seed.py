@@ -0,0 +1,270 @@
+import itertools
+import random
+import unicodedata
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from gestion import asignacion, facetas, historial, inventario, precios
+from gestion.models import (
+    Almacen, Categoria, Cliente, DetallePedido, MovimientoStock, Pedido, PersonalDelivery, Producto,
+    SnapshotStock, StockAlmacen,
+)
+from ._bench import Cronometro
+
+# Distritos de Lima con un peso aproximado a su población: los pedidos se concentran donde vive la gente
+DISTRITOS = {
+    'San Juan de Lurigancho': 11, 'San Martín de Porres': 7, 'Ate': 6, 'Comas': 5, 'Villa El Salvador': 4,
+    'Villa María del Triunfo': 4, 'San Juan de Miraflores': 4, 'Los Olivos': 4, 'Puente Piedra': 3,
+    'Santiago de Surco': 3, 'Chorrillos': 3, 'Carabayllo': 3, 'Independencia': 2, 'El Agustino': 2,
+    'La Victoria': 2, 'Santa Anita': 2, 'San Miguel': 1, 'Rímac': 1, 'Cercado de Lima': 3, 'La Molina': 1,
+    'San Borja': 1, 'Miraflores': 1, 'Surquillo': 1, 'Breña': 1, 'Lince': 1, 'Jesús María': 1,
+    'Pueblo Libre': 1, 'Magdalena del Mar': 1, 'San Isidro': 1, 'Barranco': 1,
+}
+NOMBRES = [
+    'José', 'Luis', 'Carlos', 'Juan', 'Jorge', 'Miguel', 'César', 'Víctor', 'Pedro', 'Manuel', 'Jesús',
+    'Diego', 'Renzo', 'Alejandro', 'Kevin', 'María', 'Rosa', 'Carmen', 'Ana', 'Luz', 'Julia', 'Juana',
+    'Elena', 'Lucía', 'Sofía', 'Valeria', 'Camila', 'Fiorella', 'Milagros', 'Flor',
+]
+APELLIDOS = [
+    'Quispe', 'Flores', 'Sánchez', 'Rodríguez', 'García', 'Rojas', 'Mamani', 'Huamán', 'Vásquez', 'Chávez',
+    'Ramírez', 'Torres', 'Mendoza', 'Castillo', 'Díaz', 'Gonzales', 'Pérez', 'López', 'Espinoza', 'Ruiz',
+    'Vargas', 'Condori', 'Cruz', 'Gutiérrez', 'Ramos', 'Reyes', 'Romero', 'Salazar', 'Paredes', 'Choque',
+]
+ARTICULOS = {
+    'Cuadernos': ['Cuaderno A4 cuadriculado', 'Cuaderno A4 rayado', 'Cuaderno triple renglón', 'Block de notas'],
+    'Escritura': ['Lapicero azul', 'Lapicero rojo', 'Lápiz 2B', 'Resaltador', 'Plumón indeleble'],
+    'Arte': ['Témperas x 12', 'Colores x 24', 'Plastilina', 'Cartulina dúplex', 'Papel crepé'],
+    'Oficina': ['Archivador lomo ancho', 'Engrapador', 'Perforador', 'Folder manila', 'Clips x 100'],
+    'Libros escolares': ['Libro de Comunicación', 'Libro de Matemática', 'Atlas del Perú', 'Diccionario escolar'],
+    'Mochilas': ['Mochila escolar', 'Cartuchera', 'Lonchera'],
+    'Tecnología': ['Calculadora científica', 'USB 32 GB', 'Mouse inalámbrico', 'Audífonos'],
+}
+MARCAS = ['Standford', 'Justus', 'Faber-Castell', 'Artesco', 'Pilot', 'Vinifan', 'Layconsa', 'Alpha', 'Atlas']
+# Para las facetas del catálogo; None = sin dato
+COLORES = ['Azul', 'Negro', 'Rojo', 'Verde', 'Blanco', 'Amarillo', 'Rosado', 'Surtido', None]
+DIMENSIONES = ['A4', 'A5', 'Oficio', 'Carta', '15 cm', '30 cm', 'Unitalla', None]
+
+
+def _ascii(texto):
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode().lower().replace(' ', '')
+
+
+def _insertar(modelo, campos, filas, batch):
+    """
+    INSERT de muchas filas con executemany. Es lo que hace bulk_create, sin
+    compilar el SQL ni preparar cada valor en el ORM: a millones de líneas,
+    eso era casi todo el tiempo de la carga. Las filas traen los valores ya
+    adaptados a la BD (connection.ops.adapt_*); la tabla y las columnas
+    salen del modelo.
+    """
+    q = connection.ops.quote_name
+    columnas = ', '.join(q(modelo._meta.get_field(campo).column) for campo in campos)
+    sql = f"INSERT INTO {q(modelo._meta.db_table)} ({columnas}) VALUES ({', '.join(['%s'] * len(campos))})"
+    with connection.cursor() as cursor:
+        for desde in range(0, len(filas), batch):
+            cursor.executemany(sql, filas[desde:desde + batch])
+
+
+class Command(BaseCommand):
+    help = ("Genera datos sintéticos para pruebas de volumen: categorías, clientes (DNI de 8 dígitos, "
+            "distritos de Lima), repartidores, productos con stock por almacén y pedidos con sus líneas "
+            "y su kardex. La popularidad de los productos sigue una ley de Zipf. Con la misma --semilla "
+            "(y --hasta) genera exactamente los mismos datos. Solo sobre una BD sin clientes, productos "
+            "ni pedidos.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semilla', type=int, default=7)
+        parser.add_argument('--categorias', type=int, default=len(ARTICULOS))
+        parser.add_argument('--clientes', type=int, default=10000)
+        parser.add_argument('--repartidores', type=int, default=50)
+        parser.add_argument('--productos', type=int, default=5000)
+        parser.add_argument('--pedidos', type=int, default=100000)
+        parser.add_argument('--lineas-max', type=int, default=5, help="Líneas por pedido: de 1 a N.")
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help="Exponente de Zipf: cuanto mayor, más se concentran las ventas.")
+        parser.add_argument('--almacenes', type=int, default=0,
+                            help="Almacenes adicionales en los distritos con más pedidos.")
+        parser.add_argument('--dias', type=int, default=365, help="Los pedidos cubren los últimos N días.")
+        parser.add_argument('--hasta', help="Fecha del último pedido (AAAA-MM-DD); por defecto, hoy.")
+        parser.add_argument('--lote', type=int, default=5000, help="Pedidos por transacción.")
+        parser.add_argument('--batch', type=int, default=2000, help="Filas por INSERT (bulk_create).")
+        parser.add_argument('--sin-kardex', action='store_true',
+                            help="No escribe un movimiento por línea: deja un snapshot por producto "
+                                 "(la mitad de filas; el kardex no tendrá la historia de ventas).")
+
+    def handle(self, *args, **options):
+        if Pedido.objects.exists() or Cliente.todos.exists() or Producto.todos.exists():
+            raise CommandError("La BD ya tiene clientes, productos o pedidos: use una BD vacía.")
+        self.rnd = random.Random(options['semilla'])
+        self.batch = options['batch']
+        if options['hasta']:
+            fin = timezone.make_aware(datetime.strptime(options['hasta'], '%Y-%m-%d') + timedelta(hours=20))
+        else:
+            fin = timezone.now().replace(microsecond=0)
+        inicio = fin - timedelta(days=options['dias'])
+
+        with Cronometro() as total:
+            with transaction.atomic():
+                categorias = self.crear_categorias(options['categorias'])
+                clientes, repartidores = self.crear_personas(options['clientes'], options['repartidores'])
+                almacenes = self.crear_almacenes(options['almacenes'])
+                productos = self.crear_productos(options['productos'], categorias, almacenes)
+            self.stdout.write(f"Catálogo: {len(categorias)} categorías, {len(clientes)} clientes, "
+                              f"{len(repartidores)} repartidores, {len(productos)} productos, "
+                              f"{len(almacenes)} almacén(es).")
+
+            lineas = self.crear_pedidos(options, clientes, repartidores, productos, almacenes, inicio, fin)
+            with transaction.atomic():
+                self.cerrar_kardex(productos, almacenes, inicio, fin, options['sin_kardex'])
+
+            # Sin reiniciar las secuencias, PostgreSQL repetiría los ids explícitos
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Pedido, DetallePedido, MovimientoStock]):
+                    cursor.execute(sql)
+            historial.recalcular()
+            facetas.recalcular()
+            asignacion.invalidar()
+            precios.invalidar()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['pedidos']} pedidos y {lineas} líneas en {total.segundos:.0f} s "
+            f"({lineas / total.segundos:.0f} líneas/s)."))
+
+    def crear_categorias(self, cantidad):
+        nombres = list(itertools.islice(itertools.chain(ARTICULOS, (f"Categoría {i}" for i in itertools.count(1))),
+                                        cantidad))
+        return Categoria.objects.bulk_create([Categoria(nombre=nombre) for nombre in nombres])
+
+    def crear_personas(self, clientes, repartidores):
+        # DNI peruano: 8 dígitos, sin repetir entre clientes y repartidores
+        dnis = [str(dni) for dni in self.rnd.sample(range(10000000, 80000000), clientes + repartidores)]
+        distritos, pesos = list(DISTRITOS), list(DISTRITOS.values())
+        lista = []
+        for dni in dnis[:clientes]:
+            nombre, paterno, materno = (self.rnd.choice(NOMBRES), self.rnd.choice(APELLIDOS),
+                                        self.rnd.choice(APELLIDOS))
+            lista.append(Cliente(
+                dni=dni, nombres=nombre, apellidos=f"{paterno} {materno}",
+                direccion=f"Av. {self.rnd.choice(APELLIDOS)} {self.rnd.randint(100, 3999)}",
+                distrito=self.rnd.choices(distritos, pesos)[0],
+                correo=f"{_ascii(nombre)}.{_ascii(paterno)}.{dni}@correo.pe",
+                celular=f"9{self.rnd.randint(0, 99999999):08d}",
+            ))
+        Cliente.objects.bulk_create(lista, batch_size=self.batch)
+        PersonalDelivery.objects.bulk_create([
+            PersonalDelivery(dni=dni, nombres=self.rnd.choice(NOMBRES), apellidos=self.rnd.choice(APELLIDOS),
+                             celular=f"9{self.rnd.randint(0, 99999999):08d}", capacidad=self.rnd.randint(15, 40))
+            for dni in dnis[clientes:]
+        ], batch_size=self.batch)
+        return [(c.dni, c.distrito) for c in lista], dnis[clientes:]
+
+    def crear_almacenes(self, adicionales):
+        """{distrito o None: id}; None es el almacén principal (despacha a los demás distritos)."""
+        almacenes = {None: inventario.almacen_principal()}
+        for distrito in sorted(DISTRITOS, key=DISTRITOS.get, reverse=True)[:adicionales]:
+            almacen = Almacen.objects.create(nombre=f"Almacén {distrito}", distrito=distrito, prioridad=10)
+            almacenes[inventario._distrito(distrito)] = almacen.id
+        return almacenes
+
+    def crear_productos(self, cantidad, categorias, almacenes):
+        """[(serie, precio, {almacen_id: stock final})] en orden de popularidad (el primero, el más vendido)."""
+        productos = []
+        for i in range(cantidad):
+            categoria = self.rnd.choice(categorias)
+            articulo = self.rnd.choice(ARTICULOS.get(categoria.nombre) or [a for v in ARTICULOS.values() for a in v])
+            productos.append((
+                Producto(numero_serie=f"LIB-{i:07d}", nombre=f"{articulo} {self.rnd.choice(MARCAS)}",
+                         precio=Decimal(self.rnd.randint(150, 25000)) / 100, categoria=categoria,
+                         color=self.rnd.choice(COLORES), dimensiones=self.rnd.choice(DIMENSIONES)),
+                {almacen: self.rnd.randint(0, 300) for almacen in almacenes.values()},
+            ))
+        for producto, stock in productos:
+            producto.stock = sum(stock.values())
+        Producto.objects.bulk_create([p for p, _ in productos], batch_size=self.batch)
+        StockAlmacen.objects.bulk_create([
+            StockAlmacen(producto_id=p.numero_serie, almacen_id=almacen, stock=n)
+            for p, stock in productos for almacen, n in stock.items()
+        ], batch_size=self.batch)
+        self.rnd.shuffle(productos)  # Los más vendidos no son los primeros del catálogo
+        precio = connection.ops.adapt_decimalfield_value
+        return [(p.numero_serie, precio(p.precio, 10, 2), stock) for p, stock in productos]
+
+    def crear_pedidos(self, options, clientes, repartidores, productos, almacenes, inicio, fin):
+        """Pedidos en orden cronológico, en transacciones de --lote pedidos. Devuelve las líneas creadas."""
+        total = options['pedidos']
+        rnd = self.rnd
+        rangos = range(len(productos))
+        acumulados = list(itertools.accumulate(1 / (rango + 1) ** options['zipf'] for rango in rangos))
+        # Lo vendido por (producto, almacén): la carga inicial del kardex se escribe al final
+        self.vendido = defaultdict(int)
+        pedido_id = (Pedido.objects.aggregate(m=Max('numero_pedido'))['m'] or 0) + 1
+        detalle_id = (DetallePedido.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        paso = (fin - inicio) / max(total, 1)
+        recientes = fin - timedelta(days=2)  # Los pedidos de los últimos dos días siguen pendientes
+        lineas = 0
+
+        adaptar_fecha, adaptar_dia = connection.ops.adapt_datetimefield_value, connection.ops.adapt_datefield_value
+        for desde in range(0, total, options['lote']):
+            pedidos, detalles, movimientos = [], [], []
+            for k in range(desde, min(desde + options['lote'], total)):
+                fecha = inicio + paso * (k + rnd.random())
+                dni, distrito = rnd.choice(clientes)
+                if fecha >= recientes:
+                    estado, entrega = 'Pendiente', None
+                elif rnd.random() < 0.04:
+                    estado, entrega = 'Cancelado', None
+                else:
+                    estado, entrega = 'Entregado', adaptar_dia((fecha + timedelta(days=rnd.randint(1, 3))).date())
+                fecha = adaptar_fecha(fecha)
+                pedidos.append((pedido_id, fecha, entrega, estado, dni, rnd.choice(repartidores)))
+                almacen = almacenes.get(inventario._distrito(distrito), almacenes[None])
+
+                elegidos = rnd.choices(rangos, cum_weights=acumulados, k=rnd.randint(1, options['lineas_max']))
+                for rango in dict.fromkeys(elegidos):  # Sin repetir producto en el pedido
+                    serie, precio, _ = productos[rango]
+                    cantidad = rnd.choice((1, 1, 1, 2, 2, 3, 5, 10))
+                    detalles.append((detalle_id, pedido_id, serie, cantidad, precio, 0))
+                    detalle_id += 1
+                    if estado == 'Cancelado':
+                        continue  # La venta y su devolución se anulan: el stock no cambia
+                    self.vendido[serie, almacen] += cantidad
+                    if not options['sin_kardex']:
+                        movimientos.append((serie, 'Venta', -cantidad, fecha, pedido_id, almacen))
+                pedido_id += 1
+
+            with transaction.atomic():
+                _insertar(Pedido, ('numero_pedido', 'fecha_pedido', 'fecha_entrega', 'estado_pedido', 'cliente',
+                                   'personal_delivery'), pedidos, self.batch)
+                _insertar(DetallePedido, ('id', 'pedido', 'producto', 'cantidad', 'precio_unitario', 'descuento'),
+                          detalles, self.batch)
+                _insertar(MovimientoStock, ('producto', 'tipo', 'cantidad', 'fecha', 'pedido', 'almacen'),
+                          movimientos, self.batch)
+            lineas += len(detalles)
+            self.stdout.write(f"  ... {desde + len(pedidos)}/{total} pedidos, {lineas} líneas")
+        return lineas
+
+    def cerrar_kardex(self, productos, almacenes, inicio, fin, sin_kardex):
+        """
+        Deja el kardex cuadrado con el stock: una importación por producto y
+        almacén (lo vendido + el stock final) fechada antes del primer pedido,
+        o con --sin-kardex un snapshot con el stock final.
+        """
+        if sin_kardex:
+            SnapshotStock.objects.bulk_create([
+                SnapshotStock(producto_id=serie, stock=sum(stock.values()), ultimo_movimiento=0, fecha=fin)
+                for serie, _, stock in productos
+            ], batch_size=self.batch)
+            return
+        carga = connection.ops.adapt_datetimefield_value(inicio - timedelta(days=1))
+        _insertar(MovimientoStock, ('producto', 'tipo', 'cantidad', 'fecha', 'almacen', 'observaciones'), [
+            (serie, 'Importacion', n + self.vendido[serie, almacen], carga, almacen, "Carga inicial (seed)")
+            for serie, _, stock in productos for almacen, n in stock.items()
+            if n + self.vendido[serie, almacen]
+        ], self.batch)
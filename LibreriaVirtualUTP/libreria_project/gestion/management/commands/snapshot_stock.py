@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from gestion import inventario
+
+
+class Command(BaseCommand):
+    help = "Guarda un snapshot del stock de cada producto según el kardex (programar periódicamente)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=2000,
+                            help="Filas leídas/insertadas por lote (por defecto 2000).")
+
+    def handle(self, *args, **options):
+        creados = inventario.tomar_snapshots(chunk_size=options['chunk'])
+        self.stdout.write(self.style.SUCCESS(f"{creados} snapshot(s) registrados."))
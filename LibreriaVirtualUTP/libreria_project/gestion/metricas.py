@@ -0,0 +1,150 @@
+"""
+Métricas de la aplicación en el formato de texto de Prometheus (GET /metrics).
+
+Se recolectan en memoria del proceso y sin dependencias: un contador es un
+número por combinación de etiquetas y un histograma, sus cubetas, la suma y
+la cantidad. Cada observación toma un candado solo para sumar; el costo por
+request es un par de perf_counter() y una llamada de Python por consulta SQL
+(connection.execute_wrapper).
+
+Cada proceso cuenta lo suyo: con varios workers, Prometheus ve los números
+del worker que atiende cada raspado (y un reinicio los pone en cero, lo que
+rate()/increase() ya tolera). Para totales exactos, un worker por
+contenedor o raspar cada worker por separado.
+
+Las etiquetas son de cardinalidad acotada a propósito: el nombre de la ruta
+(no la URL, que lleva DNIs y números de pedido), el método y el código HTTP.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from django.db import connection
+
+_candado = threading.Lock()
+REGISTRO = []
+
+METODOS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+LIMITES_DURACION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # segundos
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=''):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.valores = defaultdict(int)
+        REGISTRO.append(self)
+
+    def inc(self, *valores, cantidad=1):
+        with _candado:
+            self.valores[valores] += cantidad
+
+    def valor(self, *valores):
+        return self.valores.get(valores, 0)
+
+    def muestras(self):
+        with _candado:
+            copia = sorted(self.valores.items())
+        for valores, total in copia:
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(total)}"
+
+
+class Histograma:
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_DURACION):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        # Por etiquetas: [cuenta por cubeta (la última es +Inf), suma]
+        self.valores = defaultdict(lambda: [[0] * (len(self.limites) + 1), 0.0])
+        REGISTRO.append(self)
+
+    def observar(self, valor, *valores):
+        cubeta = bisect.bisect_left(self.limites, valor)
+        with _candado:
+            serie = self.valores[valores]
+            serie[0][cubeta] += 1
+            serie[1] += valor
+
+    def muestras(self):
+        with _candado:
+            copia = sorted((valores, list(cuentas), suma) for valores, (cuentas, suma) in self.valores.items())
+        for valores, cuentas, suma in copia:
+            acumulado = 0
+            for limite, cuenta in zip(self.limites + ('+Inf',), cuentas):
+                acumulado += cuenta
+                le = 'le="%s"' % (limite if limite == '+Inf' else _numero(float(limite)))
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acumulado}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_numero(suma)}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}"
+
+
+PETICIONES = Contador('libreria_http_peticiones_total', "Peticiones HTTP atendidas.",
+                      ('vista', 'metodo', 'estado'))
+DURACION = Histograma('libreria_http_duracion_segundos', "Tiempo de respuesta por vista.", ('vista',))
+CONSULTAS = Contador('libreria_db_consultas_total', "Consultas SQL ejecutadas, por vista.", ('vista',))
+PEDIDOS_CREADOS = Contador('libreria_pedidos_creados_total', "Pedidos grabados (contados tras el commit).")
+RESERVAS_FALLIDAS = Contador('libreria_reservas_stock_fallidas_total',
+                             "Pedidos rechazados por stock insuficiente.")
+
+
+def exportar():
+    """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+    lineas = []
+    for metrica in REGISTRO:
+        lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+        lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+        lineas.extend(metrica.muestras())
+    return '\n'.join(lineas) + '\n'
+
+
+class MetricasMiddleware:
+    """Cuenta peticiones, tiempo de respuesta y consultas SQL por vista. Va primero en MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = [0]
+
+        def contar(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contar):
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        # Nombre de la ruta, no la URL: '/clientes/123/historial/' -> 'cliente_historial'
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = (coincidencia.view_name or coincidencia._func_path) if coincidencia else 'sin_ruta'
+        metodo = request.method if request.method in METODOS else 'otro'  # Lo manda el cliente: se acota
+        PETICIONES.inc(vista, metodo, response.status_code)
+        DURACION.observar(duracion, vista)
+        if consultas[0]:
+            CONSULTAS.inc(vista, cantidad=consultas[0])
+        return response
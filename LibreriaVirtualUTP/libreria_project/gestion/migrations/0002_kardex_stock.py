@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def cargar_stock_inicial(apps, schema_editor):
+    # El stock existente entra al kardex como movimiento de importación
+    Producto = apps.get_model('gestion', 'Producto')
+    MovimientoStock = apps.get_model('gestion', 'MovimientoStock')
+    lote = [
+        MovimientoStock(producto_id=serie, tipo='Importacion', cantidad=stock, observaciones='Saldo inicial')
+        for serie, stock in Producto.objects.filter(stock__gt=0).values_list('numero_serie', 'stock').iterator()
+    ]
+    MovimientoStock.objects.bulk_create(lote, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('Venta', 'Venta'), ('Cancelacion', 'Cancelación'), ('Ajuste', 'Ajuste'), ('Importacion', 'Importación')], max_length=20)),
+                ('cantidad', models.IntegerField()),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('observaciones', models.CharField(blank=True, max_length=255, null=True)),
+                ('pedido', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='movimientos_stock', to='gestion.pedido')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='gestion.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['producto', 'id'], name='gestion_mov_product_2e39c7_idx'), models.Index(fields=['producto', 'fecha'], name='gestion_mov_product_e1ea79_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('ultimo_movimiento', models.BigIntegerField(default=0)),
+                ('fecha', models.DateTimeField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='gestion.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='gestion_sna_product_6f40bd_idx')],
+            },
+        ),
+        migrations.RunPython(cargar_stock_inicial, migrations.RunPython.noop),
+    ]
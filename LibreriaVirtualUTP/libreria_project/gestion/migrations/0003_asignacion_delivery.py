@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0002_kardex_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='personaldelivery',
+            name='capacidad',
+            field=models.PositiveIntegerField(default=20),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado_pedido', 'personal_delivery'], name='gestion_ped_estado__828d28_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0003_asignacion_delivery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['apellidos'], name='gestion_cli_apellid_5de0ed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['nombres'], name='gestion_cli_nombres_6c0c57_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['fecha_pedido'], name='gestion_ped_fecha_p_b622af_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['nombre'], name='gestion_pro_nombre_4afada_idx'),
+        ),
+    ]
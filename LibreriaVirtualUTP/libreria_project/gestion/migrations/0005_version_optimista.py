@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0004_indices_admin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0005_version_optimista'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='eliminado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='fecha_eliminacion',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='eliminado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='fecha_eliminacion',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='PedidoArchivado',
+            fields=[
+                ('numero_pedido', models.IntegerField(primary_key=True, serialize=False)),
+                ('fecha_pedido', models.DateTimeField()),
+                ('fecha_entrega', models.DateField(blank=True, null=True)),
+                ('observaciones', models.TextField(blank=True, null=True)),
+                ('estado_pedido', models.CharField(choices=[('Pendiente', 'Pendiente'), ('Entregado', 'Entregado'), ('Cancelado', 'Cancelado')], max_length=50)),
+                ('fecha_archivado', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pedidos_archivados', to='gestion.cliente')),
+                ('personal_delivery', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pedidos_archivados', to='gestion.personaldelivery')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DetallePedidoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='detalles_archivados', to='gestion.producto')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='gestion.pedidoarchivado')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pedidoarchivado',
+            index=models.Index(fields=['fecha_pedido'], name='gestion_ped_fecha_p_986805_idx'),
+        ),
+    ]
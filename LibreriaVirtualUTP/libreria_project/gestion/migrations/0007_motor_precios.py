@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0006_archivo_y_borrado_logico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallepedido',
+            name='descuento',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='detallepedidoarchivado',
+            name='descuento',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='DescuentoCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('porcentaje', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('activo', models.BooleanField(default=True)),
+                ('categoria', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='descuento', to='gestion.categoria')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Promocion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('porcentaje', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('cantidad_minima', models.PositiveIntegerField(default=1)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('activo', models.BooleanField(default=True)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promociones', to='gestion.categoria')),
+                ('producto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promociones', to='gestion.producto')),
+            ],
+        ),
+    ]
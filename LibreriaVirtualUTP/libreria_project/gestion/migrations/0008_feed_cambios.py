@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-19 03:11
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_motor_precios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoCambio',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('entidad', models.CharField(choices=[('Pedido', 'Pedido'), ('Producto', 'Producto'), ('Cliente', 'Cliente')], max_length=20)),
+                ('clave', models.CharField(max_length=50)),
+                ('operacion', models.CharField(choices=[('alta', 'Alta'), ('modificacion', 'Modificación'), ('baja', 'Baja')], max_length=20)),
+                ('datos', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['entidad', 'id'], name='gestion_eve_entidad_017bb6_idx')],
+            },
+        ),
+    ]
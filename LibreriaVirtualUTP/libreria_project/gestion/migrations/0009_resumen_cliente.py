@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-19 03:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Max, Min, Q, Sum
+
+
+def cargar_resumenes(apps, schema_editor):
+    # Los totales de los pedidos existentes (vigentes y archivados), como historial.recalcular()
+    ResumenCliente = apps.get_model('gestion', 'ResumenCliente')
+    totales = {}
+    for nombre, nombre_detalle in (('Pedido', 'DetallePedido'), ('PedidoArchivado', 'DetallePedidoArchivado')):
+        pedidos = apps.get_model('gestion', nombre).objects.values('cliente_id').annotate(
+            cancelados=Count('pk', filter=Q(estado_pedido='Cancelado')), total=Count('pk'),
+            primero=Min('fecha_pedido'), ultimo=Max('fecha_pedido'),
+        )
+        for fila in pedidos:
+            t = totales.setdefault(fila['cliente_id'], ResumenCliente(cliente_id=fila['cliente_id']))
+            t.pedidos += fila['total'] - fila['cancelados']
+            t.cancelados += fila['cancelados']
+            t.primer_pedido = min(filter(None, (t.primer_pedido, fila['primero'])))
+            t.ultimo_pedido = max(filter(None, (t.ultimo_pedido, fila['ultimo'])))
+        detalles = (
+            apps.get_model('gestion', nombre_detalle).objects.exclude(pedido__estado_pedido='Cancelado')
+            .values('pedido__cliente_id')
+            .annotate(unidades=Sum('cantidad'),
+                      importe=Sum(F('cantidad') * F('precio_unitario') - F('descuento'),
+                                  output_field=DecimalField(max_digits=14, decimal_places=2)))
+        )
+        for fila in detalles:
+            t = totales[fila['pedido__cliente_id']]
+            t.unidades += fila['unidades']
+            t.importe += fila['importe']
+    ResumenCliente.objects.bulk_create(totales.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_feed_cambios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCliente',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to='gestion.cliente')),
+                ('pedidos', models.PositiveIntegerField(default=0)),
+                ('cancelados', models.PositiveIntegerField(default=0)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('importe', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('primer_pedido', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_pedido', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(cargar_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-19 03:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def crear_almacen_principal(apps, schema_editor):
+    # Todo el stock existente queda en un único almacén principal
+    Almacen = apps.get_model('gestion', 'Almacen')
+    Producto = apps.get_model('gestion', 'Producto')
+    StockAlmacen = apps.get_model('gestion', 'StockAlmacen')
+    principal = Almacen.objects.create(nombre='Principal', prioridad=0)
+    lote = [
+        StockAlmacen(producto_id=serie, almacen=principal, stock=stock)
+        for serie, stock in Producto.objects.filter(stock__gt=0).values_list('numero_serie', 'stock').iterator()
+    ]
+    StockAlmacen.objects.bulk_create(lote, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_resumen_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Almacen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('distrito', models.CharField(blank=True, max_length=100, null=True)),
+                ('prioridad', models.PositiveIntegerField(default=100)),
+                ('activo', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='almacen',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='gestion.almacen'),
+        ),
+        migrations.CreateModel(
+            name='StockAlmacen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('almacen', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='existencias', to='gestion.almacen')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='gestion.producto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('producto', 'almacen'), name='stock_unico_por_almacen')],
+            },
+        ),
+        migrations.RunPython(crear_almacen_principal, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 03:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_stock_por_almacen'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='personaldelivery',
+            name='usuario',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='repartidor', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='EntregaSincronizada',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('fecha_entrega', models.DateField()),
+                ('resultado', models.CharField(choices=[('aplicada', 'Aplicada'), ('conflicto', 'Conflicto')], max_length=20)),
+                ('motivo', models.CharField(blank=True, max_length=50, null=True)),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+                ('pedido', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='entregas_sincronizadas', to='gestion.pedido')),
+                ('repartidor', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entregas_sincronizadas', to='gestion.personaldelivery')),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 03:41
+
+from collections import Counter
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def cargar_conteos(apps, schema_editor):
+    # Los conteos de los productos activos, como facetas.recalcular() (con los rangos de precio de hoy)
+    ConteoFaceta = apps.get_model('gestion', 'ConteoFaceta')
+    limites = (10, 25, 50, 100, 250)
+
+    def rango(precio):
+        anterior = 0
+        for limite in limites:
+            if precio < Decimal(limite):
+                return f"{anterior}-{limite}"
+            anterior = limite
+        return f"{anterior}+"
+
+    conteos = Counter()
+    productos = apps.get_model('gestion', 'Producto').objects.filter(eliminado=False).order_by()
+    for categoria, precio, color, dimensiones, stock in productos.values_list(
+            'categoria_id', 'precio', 'color', 'dimensiones', 'stock').iterator(chunk_size=5000):
+        categoria = categoria or 0
+        conteos.update([
+            (categoria, 'color', (color or '').strip().lower()),
+            (categoria, 'precio', rango(precio)),
+            (categoria, 'dimensiones', (dimensiones or '').strip().lower()),
+            (categoria, 'stock', 'si' if stock > 0 else 'no'),
+        ])
+    ConteoFaceta.objects.bulk_create(
+        [ConteoFaceta(categoria=c, faceta=f, valor=v, productos=n) for (c, f, v), n in conteos.items()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_entregas_repartidor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoFaceta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categoria', models.PositiveIntegerField(default=0)),
+                ('faceta', models.CharField(max_length=20)),
+                ('valor', models.CharField(max_length=150)),
+                ('productos', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('categoria', 'faceta', 'valor'), name='conteo_faceta_unico')],
+            },
+        ),
+        migrations.RunPython(cargar_conteos, migrations.RunPython.noop),
+    ]
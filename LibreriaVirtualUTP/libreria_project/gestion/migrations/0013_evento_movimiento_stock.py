@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_conteo_facetas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventocambio',
+            name='operacion',
+            field=models.CharField(choices=[('alta', 'Alta'), ('modificacion', 'Modificación'), ('baja', 'Baja'), ('movimiento', 'Movimiento de stock')], max_length=20),
+        ),
+    ]
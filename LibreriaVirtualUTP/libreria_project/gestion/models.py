@@ -1,5 +1,13 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
+
+class ActivosManager(models.Manager):
+    """Manager por defecto: oculta los registros dados de baja (borrado lógico)."""
+    def get_queryset(self):
+        return super().get_queryset().filter(eliminado=False)
+
 # Modelo 1: Mantenimiento de las Categorías
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
@@ -17,6 +25,21 @@ class Cliente(models.Model):
     distrito = models.CharField(max_length=100, blank=True, null=True)
     correo = models.EmailField(unique=True)
     celular = models.CharField(max_length=20, blank=True, null=True)
+    # Control de concurrencia optimista: se incrementa en cada modificación
+    version = models.PositiveIntegerField(default=1)
+    # Borrado lógico: el cliente tiene pedidos históricos que lo referencian
+    eliminado = models.BooleanField(default=False)
+    fecha_eliminacion = models.DateTimeField(blank=True, null=True)
+
+    objects = ActivosManager()
+    todos = models.Manager()  # Incluye los eliminados
+
+    class Meta:
+        indexes = [
+            # Búsquedas por apellido/nombre (admin y búsqueda de pedidos)
+            models.Index(fields=['apellidos']),
+            models.Index(fields=['nombres']),
+        ]
 
     def __str__(self):
         return f"{self.nombres} {self.apellidos} ({self.dni})"
@@ -32,6 +55,19 @@ class Producto(models.Model):
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True)
     color = models.CharField(max_length=50, blank=True, null=True)
     dimensiones = models.CharField(max_length=100, blank=True, null=True)
+    # Control de concurrencia optimista: se incrementa en cada modificación (incluidos los movimientos de stock)
+    version = models.PositiveIntegerField(default=1)
+    # Borrado lógico: el producto aparece en pedidos y en el kardex
+    eliminado = models.BooleanField(default=False)
+    fecha_eliminacion = models.DateTimeField(blank=True, null=True)
+
+    objects = ActivosManager()
+    todos = models.Manager()  # Incluye los eliminados
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nombre']),
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.numero_serie})"
@@ -43,6 +79,11 @@ class PersonalDelivery(models.Model):
     nombres = models.CharField(max_length=100)
     apellidos = models.CharField(max_length=100)
     celular = models.CharField(max_length=20, blank=True, null=True)
+    # Máximo de pedidos pendientes que el motor de asignación le puede dar
+    capacidad = models.PositiveIntegerField(default=20)
+    # Usuario con el que entra la app del repartidor (sincroniza sus pedidos, gestion/reparto.py)
+    usuario = models.OneToOneField(settings.AUTH_USER_MODEL, related_name='repartidor', on_delete=models.SET_NULL,
+                                   blank=True, null=True)
 
     def __str__(self):
         return f"{self.nombres} {self.apellidos} ({self.dni})"
@@ -65,6 +106,16 @@ class Pedido(models.Model):
     # Relaciones:
     cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT)
     personal_delivery = models.ForeignKey(PersonalDelivery, on_delete=models.SET_NULL, blank=True, null=True)
+
+    # Ver PedidoArchivado
+    archivado = False
+
+    class Meta:
+        indexes = [
+            # Carga pendiente por repartidor (motor de asignación, registrar entrega)
+            models.Index(fields=['estado_pedido', 'personal_delivery']),
+            models.Index(fields=['fecha_pedido']),
+        ]
     
     def __str__(self):
         return f"Pedido N° {self.numero_pedido} - {self.cliente.nombres}"
@@ -78,6 +129,238 @@ class DetallePedido(models.Model):
     
     cantidad = models.PositiveIntegerField()
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2) # Guarda el precio al momento de la venta
+    # Descuento de la línea (categoría o promoción) calculado por el motor de precios
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    @property
+    def importe(self):
+        """Importe de la línea sin IGV (lo mismo que suma el resumen del cliente)."""
+        return self.cantidad * self.precio_unitario - self.descuento
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto.nombre} @ S/ {self.precio_unitario}"
+
+# Modelo 7: Movimientos de Stock (Kardex)
+# Registro de SOLO INSERCIÓN: cada cambio de stock (de un almacén) deja aquí su delta.
+class MovimientoStock(models.Model):
+    TIPO_CHOICES = [
+        ('Venta', 'Venta'),
+        ('Cancelacion', 'Cancelación'),
+        ('Ajuste', 'Ajuste'),
+        ('Importacion', 'Importación'),
+    ]
+    producto = models.ForeignKey(Producto, related_name='movimientos', on_delete=models.PROTECT)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    cantidad = models.IntegerField()  # Delta con signo: negativo = salida, positivo = entrada
+    fecha = models.DateTimeField(auto_now_add=True)
+    # Sin restricción en la BD: el movimiento es auditoría y debe sobrevivir al pedido
+    pedido = models.ForeignKey(Pedido, on_delete=models.DO_NOTHING, db_constraint=False,
+                               related_name='movimientos_stock', blank=True, null=True)
+    observaciones = models.CharField(max_length=255, blank=True, null=True)
+    # Almacén donde entró o salió la mercadería (nulo en los movimientos anteriores a los almacenes)
+    almacen = models.ForeignKey('Almacen', on_delete=models.PROTECT, related_name='movimientos',
+                                blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['producto', 'id']),
+            models.Index(fields=['producto', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.cantidad:+d} x {self.producto_id}"
+
+# Modelo 8: Foto (snapshot) periódica del stock según el kardex
+# stock = saldo del producto incluyendo todos los movimientos con id <= ultimo_movimiento
+class SnapshotStock(models.Model):
+    producto = models.ForeignKey(Producto, related_name='snapshots', on_delete=models.CASCADE)
+    stock = models.IntegerField()
+    ultimo_movimiento = models.BigIntegerField(default=0)
+    fecha = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['producto', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"Snapshot {self.producto_id} = {self.stock} ({self.fecha:%Y-%m-%d %H:%M})"
+
+
+# Modelo 9: Archivo histórico de pedidos
+# Los pedidos entregados o cancelados antiguos se mueven aquí (comando
+# 'archivar_pedidos') para que las tablas de uso diario se mantengan chicas.
+class PedidoArchivado(models.Model):
+    numero_pedido = models.IntegerField(primary_key=True)  # Se conserva el número original
+    fecha_pedido = models.DateTimeField()
+    fecha_entrega = models.DateField(blank=True, null=True)
+    observaciones = models.TextField(blank=True, null=True)
+    estado_pedido = models.CharField(max_length=50, choices=Pedido.ESTADO_CHOICES)
+    cliente = models.ForeignKey(Cliente, related_name='pedidos_archivados', on_delete=models.PROTECT)
+    personal_delivery = models.ForeignKey(PersonalDelivery, related_name='pedidos_archivados',
+                                          on_delete=models.SET_NULL, blank=True, null=True)
+    fecha_archivado = models.DateTimeField(auto_now_add=True)
+
+    # Para que las plantillas distingan un pedido archivado de uno vigente
+    archivado = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha_pedido']),
+        ]
+
+    def __str__(self):
+        return f"Pedido N° {self.numero_pedido} (archivado) - {self.cliente.nombres}"
+
+class DetallePedidoArchivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # Se conserva el id original
+    pedido = models.ForeignKey(PedidoArchivado, related_name='detalles', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='detalles_archivados', on_delete=models.PROTECT)
+    cantidad = models.PositiveIntegerField()
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    importe = DetallePedido.importe
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto.nombre} @ S/ {self.precio_unitario}"
+
+# Modelo 10: Descuento fijo por categoría (p. ej. 10% en útiles escolares)
+class DescuentoCategoria(models.Model):
+    categoria = models.OneToOneField(Categoria, related_name='descuento', on_delete=models.CASCADE)
+    porcentaje = models.DecimalField(max_digits=5, decimal_places=2)  # 10.00 = 10%
+    activo = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.categoria.nombre}: -{self.porcentaje}%"
+
+# Modelo 11: Promociones por producto, por categoría o generales, con vigencia
+# Si no se indica producto ni categoría, la promoción aplica a todo el catálogo.
+class Promocion(models.Model):
+    nombre = models.CharField(max_length=100)
+    producto = models.ForeignKey(Producto, related_name='promociones', on_delete=models.CASCADE,
+                                 blank=True, null=True)
+    categoria = models.ForeignKey(Categoria, related_name='promociones', on_delete=models.CASCADE,
+                                  blank=True, null=True)
+    porcentaje = models.DecimalField(max_digits=5, decimal_places=2)
+    cantidad_minima = models.PositiveIntegerField(default=1)  # Unidades del producto en el carrito
+    fecha_inicio = models.DateTimeField(blank=True, null=True)
+    fecha_fin = models.DateTimeField(blank=True, null=True)
+    activo = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.nombre} (-{self.porcentaje}%)"
+
+# Modelo 12: Feed de cambios (outbox) para el data warehouse / BI
+# Se escribe en la misma transacción que el cambio; el id es el cursor del consumidor.
+class EventoCambio(models.Model):
+    ENTIDAD_CHOICES = [
+        ('Pedido', 'Pedido'),
+        ('Producto', 'Producto'),
+        ('Cliente', 'Cliente'),
+    ]
+    OPERACION_CHOICES = [
+        ('alta', 'Alta'),
+        ('modificacion', 'Modificación'),
+        ('baja', 'Baja'),
+        ('movimiento', 'Movimiento de stock'),
+    ]
+    id = models.BigAutoField(primary_key=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+    entidad = models.CharField(max_length=20, choices=ENTIDAD_CHOICES)
+    clave = models.CharField(max_length=50)  # Clave primaria de la fila modificada
+    operacion = models.CharField(max_length=20, choices=OPERACION_CHOICES)
+    # Alta: la fila completa. Modificación/baja: solo los campos que cambiaron.
+    # Movimiento (Producto): {'delta': unidades con signo, 'tipo': tipo del kardex}.
+    datos = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['entidad', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.operacion} {self.entidad} {self.clave}"
+
+# Modelo 13: Totales históricos por cliente (historial del cliente)
+# Se mantienen al registrar y cancelar pedidos (gestion/historial.py) para no
+# sumar todos sus pedidos en cada visita. Incluye los pedidos archivados.
+class ResumenCliente(models.Model):
+    cliente = models.OneToOneField(Cliente, primary_key=True, related_name='resumen', on_delete=models.CASCADE)
+    pedidos = models.PositiveIntegerField(default=0)  # Sin contar los cancelados
+    cancelados = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    importe = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Sin IGV
+    primer_pedido = models.DateTimeField(blank=True, null=True)
+    ultimo_pedido = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.cliente_id}: {self.pedidos} pedidos, S/ {self.importe}"
+
+# Modelo 14: Almacenes (o puntos de despacho)
+# El stock de cada producto se reparte en filas StockAlmacen: un pedido
+# descuenta solo la fila del almacén que lo despacha, así las ventas
+# simultáneas de un mismo producto no esperan todas por la misma fila.
+class Almacen(models.Model):
+    nombre = models.CharField(max_length=100, unique=True)
+    distrito = models.CharField(max_length=100, blank=True, null=True)  # Despacha primero a este distrito
+    prioridad = models.PositiveIntegerField(default=100)  # Menor = se usa antes (y recibe el stock nuevo)
+    activo = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.nombre
+
+# Modelo 15: Stock de un producto en un almacén
+# Producto.stock es la suma de estas filas (la mantiene gestion/inventario.py).
+class StockAlmacen(models.Model):
+    producto = models.ForeignKey(Producto, related_name='existencias', on_delete=models.CASCADE)
+    almacen = models.ForeignKey(Almacen, related_name='existencias', on_delete=models.PROTECT)
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'almacen'], name='stock_unico_por_almacen'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} @ {self.almacen_id}: {self.stock}"
+
+# Modelo 16: Entregas subidas por la app del repartidor (sincronización sin conexión)
+# El id lo genera el dispositivo al registrar la entrega: si reintenta la
+# subida del mismo lote, se devuelve el resultado guardado sin aplicarla otra vez.
+class EntregaSincronizada(models.Model):
+    RESULTADO_CHOICES = [
+        ('aplicada', 'Aplicada'),
+        ('conflicto', 'Conflicto'),
+    ]
+    id = models.UUIDField(primary_key=True)
+    repartidor = models.ForeignKey(PersonalDelivery, related_name='entregas_sincronizadas', on_delete=models.PROTECT)
+    # Sin restricción en la BD: el registro debe sobrevivir al archivado del pedido
+    pedido = models.ForeignKey(Pedido, on_delete=models.DO_NOTHING, db_constraint=False,
+                               related_name='entregas_sincronizadas')
+    fecha_entrega = models.DateField()
+    resultado = models.CharField(max_length=20, choices=RESULTADO_CHOICES)
+    motivo = models.CharField(max_length=50, blank=True, null=True)  # Solo en los conflictos
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.id}: pedido {self.pedido_id} {self.resultado}"
+
+# Modelo 17: Conteos precalculados para la navegación del catálogo por facetas
+# Productos activos por (categoría, faceta, valor). Se mantienen con deltas al
+# crear, modificar, dar de baja un producto o cuando su stock pasa por cero
+# (gestion/facetas.py): contar las facetas es leer unas pocas filas de aquí.
+class ConteoFaceta(models.Model):
+    # Categoria.id (0 = sin categoría). Sin FK: la fila con NULL no sería única
+    categoria = models.PositiveIntegerField(default=0)
+    faceta = models.CharField(max_length=20)
+    valor = models.CharField(max_length=150)
+    productos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['categoria', 'faceta', 'valor'], name='conteo_faceta_unico'),
+        ]
 
     def __str__(self):
-        return f"{self.cantidad} x {self.producto.nombre} @ S/ {self.precio_unitario}"
\ No newline at end of file
+        return f"{self.categoria}/{self.faceta}={self.valor}: {self.productos}"
@@ -0,0 +1,254 @@
+"""
+Registro y entrega de pedidos: lo usan el formulario web (registrar_pedido_view,
+registrar_entrega_view) y la API JSON (api.api_pedidos_view).
+
+Un lote de pedidos se valida con UNA consulta 'in_bulk' por tabla
+(clientes, personal, productos) y se graba en UNA transacción. Cada pedido
+del lote tiene su propio resultado: uno inválido no impide grabar los demás.
+El stock no se bloquea por producto: el lote se reparte en memoria entre
+las filas de los almacenes y se descuenta con un UPDATE por bloque de filas
+(inventario.reservar_lote).
+"""
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date
+
+from .models import Cliente, Producto, PersonalDelivery, Pedido, DetallePedido
+from . import inventario, asignacion, precios, cambios, historial, metricas
+
+
+class SolicitudInvalida(ValueError):
+    """Un pedido del lote no se puede registrar (datos, cliente, stock...)."""
+
+
+def leer_productos(lineas):
+    """
+    Valida las líneas [{'serie', 'cantidad'}, ...] de un pedido o carrito.
+    Devuelve [(serie, cantidad), ...] sumando las series repetidas.
+    """
+    if lineas is not None and not isinstance(lineas, list):
+        raise SolicitudInvalida("'productos' debe ser una lista.")
+    cantidades = {}
+    for linea in lineas or []:
+        try:
+            serie = str(linea['serie']).strip()
+            cantidad = int(linea['cantidad'])
+        except (KeyError, TypeError, ValueError):
+            raise SolicitudInvalida("Cada producto necesita 'serie' y 'cantidad' (entero).")
+        if cantidad <= 0:
+            raise SolicitudInvalida(f"Cantidad inválida para {serie}.")
+        cantidades[serie] = cantidades.get(serie, 0) + cantidad
+    if not cantidades:
+        raise SolicitudInvalida("No se añadieron productos al pedido.")
+    return list(cantidades.items())
+
+
+def _normalizar(solicitud):
+    """Valida la forma de UNA solicitud y la deja con tipos de Python."""
+    if not isinstance(solicitud, dict):
+        raise SolicitudInvalida("Cada pedido debe ser un objeto.")
+
+    cliente_dni = str(solicitud.get('cliente_dni') or '').strip()
+    if not cliente_dni:
+        raise SolicitudInvalida("Falta el DNI del cliente.")
+    personal_dni = str(solicitud.get('personal_dni') or '').strip() or None
+
+    fecha_entrega = solicitud.get('fecha_entrega') or None
+    if fecha_entrega is not None:
+        try:
+            fecha_entrega = parse_date(str(fecha_entrega))
+        except ValueError:
+            fecha_entrega = None
+        if fecha_entrega is None:
+            raise SolicitudInvalida("Fecha de entrega inválida (formato AAAA-MM-DD).")
+
+    productos = leer_productos(solicitud.get('productos'))
+
+    return {
+        'cliente_dni': cliente_dni,
+        'personal_dni': personal_dni,
+        'fecha_entrega': fecha_entrega,
+        'observaciones': solicitud.get('observaciones') or '',
+        'productos': productos,
+    }
+
+
+def crear_pedidos(solicitudes):
+    """
+    Registra un lote de pedidos. Cada solicitud es un dict:
+        {'cliente_dni', 'personal_dni' (opcional: si falta se asigna solo),
+         'fecha_entrega' (AAAA-MM-DD), 'observaciones',
+         'productos': [{'serie', 'cantidad'}, ...]}
+    Devuelve una lista de resultados en el mismo orden:
+        {'ok': True, 'numero_pedido', 'personal_dni', 'descuento', 'subtotal', 'igv', 'total'}
+        {'ok': False, 'error'}
+    """
+    resultados = [None] * len(solicitudes)
+
+    # 1. Validar la forma de cada pedido (sin tocar la BD)
+    validas = []
+    for i, solicitud in enumerate(solicitudes):
+        try:
+            validas.append((i, _normalizar(solicitud)))
+        except SolicitudInvalida as e:
+            resultados[i] = {'ok': False, 'error': str(e)}
+    if not validas:
+        return resultados
+
+    # 2. Una consulta por tabla para todo el lote
+    clientes = Cliente.objects.in_bulk({d['cliente_dni'] for _, d in validas})
+    personal = PersonalDelivery.objects.in_bulk({d['personal_dni'] for _, d in validas if d['personal_dni']})
+    series = {serie for _, d in validas for serie, _ in d['productos']}
+
+    # --- INICIO DE LA TRANSACCIÓN ---
+    # 'reservas' envuelve la transacción: si se revierte (o falla el commit), la
+    # carga reservada a los repartidores en el paso 5 se devuelve al índice
+    with ExitStack() as reservas, transaction.atomic():
+        # Sin bloquear los productos: el stock se descuenta por almacén (inventario.reservar_lote)
+        productos = Producto.objects.in_bulk(series)
+
+        # 3. Validar cliente, personal y productos de cada pedido
+        por_reservar = []
+        for i, d in validas:
+            try:
+                cliente = clientes.get(d['cliente_dni'])
+                if cliente is None:
+                    raise SolicitudInvalida(f"El cliente {d['cliente_dni']} no existe.")
+                repartidor = None
+                if d['personal_dni']:
+                    repartidor = personal.get(d['personal_dni'])
+                    if repartidor is None:
+                        raise SolicitudInvalida(f"El personal de delivery {d['personal_dni']} no existe.")
+
+                for serie, _ in d['productos']:
+                    if serie not in productos:
+                        raise SolicitudInvalida(f"El producto {serie} no existe.")
+                por_reservar.append((i, d, cliente, repartidor))
+            except SolicitudInvalida as e:
+                resultados[i] = {'ok': False, 'error': str(e)}
+
+        # 4. Descontar el stock de todo el lote (un pedido que no alcanza no descuenta nada)
+        salidas, rechazos = inventario.reservar_lote(
+            [(i, d['productos'], cliente.distrito) for i, d, cliente, _ in por_reservar])
+        aceptadas = []
+        for i, d, cliente, repartidor in por_reservar:
+            if i in rechazos:
+                e = rechazos[i]
+                metricas.RESERVAS_FALLIDAS.inc()
+                resultados[i] = {'ok': False, 'error': f"Stock insuficiente para {productos[e.serie].nombre}. "
+                                                       f"Disponible: {e.disponible}"}
+            else:
+                aceptadas.append((i, d, cliente, repartidor, salidas[i]))
+
+        if not aceptadas:
+            return resultados
+
+        # 5. Los pedidos sin personal se asignan con UN plan para todo el lote, que
+        #    ya ocupa su lugar en el índice (otro lote simultáneo no lo puede tomar)
+        sin_repartidor = defaultdict(list)
+        for k, (_, _, cliente, repartidor, _) in enumerate(aceptadas):
+            if repartidor is None:
+                sin_repartidor[cliente.distrito].append(k)
+        plan = reservas.enter_context(asignacion.reserva(sin_repartidor)) if sin_repartidor else {}
+
+        # 6. Crear las cabeceras
+        pedidos = [
+            Pedido(
+                cliente=cliente,
+                personal_delivery_id=repartidor.dni if repartidor else plan.get(k),
+                fecha_entrega=d['fecha_entrega'],
+                observaciones=d['observaciones'],
+                estado_pedido='Pendiente',
+            )
+            for k, (_, d, cliente, repartidor, _) in enumerate(aceptadas)
+        ]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Pedido.objects.bulk_create(pedidos)
+        else:
+            # MySQL no devuelve los ids de un INSERT múltiple: uno por pedido
+            for pedido in pedidos:
+                pedido.save(force_insert=True)
+
+        # 7. Precios (descuentos, promociones e IGV), detalles y kardex en bloque
+        tabla = precios.obtener_tabla()
+        detalles = []
+        movimientos = []
+        eventos = []
+        para_resumen = []
+        for pedido, (i, d, cliente, repartidor, salidas) in zip(pedidos, aceptadas):
+            cotizacion = tabla.cotizar(
+                (serie, productos[serie].categoria_id, productos[serie].precio, cantidad)
+                for serie, cantidad in d['productos']
+            )
+            for linea in cotizacion['lineas']:
+                # Guarda el precio y el descuento al momento de la venta
+                detalles.append(DetallePedido(pedido=pedido, producto_id=linea['serie'],
+                                              cantidad=linea['cantidad'],
+                                              precio_unitario=linea['precio_unitario'],
+                                              descuento=linea['descuento']))
+            movimientos += [(serie, cantidad, pedido.numero_pedido, almacen_id)
+                            for serie, cantidad, almacen_id in salidas]
+            # Feed de cambios: la cabecera con sus líneas
+            eventos.append(cambios.evento_de(pedido, 'alta', detalles=[
+                {'producto_id': linea['serie'], 'cantidad': linea['cantidad'],
+                 'precio_unitario': linea['precio_unitario'], 'descuento': linea['descuento']}
+                for linea in cotizacion['lineas']
+            ]))
+            para_resumen.append((pedido, sum(cantidad for _, cantidad in d['productos']), cotizacion['subtotal']))
+
+            resultados[i] = {
+                'ok': True,
+                'numero_pedido': pedido.numero_pedido,
+                'personal_dni': pedido.personal_delivery_id,
+                'descuento': cotizacion['descuento'],
+                'subtotal': cotizacion['subtotal'],
+                'igv': cotizacion['igv'],
+                'total': cotizacion['total'],
+            }
+            # Repartidor indicado en la solicitud: su carga se suma al índice tras el commit
+            # (la de los asignados por el plan ya está reservada)
+            if repartidor is not None:
+                asignacion.registrar_creado(repartidor.dni, cliente.distrito)
+
+        DetallePedido.objects.bulk_create(detalles, batch_size=1000)
+        inventario.registrar_kardex(movimientos, 'Venta')
+        cambios.registrar_lote(eventos)
+        historial.registrar_pedidos(para_resumen)
+        transaction.on_commit(lambda: metricas.PEDIDOS_CREADOS.inc(cantidad=len(pedidos)))
+    # --- FIN DE LA TRANSACCIÓN ---
+
+    return resultados
+
+
+def registrar_entrega(numero_pedido, fecha_entrega, observaciones=''):
+    """
+    Marca un pedido pendiente como Entregado (con su evento en el feed de
+    cambios, en la misma transacción).
+    Lanza Pedido.DoesNotExist si no existe o ya no está pendiente.
+    """
+    fecha = parse_date(str(fecha_entrega or ''))
+    if fecha is None:
+        raise SolicitudInvalida("Fecha de entrega inválida (formato AAAA-MM-DD).")
+
+    with transaction.atomic():
+        pedido = Pedido.objects.select_for_update().get(numero_pedido=numero_pedido, estado_pedido='Pendiente')
+        marcar_entregado(pedido, fecha, observaciones)
+        pedido.save(update_fields=CAMPOS_ENTREGA)
+        cambios.registrar(pedido, 'modificacion', CAMPOS_ENTREGA)
+        # El repartidor queda con un pedido pendiente menos
+        asignacion.registrar_cerrado(pedido.personal_delivery_id, pedido.cliente.distrito)
+    return pedido
+
+
+CAMPOS_ENTREGA = ['estado_pedido', 'fecha_entrega', 'observaciones']
+
+
+def marcar_entregado(pedido, fecha, observaciones=''):
+    """Cambia la instancia a Entregado (sin guardarla): CAMPOS_ENTREGA."""
+    pedido.estado_pedido = 'Entregado'
+    pedido.fecha_entrega = fecha
+    # Añadimos las observaciones de entrega a las existentes
+    obs_original = pedido.observaciones if pedido.observaciones else ""
+    pedido.observaciones = f"{obs_original}\n[ENTREGA {fecha.isoformat()}]: {observaciones or ''}".strip()
@@ -0,0 +1,210 @@
+"""
+Motor de precios: descuentos por categoría, promociones e IGV.
+
+Las reglas vigentes (tasa de IGV, descuentos por categoría y promociones)
+se compilan en una TablaPrecios en memoria: cotizar un carrito son unas
+pocas búsquedas en diccionarios, sin consultas. La tabla se recompila
+cuando cambian las reglas (señales), cuando empieza o termina alguna
+promoción, o cada SEGUNDOS_RECARGA (cambios hechos desde otros procesos).
+
+Los precios de los productos NO se guardan en la tabla: se leen de la BD en
+cada cotización, así una edición del precio se ve al instante.
+"""
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Producto, DescuentoCategoria, Promocion
+
+SEGUNDOS_RECARGA = 300
+CENTIMOS = Decimal('0.01')
+CIEN = Decimal('100')
+
+
+class ProductoNoEncontrado(LookupError):
+    """El carrito incluye un producto que no existe (o fue dado de baja)."""
+
+
+def redondear(monto):
+    return monto.quantize(CENTIMOS, rounding=ROUND_HALF_UP)
+
+
+def tasa_igv():
+    """Tasa de IGV configurada en settings.TASA_IGV (por defecto 18%)."""
+    return Decimal(str(getattr(settings, 'TASA_IGV', '0.18')))
+
+
+class TablaPrecios:
+    """
+    Reglas de precio compiladas, en memoria.
+    No toca la BD (se arma con sus argumentos), así también se puede usar
+    (y medir) con datos sintéticos.
+
+    Cada regla es (cantidad_minima, fraccion, nombre). Por producto y por
+    categoría se guarda una tupla ordenada de mayor a menor descuento, de
+    modo que la primera regla cuya cantidad mínima se cumple es la mejor.
+    Los descuentos NO se acumulan: cada línea recibe el mayor que le aplique.
+    """
+
+    def __init__(self, tasa, descuentos_categoria=(), promociones=(), vigente_hasta=None):
+        """
+        descuentos_categoria: iterable de (categoria_id, porcentaje)
+        promociones: iterable de (nombre, producto_id, categoria_id, porcentaje, cantidad_minima)
+        vigente_hasta: momento en que alguna promoción empieza o termina (hay que recompilar)
+        """
+        self.tasa_igv = Decimal(tasa)
+        self.vigente_hasta = vigente_hasta
+        self.cargado_en = time.monotonic()
+
+        por_producto = {}
+        por_categoria = {}
+        generales = []
+        for categoria_id, porcentaje in descuentos_categoria:
+            por_categoria.setdefault(categoria_id, []).append((1, Decimal(porcentaje) / CIEN, 'Descuento de categoría'))
+        for nombre, producto_id, categoria_id, porcentaje, cantidad_minima in promociones:
+            regla = (max(cantidad_minima, 1), Decimal(porcentaje) / CIEN, nombre)
+            if producto_id is not None:
+                por_producto.setdefault(producto_id, []).append(regla)
+            elif categoria_id is not None:
+                por_categoria.setdefault(categoria_id, []).append(regla)
+            else:
+                generales.append(regla)
+
+        def ordenar(reglas):
+            return tuple(sorted(reglas, key=lambda r: r[1], reverse=True))
+
+        # Las promociones generales se mezclan en cada categoría: así una
+        # línea solo revisa dos listas (la de su producto y la de su categoría)
+        self.generales = ordenar(generales)
+        self.por_categoria = {cat: ordenar(reglas + generales) for cat, reglas in por_categoria.items()}
+        self.por_producto = {serie: ordenar(reglas) for serie, reglas in por_producto.items()}
+
+    def _mejor_regla(self, serie, categoria_id, cantidad):
+        mejor = None
+        for reglas in (self.por_producto.get(serie, ()), self.por_categoria.get(categoria_id, self.generales)):
+            for regla in reglas:
+                if cantidad >= regla[0]:
+                    if mejor is None or regla[1] > mejor[1]:
+                        mejor = regla
+                    break
+        return mejor
+
+    def cotizar(self, lineas):
+        """
+        lineas: iterable de (serie, categoria_id, precio, cantidad), una por producto.
+        Devuelve un dict con el detalle por línea y los totales:
+            {'lineas': [{'serie', 'cantidad', 'precio_unitario', 'descuento', 'importe', 'regla'}, ...],
+             'descuento', 'subtotal', 'tasa_igv', 'igv', 'total'}
+        'subtotal' ya tiene restados los descuentos y no incluye el IGV.
+        """
+        detalle = []
+        subtotal = Decimal('0')
+        descuento_total = Decimal('0')
+        for serie, categoria_id, precio, cantidad in lineas:
+            bruto = precio * cantidad
+            regla = self._mejor_regla(serie, categoria_id, cantidad)
+            descuento = redondear(bruto * regla[1]) if regla else Decimal('0.00')
+            importe = bruto - descuento
+            detalle.append({
+                'serie': serie,
+                'cantidad': cantidad,
+                'precio_unitario': precio,
+                'descuento': descuento,
+                'importe': importe,
+                'regla': regla[2] if regla else None,
+            })
+            subtotal += importe
+            descuento_total += descuento
+
+        igv = redondear(subtotal * self.tasa_igv)
+        return {
+            'lineas': detalle,
+            'descuento': descuento_total,
+            'subtotal': subtotal,
+            'tasa_igv': self.tasa_igv,
+            'igv': igv,
+            'total': subtotal + igv,
+        }
+
+
+def compilar(ahora=None):
+    """Arma una TablaPrecios con las reglas vigentes en la BD."""
+    ahora = ahora or timezone.now()
+    descuentos = DescuentoCategoria.objects.filter(activo=True).values_list('categoria_id', 'porcentaje')
+
+    promociones = []
+    cambios = []  # Momentos futuros en que la lista de promociones vigentes cambia
+    filas = (
+        Promocion.objects
+        .filter(activo=True)
+        .filter(Q(fecha_fin__isnull=True) | Q(fecha_fin__gt=ahora))
+        .values_list('nombre', 'producto_id', 'categoria_id', 'porcentaje', 'cantidad_minima',
+                     'fecha_inicio', 'fecha_fin')
+    )
+    for nombre, producto_id, categoria_id, porcentaje, cantidad_minima, inicio, fin in filas:
+        if inicio is not None and inicio > ahora:
+            cambios.append(inicio)
+            continue
+        if fin is not None:
+            cambios.append(fin)
+        promociones.append((nombre, producto_id, categoria_id, porcentaje, cantidad_minima))
+
+    return TablaPrecios(tasa_igv(), list(descuentos), promociones,
+                        vigente_hasta=min(cambios) if cambios else None)
+
+
+# Tabla compartida por el proceso
+_tabla = None
+_lock_carga = threading.Lock()
+
+
+def _vencida(tabla):
+    if tabla is None or time.monotonic() - tabla.cargado_en > SEGUNDOS_RECARGA:
+        return True
+    return tabla.vigente_hasta is not None and timezone.now() >= tabla.vigente_hasta
+
+
+def obtener_tabla():
+    """Devuelve la tabla del proceso, recompilándola si hace falta."""
+    global _tabla
+    if _vencida(_tabla):
+        with _lock_carga:
+            if _vencida(_tabla):
+                _tabla = compilar()
+    return _tabla
+
+
+def invalidar():
+    """Fuerza recompilar la tabla (al cambiar descuentos o promociones)."""
+    global _tabla
+    _tabla = None
+
+
+@receiver([post_save, post_delete], sender=DescuentoCategoria)
+@receiver([post_save, post_delete], sender=Promocion)
+def _reglas_modificadas(sender, **kwargs):
+    invalidar()
+
+
+def cotizar_carrito(productos):
+    """
+    Cotiza un carrito leyendo los precios actuales de la BD (una consulta).
+    productos: lista de (serie, cantidad), sin series repetidas.
+    Lanza ProductoNoEncontrado si alguna serie no existe.
+    """
+    catalogo = Producto.objects.only('numero_serie', 'precio', 'categoria_id').in_bulk(
+        [serie for serie, _ in productos])
+    faltantes = [serie for serie, _ in productos if serie not in catalogo]
+    if faltantes:
+        raise ProductoNoEncontrado(f"El producto {faltantes[0]} no existe.")
+
+    return obtener_tabla().cotizar(
+        (serie, catalogo[serie].categoria_id, catalogo[serie].precio, cantidad)
+        for serie, cantidad in productos
+    )
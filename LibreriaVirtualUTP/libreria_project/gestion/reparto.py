@@ -0,0 +1,197 @@
+"""
+Sincronización de la app del repartidor (trabaja sin conexión durante la ruta).
+
+Una ruta son dos llamadas en lugar de una búsqueda y un POST por pedido:
+
+1. GET /api/repartidor/pedidos/?token=<token>: sus pedidos pendientes. Sin
+   token (o si pasaron demasiados cambios) devuelve la lista completa; con
+   token, solo lo que cambió desde entonces: los pedidos nuevos o
+   modificados y los números que ya no le tocan ('eliminados': entregados,
+   cancelados o reasignados; el dispositivo ignora los que no tiene). El
+   token es el cursor del feed de cambios (gestion/cambios.py): el delta
+   cuesta O(cambios), no O(pedidos).
+
+2. POST /api/repartidor/entregas/: las entregas registradas sin conexión, en
+   un lote y una transacción. Cada una lleva un id (UUID) generado en el
+   dispositivo; reintentar el lote devuelve el resultado guardado
+   (EntregaSincronizada) sin aplicarla otra vez. Si el pedido ya no está
+   pendiente para ese repartidor (lo entregaron desde la oficina, se
+   canceló o se reasignó), la entrega queda como conflicto con su motivo y
+   el pedido no se toca.
+
+   Dos reintentos simultáneos del mismo lote (la app reenvía mientras el
+   primero sigue en curso) se ordenan en el bloqueo de los pedidos: las
+   entregas ya guardadas se leen DESPUÉS de bloquearlos, así que el segundo
+   ve las del primero. Si aun así chocan en el id (entregas de pedidos que
+   no existen: no hay fila que bloquear), el lote se repite una vez y
+   devuelve los resultados guardados por el otro.
+"""
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q
+from django.utils.dateparse import parse_date
+
+from .models import Cliente, DetallePedido, EntregaSincronizada, Pedido
+from . import asignacion, cambios, pedidos as servicio_pedidos
+
+MAX_ENTREGAS_POR_LOTE = 1000
+
+
+def _pendientes(dni, filtro=None):
+    detalles = DetallePedido.objects.select_related('producto').only(
+        'pedido_id', 'producto_id', 'cantidad', 'producto__nombre').order_by('id')
+    consulta = (
+        Pedido.objects.filter(personal_delivery_id=dni, estado_pedido='Pendiente')
+        .select_related('cliente')
+        .prefetch_related(Prefetch('detalles', queryset=detalles))
+        .order_by('numero_pedido')
+    )
+    if filtro is not None:
+        consulta = consulta.filter(filtro)
+    return list(consulta)
+
+
+def como_dict(pedido):
+    """Lo que necesita el repartidor en la puerta, y nada más."""
+    cliente = pedido.cliente
+    return {
+        'numero_pedido': pedido.numero_pedido,
+        'fecha_pedido': pedido.fecha_pedido,
+        'fecha_entrega': pedido.fecha_entrega,  # Programada
+        'observaciones': pedido.observaciones,
+        'cliente': {
+            'dni': cliente.dni,
+            'nombre': f"{cliente.nombres} {cliente.apellidos}",
+            'direccion': cliente.direccion,
+            'distrito': cliente.distrito,
+            'celular': cliente.celular,
+        },
+        'productos': [[d.producto_id, d.producto.nombre, d.cantidad] for d in pedido.detalles.all()],
+    }
+
+
+def pedidos_pendientes(dni, token=None):
+    """
+    Pendientes del repartidor: {'token', 'completo', 'pedidos', 'eliminados'}.
+    Con 'completo' el dispositivo reemplaza su lista; si no, la actualiza.
+    """
+    if token is not None:
+        eventos, siguiente = cambios.leer(token, cambios.LIMITE_MAXIMO, ['Pedido', 'Cliente'])
+        if len(eventos) < cambios.LIMITE_MAXIMO:
+            numeros = {int(e.clave) for e in eventos if e.entidad == 'Pedido'}
+            dnis = {e.clave for e in eventos if e.entidad == 'Cliente'}  # Cambió la dirección o el celular
+            actuales = _pendientes(dni, Q(numero_pedido__in=numeros) | Q(cliente_id__in=dnis)) if eventos else []
+            return {
+                'token': siguiente,
+                'completo': False,
+                'pedidos': [como_dict(p) for p in actuales],
+                'eliminados': sorted(numeros - {p.numero_pedido for p in actuales}),
+            }
+        # Demasiados cambios desde el token: sale más barato mandar la lista completa
+
+    # El cursor se toma ANTES de leer: lo que cambie durante la lectura vuelve en el próximo delta
+    siguiente = cambios.cursor_actual()
+    return {
+        'token': siguiente,
+        'completo': True,
+        'pedidos': [como_dict(p) for p in _pendientes(dni)],
+        'eliminados': [],
+    }
+
+
+def _leer_entrega(dato):
+    """(id, numero_pedido, fecha, observaciones) o ValueError con el motivo."""
+    if not isinstance(dato, dict):
+        raise ValueError("Cada entrega debe ser un objeto.")
+    try:
+        id_entrega = uuid.UUID(str(dato.get('id')))
+    except ValueError:
+        raise ValueError("'id' debe ser un UUID generado en el dispositivo.")
+    numero = dato.get('numero_pedido')
+    if not isinstance(numero, int) or isinstance(numero, bool):
+        raise ValueError("'numero_pedido' debe ser un entero.")
+    fecha = parse_date(str(dato.get('fecha_entrega') or ''))
+    if fecha is None:
+        raise ValueError("Fecha de entrega inválida (formato AAAA-MM-DD).")
+    observaciones = str(dato.get('observaciones') or '')[:500]
+    return id_entrega, numero, fecha, observaciones
+
+
+def _resultado(id_entrega, numero, resultado, motivo=None):
+    return {'id': str(id_entrega), 'numero_pedido': numero, 'resultado': resultado, 'motivo': motivo}
+
+
+def aplicar_entregas(dni, datos):
+    """
+    Aplica un lote de entregas del repartidor 'dni' en UNA transacción.
+    Devuelve un resultado por entrega, en el mismo orden:
+    'aplicada', 'conflicto' (con el motivo) o 'invalida' (con el error).
+    """
+    resultados = [None] * len(datos)
+    leidas = []
+    for i, dato in enumerate(datos):
+        try:
+            leidas.append((i, *_leer_entrega(dato)))
+        except ValueError as e:
+            numero = dato.get('numero_pedido') if isinstance(dato, dict) else None
+            resultados[i] = {'id': None, 'numero_pedido': numero, 'resultado': 'invalida', 'motivo': str(e)}
+    if not leidas:
+        return resultados
+
+    try:
+        _aplicar_lote(dni, leidas, resultados)
+    except IntegrityError:
+        # Otro envío del mismo lote guardó los mismos ids entre nuestra lectura
+        # y el INSERT: ahora son previas y se devuelve lo que guardó ese envío
+        _aplicar_lote(dni, leidas, resultados)
+    return resultados
+
+
+def _aplicar_lote(dni, leidas, resultados):
+    with transaction.atomic():
+        # Bloquea los pedidos (en orden, contra el registro desde la oficina) en UNA consulta
+        numeros = sorted({numero for _, _, numero, _, _ in leidas})
+        en_bd = {p.numero_pedido: p for p in Pedido.objects.select_for_update().filter(numero_pedido__in=numeros)
+                 .order_by('numero_pedido')}
+        # Reintentos: la entrega ya se procesó, se devuelve lo que se respondió entonces
+        previas = EntregaSincronizada.objects.in_bulk([id_entrega for _, id_entrega, *_ in leidas])
+
+        nuevas, entregados = [], []
+        for i, id_entrega, numero, fecha, observaciones in leidas:
+            previa = previas.get(id_entrega)
+            if previa is not None:
+                if previa.repartidor_id != dni or previa.pedido_id != numero:
+                    resultados[i] = _resultado(id_entrega, numero, 'invalida', "El id ya se usó en otra entrega.")
+                else:
+                    resultados[i] = _resultado(id_entrega, numero, previa.resultado, previa.motivo)
+                continue
+
+            pedido = en_bd.get(numero)
+            if pedido is None:
+                motivo = 'no_existe'
+            elif pedido.personal_delivery_id != dni:
+                motivo = 'asignado_a_otro'
+            elif pedido.estado_pedido == 'Entregado':
+                motivo = 'ya_entregado'
+            elif pedido.estado_pedido == 'Cancelado':
+                motivo = 'cancelado'
+            else:
+                motivo = None
+                servicio_pedidos.marcar_entregado(pedido, fecha, observaciones)  # Un duplicado en el lote ya lo ve
+                entregados.append(pedido)
+            resultado = 'conflicto' if motivo else 'aplicada'
+            previas[id_entrega] = EntregaSincronizada(id=id_entrega, repartidor_id=dni, pedido_id=numero,
+                                                      fecha_entrega=fecha, resultado=resultado, motivo=motivo)
+            nuevas.append(previas[id_entrega])
+            resultados[i] = _resultado(id_entrega, numero, resultado, motivo)
+
+        if entregados:
+            campos = servicio_pedidos.CAMPOS_ENTREGA
+            Pedido.objects.bulk_update(entregados, campos, batch_size=500)
+            cambios.registrar_lote([cambios.evento_de(p, 'modificacion', campos) for p in entregados])
+            distritos = dict(Cliente.todos.filter(pk__in={p.cliente_id for p in entregados})
+                             .values_list('dni', 'distrito'))
+            for pedido in entregados:
+                asignacion.registrar_cerrado(dni, distritos.get(pedido.cliente_id))
+        EntregaSincronizada.objects.bulk_create(nuevas, batch_size=1000)
@@ -0,0 +1,95 @@
+"""
+Sondas para el orquestador y métricas para Prometheus (sin login).
+
+- /healthz: el proceso responde. No toca la BD ni plantillas: sirve de
+  liveness probe (si falla, reiniciar el contenedor).
+- /readyz: puede atender tráfico: BD y cache responden y no hay migraciones
+  pendientes. Devuelve 503 si algo falla (readiness: sacarlo del balanceo,
+  no reiniciarlo).
+- /metrics: métricas en formato Prometheus (gestion/metricas.py). Si
+  settings.METRICAS_TOKEN está definido, exige 'Authorization: Bearer <token>'.
+"""
+import hmac
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+# Una vez que no hay migraciones pendientes, no vuelve a haberlas sin un despliegue
+# (que reinicia el proceso): no se carga el grafo de migraciones en cada sonda
+_migraciones_al_dia = False
+
+
+def _base_de_datos():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def _cache():
+    clave, valor = f'salud:{uuid.uuid4().hex}', 'ok'
+    cache.set(clave, valor, 10)
+    if cache.get(clave) != valor:
+        raise RuntimeError("El cache no devolvió el valor recién guardado.")
+    cache.delete(clave)
+
+
+def _migraciones():
+    global _migraciones_al_dia
+    if _migraciones_al_dia:
+        return
+    executor = MigrationExecutor(connection)
+    pendientes = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    if pendientes:
+        raise RuntimeError(f"{len(pendientes)} migración(es) pendiente(s).")
+    _migraciones_al_dia = True
+
+
+COMPROBACIONES = {
+    'base_de_datos': _base_de_datos,
+    'cache': _cache,
+    'migraciones': _migraciones,
+}
+
+
+@never_cache
+@require_GET
+def healthz_view(request):
+    return HttpResponse('ok', content_type='text/plain')
+
+
+@never_cache
+@require_GET
+def readyz_view(request):
+    resultados = {}
+    for nombre, comprobar in COMPROBACIONES.items():
+        try:
+            comprobar()
+            resultados[nombre] = 'ok'
+        except Exception as e:
+            # El detalle va al log; la respuesta es pública
+            logger.warning("Readiness: falla '%s': %s", nombre, e)
+            resultados[nombre] = 'error'
+    listo = all(estado == 'ok' for estado in resultados.values())
+    return JsonResponse({'listo': listo, 'comprobaciones': resultados}, status=200 if listo else 503)
+
+
+@never_cache
+@require_GET
+def metricas_view(request):
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    if token:
+        enviado = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(enviado.encode(), f'Bearer {token}'.encode()):
+            return HttpResponse('Token inválido.', status=401, content_type='text/plain')
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,193 @@
+// Detalle del pedido: carrito en el navegador, montos cotizados por el servidor (/api/cotizar/)
+// y stock revisado en segundo plano y antes de enviar (/api/stock/)
+// Espera a que el documento HTML esté cargado
+document.addEventListener('DOMContentLoaded', function() {
+
+    const btnAdd = document.getElementById('btn-add-producto');
+    const productoSelector = document.getElementById('producto-selector');
+    const cantidadInput = document.getElementById('producto-cantidad');
+    const tablaBody = document.getElementById('tabla-detalles-body');
+    // Lo que depende del servidor (URL, tasa de IGV) viene en atributos data-* del formulario
+    const formulario = document.getElementById('form-pedido');
+    const urlCotizar = formulario.dataset.urlCotizar;
+    const urlStock = formulario.dataset.urlStock;
+    const tasaIgv = formulario.dataset.tasaIgv;
+    const SEGUNDOS_REVISION_STOCK = 30;
+
+    // --- Escuchar el clic en el botón "Añadir Producto" ---
+    btnAdd.addEventListener('click', function() {
+        const selectedOption = productoSelector.options[productoSelector.selectedIndex];
+        const cantidad = parseInt(cantidadInput.value);
+
+        // Validaciones
+        if (selectedOption.value === "" || !(cantidad > 0)) {
+            alert("Por favor, seleccione un producto y una cantidad válida.");
+            return;
+        }
+
+        // Obtener datos del producto (el precio lo pone la cotización)
+        const serie = selectedOption.value;
+        const nombre = selectedOption.getAttribute('data-nombre');
+        const stock = parseInt(selectedOption.getAttribute('data-stock'));
+
+        // Si el producto ya está en la tabla, se suma a su fila
+        let fila = tablaBody.querySelector(`tr[data-serie="${CSS.escape(serie)}"]`);
+        const inputCantidad = fila ? fila.querySelector('input[name="cantidad[]"]') : null;
+        const cantidadTotal = cantidad + (inputCantidad ? parseInt(inputCantidad.value) : 0);
+        if (cantidadTotal > stock) {
+            alert(`Stock insuficiente. Disponible: ${stock}`);
+            return;
+        }
+
+        if (fila) {
+            inputCantidad.value = cantidadTotal;
+            fila.cells[1].innerText = cantidadTotal;
+        } else {
+            fila = document.createElement('tr');
+            fila.setAttribute('data-serie', serie); // Para evitar duplicados
+            fila.innerHTML = `
+                <td>
+                    <span class="nombre"></span>
+                    <input type="hidden" name="producto_serie[]">
+                    <input type="hidden" name="cantidad[]">
+                </td>
+                <td>${cantidad}</td>
+                <td>...</td>
+                <td>...</td>
+                <td>...</td>
+                <td><button type="button" class="btn-remove">Quitar</button></td>
+            `;
+            fila.querySelector('.nombre').innerText = nombre;
+            fila.querySelector('input[name="producto_serie[]"]').value = serie;
+            fila.querySelector('input[name="cantidad[]"]').value = cantidad;
+            tablaBody.appendChild(fila);
+        }
+
+        // Resetear el selector
+        productoSelector.selectedIndex = 0;
+        cantidadInput.value = 1;
+
+        // Actualizar los totales (y confirmar el stock: el de la página puede ser viejo)
+        actualizarTotales();
+        verificarStock();
+    });
+
+    // --- Escuchar clics en los botones "Quitar" (delegación de eventos) ---
+    tablaBody.addEventListener('click', function(e) {
+        if (e.target && e.target.classList.contains('btn-remove')) {
+            // Si se hizo clic en un botón "Quitar", elimina la fila (el <tr> padre)
+            e.target.closest('tr').remove();
+            // Actualizar los totales
+            actualizarTotales();
+            verificarStock();
+        }
+    });
+
+    function mostrarTotales(cotizacion) {
+        document.getElementById('display-descuento').innerText = cotizacion.descuento;
+        document.getElementById('display-subtotal').innerText = cotizacion.subtotal;
+        document.getElementById('display-tasa-igv').innerText = Math.round(parseFloat(cotizacion.tasa_igv) * 10000) / 100;
+        document.getElementById('display-igv').innerText = cotizacion.igv;
+        document.getElementById('display-total').innerText = cotizacion.total;
+    }
+
+    // --- Pide al servidor la cotización del carrito completo (una sola llamada) ---
+    let ultimaCotizacion = 0;
+    function actualizarTotales() {
+        const errorCotizacion = document.getElementById('error-cotizacion');
+        errorCotizacion.style.display = 'none';
+
+        const filas = Array.from(tablaBody.querySelectorAll('tr'));
+        const productos = filas.map(fila => ({
+            serie: fila.getAttribute('data-serie'),
+            cantidad: parseInt(fila.querySelector('input[name="cantidad[]"]').value),
+        }));
+        if (productos.length === 0) {
+            mostrarTotales({descuento: '0.00', subtotal: '0.00', tasa_igv: tasaIgv, igv: '0.00', total: '0.00'});
+            return;
+        }
+
+        // Si llegan respuestas fuera de orden, solo vale la última
+        const numero = ++ultimaCotizacion;
+        fetch(urlCotizar, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({productos: productos}),
+        })
+        .then(respuesta => respuesta.json().then(datos => ({ok: respuesta.ok, datos: datos})))
+        .then(({ok, datos}) => {
+            if (numero !== ultimaCotizacion) return;
+            if (!ok) throw new Error(datos.error);
+            datos.lineas.forEach(linea => {
+                const fila = tablaBody.querySelector(`tr[data-serie="${CSS.escape(linea.serie)}"]`);
+                if (!fila) return;
+                fila.cells[2].innerText = `S/ ${linea.precio_unitario}`;
+                fila.cells[3].innerText = linea.regla ? `- S/ ${linea.descuento} (${linea.regla})` : '-';
+                fila.cells[4].innerText = `S/ ${linea.importe}`;
+            });
+            mostrarTotales(datos);
+        })
+        .catch(error => {
+            if (numero !== ultimaCotizacion) return;
+            errorCotizacion.innerText = `No se pudo calcular el total: ${error.message}`;
+            errorCotizacion.style.display = 'block';
+        });
+    }
+
+    // --- Revisa el stock del carrito contra el servidor (una llamada para todos los productos) ---
+    // Devuelve una promesa con true si todo alcanza (o si no se pudo revisar: el servidor valida al grabar)
+    let ultimaRevision = 0;
+    function verificarStock() {
+        const avisoStock = document.getElementById('aviso-stock');
+        const filas = Array.from(tablaBody.querySelectorAll('tr'));
+        if (filas.length === 0) {
+            avisoStock.style.display = 'none';
+            return Promise.resolve(true);
+        }
+
+        const parametros = new URLSearchParams();
+        filas.forEach(fila => parametros.append('serie', fila.getAttribute('data-serie')));
+        const numero = ++ultimaRevision;
+        return fetch(`${urlStock}?${parametros}`)
+        .then(respuesta => respuesta.ok ? respuesta.json() : Promise.reject(new Error(respuesta.status)))
+        .then(datos => {
+            const faltantes = [];
+            filas.forEach(fila => {
+                const serie = fila.getAttribute('data-serie');
+                const stock = datos.stock[serie];
+                const cantidad = parseInt(fila.querySelector('input[name="cantidad[]"]').value);
+                const nombre = fila.querySelector('.nombre').innerText;
+                // El selector también se queda con el stock nuevo (lo usa el botón "Añadir")
+                const opcion = productoSelector.querySelector(`option[value="${CSS.escape(serie)}"]`);
+                if (opcion) opcion.setAttribute('data-stock', stock === null ? 0 : stock);
+
+                const falta = stock === null || cantidad > stock;
+                fila.classList.toggle('sin-stock', falta);
+                if (stock === null) faltantes.push(`${nombre}: ya no está disponible`);
+                else if (falta) faltantes.push(`${nombre}: quedan ${stock}`);
+            });
+            if (numero === ultimaRevision) {
+                avisoStock.innerText = faltantes.length ? `Stock insuficiente. ${faltantes.join('; ')}.` : '';
+                avisoStock.style.display = faltantes.length ? 'block' : 'none';
+            }
+            return faltantes.length === 0;
+        })
+        .catch(() => true);
+    }
+
+    // Mientras la página está a la vista, el stock del carrito se revisa cada SEGUNDOS_REVISION_STOCK
+    setInterval(function() {
+        if (!document.hidden) verificarStock();
+    }, SEGUNDOS_REVISION_STOCK * 1000);
+
+    // Antes de enviar: si algo ya no alcanza, se avisa aquí en lugar de que el servidor rechace el pedido
+    formulario.addEventListener('submit', function(e) {
+        e.preventDefault();
+        const boton = formulario.querySelector('button[type="submit"]');
+        boton.disabled = true;
+        verificarStock().then(function(alcanza) {
+            boton.disabled = false;
+            if (alcanza) formulario.submit();  // submit() no vuelve a disparar este evento
+        });
+    });
+});
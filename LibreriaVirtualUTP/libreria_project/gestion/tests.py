@@ -1,3 +1,1325 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import PaginadorConteoAcotado
+from .models import (
+    Categoria, Cliente, Producto, PersonalDelivery, Pedido, DetallePedido, MovimientoStock,
+    DescuentoCategoria, Promocion, EventoCambio, ResumenCliente, Almacen, StockAlmacen, EntregaSincronizada,
+    ConteoFaceta, PedidoArchivado, DetallePedidoArchivado, SnapshotStock,
+)
+from . import (
+    pedidos, precios, limitador, analitica, archivo, cambios, historial, inventario, metricas, salud, facetas,
+    disponibilidad, asignacion,
+)
+
+
+def crear_datos(n, prefijo='x'):
+    """Crea n filas de cada modelo (con sus relaciones) para las pruebas."""
+    categoria = Categoria.objects.create(nombre=f"Categoría {prefijo}")
+    personal = PersonalDelivery.objects.create(dni=f"P{prefijo}", nombres="Repartidor", apellidos=prefijo)
+    for i in range(n):
+        cliente = Cliente.objects.create(
+            dni=f"{prefijo}{i}", nombres=f"Nombre {i}", apellidos=f"Apellido {i}",
+            correo=f"{prefijo}{i}@correo.com", distrito="Lince",
+        )
+        producto = Producto.objects.create(
+            numero_serie=f"S{prefijo}{i}", nombre=f"Producto {i}", precio=Decimal('10.00'),
+            stock=10, categoria=categoria,
+        )
+        StockAlmacen.objects.create(producto=producto, almacen_id=inventario.almacen_principal(), stock=10)
+        pedido = Pedido.objects.create(cliente=cliente, personal_delivery=personal)
+        DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=1, precio_unitario=producto.precio)
+        MovimientoStock.objects.create(producto=producto, tipo='Venta', cantidad=-1, pedido=pedido)
+
+
+class KardexTests(TestCase):
+    """El stock se reconstruye desde el kardex: último snapshot + movimientos posteriores."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(1, prefijo='k')   # Cliente 'k0' y repartidor 'Pk'
+        cls.producto = Producto.objects.create(numero_serie='K1', nombre="Cuaderno", precio=Decimal('10.00'))
+
+    def mover(self, tipo, cantidad):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            return inventario.registrar_movimiento(self.producto, tipo, cantidad)[-1]
+
+    def stock_actual(self):
+        return sum(StockAlmacen.objects.filter(producto_id='K1').values_list('stock', flat=True))
+
+    def test_snapshot_mas_deltas_es_el_stock_actual(self):
+        self.mover('Importacion', 10)
+        ajuste = self.mover('Ajuste', -3)
+        ahora = timezone.now()
+        corte = ahora - inventario.MARGEN_SNAPSHOT
+        # Justo en el borde del margen: entra en el snapshot
+        MovimientoStock.objects.filter(producto_id='K1').update(fecha=corte)
+        reciente = self.mover('Ajuste', 4)
+        MovimientoStock.objects.filter(pk=reciente.pk).update(fecha=corte + timedelta(seconds=1))
+
+        with mock.patch('gestion.inventario.timezone.now', return_value=ahora):
+            inventario.tomar_snapshots()
+        snapshot = SnapshotStock.objects.get(producto_id='K1')
+        self.assertEqual((snapshot.stock, snapshot.fecha), (7, corte))
+        self.assertEqual(snapshot.ultimo_movimiento, ajuste.pk)
+
+        self.mover('Ajuste', -2)   # Posterior al snapshot
+        self.assertEqual(inventario.stock_segun_kardex(self.producto), 9)
+        self.assertEqual(inventario.stock_segun_kardex(self.producto), self.stock_actual())
+        self.assertEqual(Producto.objects.get(pk='K1').stock, 9)
+        self.assertEqual(inventario.stock_segun_kardex(self.producto, fecha=corte), 7)
+        self.assertFalse([fila for fila in inventario.reconciliar() if fila[0] == 'K1'])
+
+    def test_sin_snapshot_suma_todo_el_kardex(self):
+        self.mover('Importacion', 5)
+        self.mover('Ajuste', -1)
+        self.assertFalse(SnapshotStock.objects.filter(producto_id='K1').exists())
+        self.assertEqual(inventario.stock_segun_kardex(self.producto), 4)
+        self.assertEqual(self.stock_actual(), 4)
+
+    def test_cancelar_desde_el_admin_devuelve_el_stock(self):
+        self.mover('Importacion', 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            numero = pedidos.crear_pedidos([{'cliente_dni': 'k0', 'personal_dni': 'Pk',
+                                             'productos': [{'serie': 'K1', 'cantidad': 3}]}])[0]['numero_pedido']
+        entregado = Pedido.objects.exclude(pk=numero).get()
+        Pedido.objects.filter(pk=entregado.pk).update(estado_pedido='Entregado')
+        self.assertEqual(self.stock_actual(), 7)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@correo.com', 'clave'))
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(reverse('admin:gestion_pedido_changelist'), {
+                'action': 'cancelar_pedidos', '_selected_action': [numero, entregado.pk],
+            }, follow=True)
+        mensajes = [str(m) for m in respuesta.context['messages']]
+        self.assertIn("1 pedido(s) cancelado(s); su stock volvió a los almacenes.", mensajes)
+        self.assertIn(f"No estaban pendientes (no se cancelaron): {entregado.pk}.", mensajes)
+        self.assertEqual(Pedido.objects.get(pk=numero).estado_pedido, 'Cancelado')
+        self.assertEqual(self.stock_actual(), 10)
+        self.assertEqual(inventario.stock_segun_kardex(self.producto), 10)
+        self.assertEqual(Producto.objects.get(pk='K1').stock, 10)
+
+        # Borrar no devuelve el stock: el admin solo ofrece cancelar, y el cliente ya no se cambia
+        self.assertEqual(self.client.post(reverse('admin:gestion_pedido_delete', args=[numero]),
+                                          {'post': 'yes'}).status_code, 403)
+        respuesta = self.client.get(reverse('admin:gestion_pedido_change', args=[numero]))
+        self.assertNotIn('cliente', respuesta.context['adminform'].form.fields)
+        self.assertIn('cliente', respuesta.context['adminform'].readonly_fields)
+
+
+class AsignacionTests(TestCase):
+    """Plan de asignación por afinidad de distrito y espacio libre; la carga se reserva al elegir."""
+
+    def indice(self, capacidades, pendientes=()):
+        indice = asignacion.IndiceCarga()
+        indice.cargar(capacidades.items(), pendientes)
+        return indice
+
+    def test_afinidad_de_distrito_antes_que_espacio_libre(self):
+        indice = self.indice({'A': 5, 'B': 5}, [('A', 'Lince', 1)])
+        self.assertEqual(indice.planificar({' lince ': [1, 2]}), {1: 'A', 2: 'A'})
+        # Lleno, el repartidor del distrito ya no recibe: pasa al de más espacio
+        indice = self.indice({'A': 1, 'B': 5}, [('A', 'LINCE', 1)])
+        self.assertEqual(indice.planificar({'Lince': [1]}), {1: 'B'})
+
+    def test_sin_afinidad_al_de_mas_espacio_y_sin_pasar_la_capacidad(self):
+        indice = self.indice({'A': 5, 'B': 4}, [('A', 'Surco', 3)])
+        self.assertEqual(set(indice.planificar({'Lince': [1, 2, 3]}).values()), {'B'})
+        plan = indice.planificar({'Lince': list(range(7))})
+        self.assertEqual(sorted(plan.values()), ['A', 'A', 'B', 'B', 'B', 'B'])   # Uno queda sin asignar
+        self.assertEqual(indice.pendientes['B'], 0)   # Sin aplicar=True el índice no cambia
+
+        plan = indice.planificar({'Lince': [1, 2]}, aplicar=True)
+        self.assertEqual(indice.pendientes['B'], 2)
+        self.assertEqual(indice.por_distrito['LINCE']['B'], 2)
+        self.assertEqual(indice.planificar({'Miraflores': [9]}), {9: 'A'})   # Empate en espacio libre: por dni
+
+    def test_la_reserva_ocupa_el_lugar_y_se_devuelve_si_se_revierte(self):
+        crear_datos(1, prefijo='j')   # 'Pj' con un pedido pendiente en Lince
+        PersonalDelivery.objects.filter(dni='Pj').update(capacidad=2)
+        asignacion.invalidar()
+        self.addCleanup(asignacion.invalidar)
+        indice = asignacion.obtener_indice()
+
+        with asignacion.reserva({'Lince': [1]}) as plan:
+            self.assertEqual(plan, {1: 'Pj'})
+            # Otro lote antes del commit del primero ya no tiene lugar
+            with asignacion.reserva({'Lince': [2]}) as otro:
+                self.assertEqual(otro, {})
+        self.assertEqual(indice.pendientes['Pj'], 2)
+
+        with mock.patch.object(historial, 'registrar_pedidos', side_effect=DatabaseError("falla")):
+            with self.assertRaises(DatabaseError):
+                pedidos.crear_pedidos([{'cliente_dni': 'j0', 'productos': [{'serie': 'Sj0', 'cantidad': 1}]}])
+        self.assertEqual(indice.pendientes['Pj'], 2)   # Solo la reserva anterior
+
+        indice.pedido_cerrado('Pj', 'Lince')
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = pedidos.crear_pedidos([{'cliente_dni': 'j0',
+                                                'productos': [{'serie': 'Sj0', 'cantidad': 1}]}])[0]
+        self.assertEqual(resultado['personal_dni'], 'Pj')
+        self.assertEqual((indice.pendientes['Pj'], indice.por_distrito['LINCE']['Pj']), (2, 2))   # Una sola vez
+
+    def test_asignar_pendientes_solo_registra_los_que_actualizo(self):
+        crear_datos(3, prefijo='q')   # 'Pq' con tres pedidos en Lince
+        Pedido.objects.update(personal_delivery=None)
+        PersonalDelivery.objects.create(dni='Pq2', nombres="Otro", apellidos="q")
+        asignacion.invalidar()
+        self.addCleanup(asignacion.invalidar)
+        numeros = sorted(Pedido.objects.values_list('pk', flat=True))
+        planificar = asignacion.IndiceCarga.planificar
+
+        def planificar_y_otro_proceso(indice, grupos, aplicar=False):
+            plan = planificar(indice, grupos, aplicar)
+            # Mientras tanto, otro proceso asigna uno y cancela otro
+            Pedido.objects.filter(pk=numeros[0]).update(personal_delivery_id='Pq2')
+            Pedido.objects.filter(pk=numeros[1]).update(estado_pedido='Cancelado')
+            return plan
+
+        with mock.patch.object(asignacion.IndiceCarga, 'planificar', planificar_y_otro_proceso):
+            self.assertEqual(asignacion.asignar_pendientes(), (1, 2))
+        self.assertEqual(list(EventoCambio.objects.values_list('clave', 'datos')),
+                         [(str(numeros[2]), {'personal_delivery_id': 'Pq'})])
+        self.assertEqual(Pedido.objects.get(pk=numeros[0]).personal_delivery_id, 'Pq2')
+        self.assertIsNone(Pedido.objects.get(pk=numeros[1]).personal_delivery_id)
+
+
+class AdminConsultasTests(TestCase):
+    """
+    Cada listado del admin debe hacer la misma cantidad de consultas
+    sin importar cuántas filas muestre (nada de N+1).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@correo.com', 'clave')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def contar_consultas(self, modelo):
+        url = reverse(f'admin:gestion_{modelo._meta.model_name}_changelist')
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas)
+
+    def assertConsultasConstantes(self, modelo):
+        crear_datos(2, prefijo='a')
+        pocas = self.contar_consultas(modelo)
+        crear_datos(12, prefijo='b')
+        muchas = self.contar_consultas(modelo)
+        self.assertEqual(pocas, muchas)
+
+    def test_changelist_categoria(self):
+        self.assertConsultasConstantes(Categoria)
+
+    def test_changelist_cliente(self):
+        self.assertConsultasConstantes(Cliente)
+
+    def test_changelist_producto(self):
+        self.assertConsultasConstantes(Producto)
+
+    def test_changelist_personal(self):
+        self.assertConsultasConstantes(PersonalDelivery)
+
+    def test_changelist_pedido(self):
+        self.assertConsultasConstantes(Pedido)
+
+    def test_changelist_detalle_pedido(self):
+        self.assertConsultasConstantes(DetallePedido)
+
+    def test_changelist_movimiento_stock(self):
+        self.assertConsultasConstantes(MovimientoStock)
+
+    def test_registros_de_la_aplicacion_son_de_solo_lectura(self):
+        crear_datos(1, prefijo='e')
+        detalle = DetallePedido.objects.get()
+        for modelo in (DetallePedido, MovimientoStock, SnapshotStock, EventoCambio, EntregaSincronizada):
+            nombre = modelo._meta.model_name
+            self.assertEqual(self.client.get(reverse(f'admin:gestion_{nombre}_add')).status_code, 403)
+            self.assertEqual(self.client.get(reverse(f'admin:gestion_{nombre}_changelist')).status_code, 200)
+        url = reverse('admin:gestion_detallepedido_change', args=[detalle.pk])
+        self.client.post(url, {'pedido': detalle.pedido_id, 'producto': detalle.producto_id,
+                               'cantidad': 99, 'precio_unitario': 1})
+        borrar = reverse('admin:gestion_detallepedido_delete', args=[detalle.pk])
+        self.assertEqual(self.client.post(borrar, {'post': 'yes'}).status_code, 403)
+        detalle.refresh_from_db()
+        self.assertNotEqual(detalle.cantidad, 99)
+
+    def test_borrar_cliente_desde_el_admin_es_baja_logica(self):
+        crear_datos(2, prefijo='g')
+        url = reverse('admin:gestion_cliente_delete', args=['g0'])
+        self.assertEqual(self.client.post(url, {'post': 'yes'}).status_code, 302)
+        cliente = Cliente.todos.get(pk='g0')
+        self.assertTrue(cliente.eliminado)
+        self.assertEqual(cliente.pedido_set.count(), 1)   # Sus pedidos siguen ahí
+
+        listado = reverse('admin:gestion_cliente_changelist')
+        self.assertContains(self.client.get(listado, {'eliminado__exact': 1}), "1 cliente")
+        autocompletar = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'gestion', 'model_name': 'pedido', 'field_name': 'cliente', 'term': 'Apellido',
+        })
+        self.assertEqual([r['id'] for r in autocompletar.json()['results']], ['g1'])
+
+    def test_change_form_pedido_lineas_en_una_consulta(self):
+        crear_datos(1, prefijo='c')
+        pedido = Pedido.objects.get()
+        for i in range(5):
+            producto = Producto.objects.create(numero_serie=f"extra{i}", nombre="Extra", precio=1, stock=1)
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=1, precio_unitario=1)
+
+        url = reverse('admin:gestion_pedido_change', args=[pedido.pk])
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        consultas_detalle = [q['sql'] for q in consultas if 'gestion_detallepedido' in q['sql']]
+        self.assertEqual(len(consultas_detalle), 1)
+
+    def test_conteo_acotado(self):
+        crear_datos(5, prefijo='d')
+        paginador = PaginadorConteoAcotado(Cliente.objects.order_by('dni'), 2)
+        paginador.LIMITE = 3
+        self.assertEqual(paginador.count, 3)
+        self.assertTrue(paginador.acotado)
+
+        url = reverse('admin:gestion_cliente_changelist')
+        with mock.patch.object(PaginadorConteoAcotado, 'LIMITE', 3):
+            self.assertContains(self.client.get(url), "3+ clientes")
+        self.assertContains(self.client.get(url), "5 clientes")
+
+
+class EdicionConcurrenteTests(TestCase):
+    """
+    Una venta que ocurre entre que se abre el formulario de edición y se
+    guarda no debe ser pisada por el stock viejo del formulario.
+    """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@correo.com', 'clave'))
+        self.categoria = Categoria.objects.create(nombre="Útiles")
+        self.producto = Producto.objects.create(numero_serie='S1', nombre="Cuaderno", precio=Decimal('5.00'),
+                                                stock=10, categoria=self.categoria)
+        StockAlmacen.objects.create(producto=self.producto, almacen_id=inventario.almacen_principal(), stock=10)
+        self.cliente = Cliente.objects.create(dni='12345678', nombres="Ana", apellidos="Quispe",
+                                              correo="ana@correo.com", distrito="Lince")
+        PersonalDelivery.objects.create(dni='87654321', nombres="Luis", apellidos="Rojas")
+
+    def formulario_producto(self, **cambios):
+        # Lo que el navegador envía con los valores que se cargaron en el formulario
+        respuesta = self.client.get(reverse('producto_update', args=['S1']))
+        producto = respuesta.context['producto']
+        datos = {
+            'version': producto.version, 'nombre': producto.nombre, 'descripcion': '',
+            'precio': str(producto.precio), 'stock': producto.stock, 'categoria': self.categoria.id,
+            'color': '', 'dimensiones': '',
+        }
+        datos.update(cambios)
+        return datos
+
+    def vender(self, cantidad):
+        # El total de Producto.stock (y su versión) se actualiza tras el commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('registrar_pedido'), {
+                'cliente_dni': '12345678', 'personal_dni': '87654321', 'fecha_entrega': '2030-01-01',
+                'producto_serie[]': ['S1'], 'cantidad[]': [str(cantidad)],
+            })
+
+    def test_edicion_desactualizada_no_pisa_la_venta(self):
+        datos = self.formulario_producto(nombre="Cuaderno A4")
+        self.vender(3)  # Otra operación descuenta stock mientras el formulario está abierto
+
+        respuesta = self.client.post(reverse('producto_update', args=['S1']), datos)
+
+        self.assertRedirects(respuesta, reverse('producto_update', args=['S1']))
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 7)
+        self.assertEqual(self.producto.nombre, "Cuaderno")
+
+    def test_edicion_vigente_solo_toca_campos_modificados(self):
+        datos = self.formulario_producto(nombre="Cuaderno A4")
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(reverse('producto_update', args=['S1']), datos)
+
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.nombre, "Cuaderno A4")
+        self.assertEqual(self.producto.version, 2)
+        update = [q['sql'] for q in consultas if q['sql'].startswith('UPDATE "gestion_producto"')]
+        self.assertEqual(len(update), 1)
+        self.assertIn('"nombre"', update[0])
+        self.assertIn('"version" = 1', update[0])  # WHERE ... version = 1
+        for campo in ('"stock"', '"precio"', '"descripcion"'):
+            self.assertNotIn(campo, update[0])
+
+    def test_ajuste_de_stock_va_al_kardex(self):
+        datos = self.formulario_producto(stock=15)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('producto_update', args=['S1']), datos)
+
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 15)
+        self.assertEqual(MovimientoStock.objects.get(producto=self.producto).cantidad, 5)
+
+    def test_cliente_edicion_desactualizada(self):
+        respuesta = self.client.get(reverse('cliente_update', args=['12345678']))
+        version = respuesta.context['cliente'].version
+        Cliente.objects.filter(pk='12345678').update(distrito="Surco", version=version + 1)
+
+        self.client.post(reverse('cliente_update', args=['12345678']), {
+            'version': version, 'nombres': "Ana María", 'apellidos': "Quispe", 'direccion': '',
+            'distrito': "Lince", 'correo': "ana@correo.com", 'celular': '',
+        })
+
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.nombres, "Ana")
+        self.assertEqual(self.cliente.distrito, "Surco")
+
+
+    def datos_admin(self, url, **cambios):
+        """Lo que envía el formulario del admin tal como se cargó (con sus inlines)."""
+        respuesta = self.client.get(url)
+        formularios = [respuesta.context['adminform'].form]
+        for inline in respuesta.context['inline_admin_formsets']:
+            formularios += [inline.formset.management_form, *inline.formset.forms]
+        datos = {}
+        for formulario in formularios:
+            for nombre in formulario.fields:
+                valor = formulario[nombre].value()
+                datos[formulario.add_prefix(nombre)] = '' if valor is None else valor
+        datos.update(cambios)
+        return datos
+
+    def test_admin_con_version_no_pisa_la_venta(self):
+        url = reverse('admin:gestion_producto_change', args=['S1'])
+        datos = self.datos_admin(url, nombre="Cuaderno A4")
+        self.assertNotIn('version', datos)
+        self.assertNotIn('eliminado', datos)
+        self.vender(3)
+
+        respuesta = self.client.post(url, datos)
+        self.assertEqual(respuesta.status_code, 200)    # Vuelve al formulario con el error
+        self.assertContains(respuesta, "El registro cambió mientras lo editaba")
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.nombre, self.producto.stock), ("Cuaderno", 7))
+
+        datos = self.datos_admin(url, nombre="Cuaderno A4")
+        Producto.objects.filter(pk='S1').update(stock=6)   # Total recalculado con el formulario abierto
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.client.post(url, datos).status_code, 302)
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.nombre, self.producto.stock, self.producto.version), ("Cuaderno A4", 6, 3))
+        update = [q['sql'] for q in consultas if q['sql'].startswith('UPDATE "gestion_producto"')]
+        self.assertEqual(len(update), 1)
+        self.assertNotIn('"stock"', update[0])
+
+
+class MotorPreciosTests(TestCase):
+    """Los montos del pedido los decide el servidor: descuentos, promociones e IGV."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('vendedor', password='clave')
+        crear_datos(2, prefijo='m')
+        cls.categoria = Categoria.objects.get()
+        DescuentoCategoria.objects.create(categoria=cls.categoria, porcentaje=Decimal('10'))
+        # Mejor que el de la categoría, pero solo desde 3 unidades
+        Promocion.objects.create(nombre="3x más barato", producto_id='Sm0', porcentaje=Decimal('25'),
+                                 cantidad_minima=3)
+
+    def setUp(self):
+        precios.invalidar()
+
+    def test_se_aplica_el_mayor_descuento_sin_acumular(self):
+        cotizacion = precios.cotizar_carrito([('Sm0', 3), ('Sm1', 1)])
+        lineas = {linea['serie']: linea for linea in cotizacion['lineas']}
+        self.assertEqual(lineas['Sm0']['descuento'], Decimal('7.50'))   # 25% de 30.00
+        self.assertEqual(lineas['Sm1']['descuento'], Decimal('1.00'))   # 10% de 10.00
+        self.assertEqual(cotizacion['subtotal'], Decimal('31.50'))
+        self.assertEqual(cotizacion['igv'], Decimal('5.67'))
+        self.assertEqual(cotizacion['total'], Decimal('37.17'))
+
+    def test_cambio_de_reglas_recompila_la_tabla(self):
+        precios.obtener_tabla()
+        DescuentoCategoria.objects.filter(categoria=self.categoria).get().delete()
+        cotizacion = precios.cotizar_carrito([('Sm1', 1)])
+        self.assertEqual(cotizacion['descuento'], Decimal('0'))
+
+    def test_pedido_guarda_el_descuento_cotizado(self):
+        resultado = pedidos.crear_pedidos([{
+            'cliente_dni': 'm0', 'personal_dni': 'Pm',
+            'productos': [{'serie': 'Sm0', 'cantidad': 2}, {'serie': 'Sm0', 'cantidad': 1}],
+        }])[0]
+        self.assertTrue(resultado['ok'])
+        detalle = DetallePedido.objects.get(pedido_id=resultado['numero_pedido'])
+        self.assertEqual((detalle.cantidad, detalle.descuento), (3, Decimal('7.50')))
+        self.assertEqual(resultado['total'], Decimal('26.55'))
+
+    def test_endpoint_cotizar(self):
+        self.client.force_login(self.usuario)
+        respuesta = self.client.post(reverse('api_cotizar'), {'productos': [{'serie': 'Sm1', 'cantidad': 2}]},
+                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['total'], '21.24')
+
+        respuesta = self.client.post(reverse('api_cotizar'), {'productos': [{'serie': 'NOEXISTE', 'cantidad': 1}]},
+                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas-login'}},
+    LIMITES_LOGIN={'ip': (6, 60), 'usuario': (3, 60)},
+)
+class LimiteLoginTests(TestCase):
+    """Los intentos de más se rechazan antes de llegar al hash de la contraseña."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('ana', password='clave-correcta')
+
+    def setUp(self):
+        cache.clear()
+        # Reloj fijo a mitad de ventana: si una prueba cruza el cambio de ventana, sus intentos se reparten
+        reloj = mock.patch('gestion.limitador.time.time', return_value=1230.0)
+        reloj.start()
+        self.addCleanup(reloj.stop)
+
+    def intentar(self, usuario='ana', contrasena='mala', ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {'usuario': usuario, 'contrasena': contrasena},
+                                REMOTE_ADDR=ip)
+
+    def test_usuario_bloqueado_sin_llamar_a_authenticate(self):
+        for _ in range(3):
+            self.assertEqual(self.intentar().status_code, 200)
+        with mock.patch('gestion.views.authenticate') as authenticate:
+            # Desde otra IP y con la clave correcta: el usuario sigue bloqueado
+            respuesta = self.intentar(contrasena='clave-correcta', ip='10.0.0.2')
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertIn('Retry-After', respuesta)
+        authenticate.assert_not_called()
+
+    def test_ip_bloqueada_aunque_cambie_de_usuario(self):
+        for i in range(6):
+            self.intentar(usuario=f"usuario{i}")
+        self.assertEqual(self.intentar(usuario='otro').status_code, 429)
+        self.assertEqual(self.intentar(usuario='otro', ip='10.0.0.9').status_code, 200)
+
+    def test_login_correcto_olvida_los_fallos(self):
+        self.intentar()
+        self.intentar()
+        self.assertEqual(self.intentar(contrasena='clave-correcta').status_code, 302)
+        self.client.logout()
+        self.intentar()
+        self.assertEqual(self.intentar().status_code, 200)
+
+    def test_ventana_deslizante(self):
+        with mock.patch('gestion.limitador.time.time', return_value=1200.0):
+            for _ in range(3):
+                self.intentar()
+            self.assertEqual(self.intentar().status_code, 429)
+        # A mitad de la ventana siguiente los fallos anteriores pesan la mitad (1.5 < 3)
+        with mock.patch('gestion.limitador.time.time', return_value=1290.0):
+            self.assertEqual(self.intentar().status_code, 200)
+
+    def test_metricas_de_bloqueos(self):
+        for _ in range(5):
+            self.intentar()
+        self.assertEqual(limitador.metricas()['bloqueos_usuario'], 2)
+
+        staff = User.objects.create_user('jefe', password='x', is_staff=True)
+        self.client.force_login(staff)
+        respuesta = self.client.get(reverse('api_metricas_login'))
+        self.assertEqual(respuesta.json()['bloqueos_total'], 2)
+
+
+class LimpiarSesionesTests(TestCase):
+
+    def test_borra_solo_las_vencidas_por_lotes(self):
+        ahora = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f"vencida{i}", session_data='', expire_date=ahora - timedelta(days=1)) for i in range(5)]
+            + [Session(session_key='vigente', session_data='', expire_date=ahora + timedelta(days=1))]
+        )
+        salida = StringIO()
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('limpiar_sesiones', lote=2, stdout=salida)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['vigente'])
+        self.assertEqual(sum(q['sql'].startswith('DELETE') for q in consultas.captured_queries), 3)
+        self.assertIn('5 sesión(es) vencidas borradas', salida.getvalue())
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_sesion_en_cookie_no_consulta_la_tabla(self):
+        self.client.force_login(User.objects.create_user('ana', password='clave'))
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('registrar_entrega'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(any('django_session' in q['sql'] for q in consultas.captured_queries))
+
+
+class ArchivoTests(TestCase):
+    """Archivo histórico por lotes, búsquedas que lo incluyen y borrado lógico."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(5, prefijo='z')
+        numeros = list(Pedido.objects.order_by('pk').values_list('pk', flat=True))
+        Pedido.objects.filter(pk__in=numeros[:2]).update(estado_pedido='Entregado')
+        Pedido.objects.filter(pk=numeros[2]).update(estado_pedido='Cancelado')
+        cls.numeros = numeros
+
+    def test_archiva_por_lotes_solo_los_cerrados(self):
+        manana = timezone.now() + timedelta(days=1)
+        self.assertEqual(archivo.archivar_pedidos(timezone.now() - timedelta(days=1)), 0)   # Más nuevos que el corte
+        salida = StringIO()
+        with mock.patch.object(archivo, 'archivar_pedidos', wraps=archivo.archivar_pedidos) as archivar:
+            call_command('archivar_pedidos', dias=-1, lote=2, stdout=salida)
+        archivar.assert_called_once_with(mock.ANY, lote=2)
+        self.assertIn("3 pedido(s) anteriores al", salida.getvalue())
+        self.assertEqual(list(Pedido.objects.values_list('pk', flat=True).order_by('pk')), self.numeros[3:])
+        self.assertEqual(list(PedidoArchivado.objects.values_list('pk', flat=True).order_by('pk')), self.numeros[:3])
+        self.assertEqual(DetallePedidoArchivado.objects.filter(pedido_id__in=self.numeros[:3]).count(), 3)
+        self.assertFalse(DetallePedido.objects.filter(pedido_id__in=self.numeros[:3]).exists())
+        self.assertEqual(archivo.archivar_pedidos(manana), 0)
+
+    def test_busqueda_mezcla_vigentes_y_archivados_con_limite(self):
+        archivo.archivar_pedidos(timezone.now() + timedelta(days=1))
+        Pedido.objects.filter(pk=self.numeros[4]).update(fecha_entrega='2026-01-05')
+        PedidoArchivado.objects.filter(pk=self.numeros[0]).update(fecha_entrega='2026-01-10')
+        PedidoArchivado.objects.filter(pk=self.numeros[1]).update(fecha_entrega='2026-01-01')
+
+        self.assertEqual(archivo.pedidos_con_archivo(Q()).count(), 2)
+        with self.assertNumQueries(2):   # Una por tabla, ya ordenada y cortada en la BD
+            encontrados = archivo.pedidos_con_archivo(Q(), '-fecha_entrega', incluir_archivo=True, limite=4)
+        self.assertEqual([(p.numero_pedido, p.archivado) for p in encontrados], [
+            (self.numeros[0], True), (self.numeros[4], False), (self.numeros[1], True),
+            (self.numeros[3], False),   # Sin fecha de entrega: al final
+        ])
+        ascendente = archivo.pedidos_con_archivo(Q(), 'fecha_entrega', incluir_archivo=True)
+        self.assertEqual([p.numero_pedido for p in ascendente][-3:], [self.numeros[i] for i in (1, 4, 0)])
+
+    def test_eliminar_logico_oculta_sin_borrar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(archivo.eliminar_logico(Producto, 'Sz0'))
+            self.assertTrue(archivo.eliminar_logico(Cliente, 'z0'))
+        self.assertFalse(archivo.eliminar_logico(Producto, 'Sz0'))   # Ya estaba dado de baja
+        self.assertFalse(archivo.eliminar_logico(Producto, 'NOEXISTE'))
+
+        self.assertFalse(Producto.objects.filter(pk='Sz0').exists())
+        producto = Producto.todos.get(pk='Sz0')
+        self.assertTrue(producto.eliminado)
+        self.assertIsNotNone(producto.fecha_eliminacion)
+        self.assertEqual(producto.version, 2)
+        self.assertEqual(Cliente.objects.count(), 4)
+        self.assertEqual(Cliente.todos.count(), 5)
+        # Sus pedidos y líneas lo siguen referenciando
+        self.assertEqual(DetallePedido.objects.get(producto_id='Sz0').producto.nombre, 'Producto 0')
+        self.assertEqual(sorted(EventoCambio.objects.filter(operacion='baja').values_list('entidad', 'clave')),
+                         [('Cliente', 'z0'), ('Producto', 'Sz0')])
+
+
+class ApiPedidosTests(TestCase):
+    """POST /api/pedidos/: varios pedidos por llamada, cuerpo en gzip y un resultado por pedido."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(2, prefijo='k')
+        cls.usuario = User.objects.create_user('integracion', password='x')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def enviar(self, datos, comprimir=False, **cabeceras):
+        cuerpo = json.dumps(datos).encode()
+        if comprimir:
+            cuerpo = gzip.compress(cuerpo)
+            cabeceras['HTTP_CONTENT_ENCODING'] = 'gzip'
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('api_pedidos'), cuerpo, content_type='application/json', **cabeceras)
+
+    def pedido(self, dni='k0', productos=None):
+        return {'cliente_dni': dni, 'personal_dni': 'Pk', 'fecha_entrega': '2030-01-15',
+                'productos': [{'serie': 'Sk0', 'cantidad': 2}] if productos is None else productos}
+
+    def test_lote_en_gzip_con_resultados_mixtos(self):
+        respuesta = self.enviar({'pedidos': [
+            self.pedido(), self.pedido(dni='NOEXISTE'), self.pedido(productos=5),
+            self.pedido(productos=[{'serie': 'Sk1', 'cantidad': 11}]), self.pedido(dni='k1'),
+        ]}, comprimir=True)
+        self.assertEqual(respuesta.status_code, 201)
+        datos = respuesta.json()
+        self.assertEqual((datos['creados'], datos['rechazados']), (2, 3))
+        resultados = datos['resultados']
+        self.assertEqual([r['ok'] for r in resultados], [True, False, False, False, True])
+        self.assertEqual(resultados[0]['total'], '23.60')   # 2 x 10.00 + IGV, como texto
+        self.assertIn('NOEXISTE', resultados[1]['error'])
+        self.assertEqual(resultados[2]['error'], "'productos' debe ser una lista.")
+        self.assertEqual(resultados[3]['error'], "Stock insuficiente para Producto 1. Disponible: 10")
+        self.assertEqual(StockAlmacen.objects.get(producto_id='Sk0').stock, 6)
+        self.assertEqual(Producto.objects.get(pk='Sk0').stock, 6)
+
+    def test_todos_rechazados_es_400(self):
+        respuesta = self.enviar({'pedidos': [self.pedido(dni='NOEXISTE')]})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['creados'], 0)
+
+    def test_limites_y_cuerpos_invalidos(self):
+        url = reverse('api_pedidos')
+        self.assertEqual(self.enviar({'pedidos': []}).status_code, 400)
+        self.assertEqual(self.enviar({'pedidos': {'a': 1}}).status_code, 400)
+        with mock.patch('gestion.api.MAX_PEDIDOS_POR_LLAMADA', 2):
+            respuesta = self.enviar({'pedidos': [self.pedido()] * 3})
+        self.assertEqual((respuesta.status_code, respuesta.json()['error']), (400, "Máximo 2 pedidos por llamada."))
+        with mock.patch('gestion.api.MAX_CUERPO_DESCOMPRIMIDO', 100):
+            respuesta = self.enviar({'pedidos': [self.pedido()] * 10}, comprimir=True)
+        self.assertEqual(respuesta.json()['error'], "El cuerpo descomprimido es demasiado grande.")
+        self.assertEqual(self.client.post(url, b'no es gzip', content_type='application/json',
+                                          HTTP_CONTENT_ENCODING='gzip').status_code, 400)
+        self.assertEqual(self.client.post(url, {'pedidos': '1'}).status_code, 400)   # Formulario, no JSON
+        self.assertEqual(Pedido.objects.count(), 2)   # Solo los de crear_datos()
+
+    def test_sin_sesion_es_401(self):
+        self.client.logout()
+        self.assertEqual(self.enviar({'pedidos': [self.pedido()]}).status_code, 401)
+        self.assertEqual(Pedido.objects.count(), 2)
+
+
+class AnaliticaVentasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(4, prefijo='v')   # 4 pedidos de S/ 10.00 en 'Lince'
+        Pedido.objects.filter(cliente_id='v3').update(estado_pedido='Cancelado')
+        Pedido.objects.filter(cliente_id='v2').update(estado_pedido='Entregado')
+        archivo.archivar_pedidos(timezone.now() + timedelta(days=1))  # Archiva el entregado (y el cancelado)
+        DetallePedido.objects.filter(pedido__cliente_id='v0').update(cantidad=3, descuento=Decimal('4.50'))
+
+    def test_reporte_por_bloques_incluye_el_archivo(self):
+        # Bloques de 1 línea: el resultado no depende del tamaño del bloque
+        reporte = analitica.reporte_ventas(tamano=1)
+        self.assertEqual(reporte['lineas'], 3)
+        self.assertEqual(reporte['ingresos_total'], Decimal('45.50'))  # 25.50 + 10 + 10 (archivado)
+        self.assertEqual([(f['nombre'], f['unidades']) for f in reporte['por_distrito']], [('LINCE', 5)])
+        self.assertEqual(reporte['por_categoria'][0]['nombre'], 'Categoría v')
+        self.assertEqual(reporte['productos_abc'][0], {'serie': 'Sv0', 'clase': 'A', 'ingresos': Decimal('25.50')})
+        self.assertEqual(reporte['cohortes'][0]['clientes'], 3)
+
+        sin_archivo = analitica.reporte_ventas(incluir_archivo=False)
+        self.assertEqual(sin_archivo['ingresos_total'], Decimal('35.50'))
+
+    def test_vista_y_exportacion_csv(self):
+        self.client.force_login(User.objects.create_user('analista', password='x'))
+        respuesta = self.client.get(reverse('reporte_ventas'), {'generar': '1', 'incluir_archivo': '1'})
+        self.assertContains(respuesta, 'S/ 45.50')
+
+        with tempfile.TemporaryDirectory() as carpeta:
+            call_command('exportar_analitica', carpeta, stdout=StringIO())
+            with open(f"{carpeta}/ventas_por_distrito.csv", encoding='utf-8') as f:
+                self.assertEqual(f.read().splitlines()[1], 'LINCE,5,45.50,100.0')
+
+
+@mock.patch.object(cambios, 'MARGEN_LECTURA', timedelta(0))
+class FeedCambiosTests(TestCase):
+    """Cada escritura deja su evento en la misma transacción; se lee por cursor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(2, prefijo='f')
+        cls.staff = User.objects.create_user('bi', password='x', is_staff=True)
+
+    def nuevo_pedido(self):
+        # El stock total (y su evento) se actualiza tras el commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return pedidos.crear_pedidos([{
+                'cliente_dni': 'f0', 'personal_dni': 'Pf', 'productos': [{'serie': 'Sf0', 'cantidad': 2}],
+            }])[0]
+
+    def test_pedido_y_entrega_generan_eventos(self):
+        numero = self.nuevo_pedido()['numero_pedido']
+        pedidos.registrar_entrega(numero, '2025-01-15', 'Recibido')
+        eventos, _ = cambios.leer()
+        # La variación se escribe con la venta; el total recalculado, tras el commit
+        self.assertEqual([(e.entidad, e.operacion) for e in eventos], [
+            ('Producto', 'movimiento'), ('Pedido', 'alta'), ('Producto', 'modificacion'), ('Pedido', 'modificacion'),
+        ])
+        self.assertEqual(eventos[0].datos, {'delta': -2, 'tipo': 'Venta'})
+        self.assertEqual(eventos[1].datos['detalles'][0]['cantidad'], 2)
+        self.assertEqual(eventos[2].datos['stock'], 8)
+        self.assertEqual(eventos[3].datos['estado_pedido'], 'Entregado')
+        self.assertEqual(eventos[3].datos['fecha_entrega'], '2025-01-15')
+
+    def test_sin_commit_no_hay_evento(self):
+        with mock.patch.object(cambios, 'registrar_lote', side_effect=RuntimeError("falla")):
+            with self.assertRaises(RuntimeError):
+                self.nuevo_pedido()
+        self.assertFalse(EventoCambio.objects.exists())
+        self.assertEqual(StockAlmacen.objects.get(producto_id='Sf0').stock, 10)
+        self.assertEqual(Producto.objects.get(pk='Sf0').stock, 10)
+
+    def test_endpoint_pagina_por_cursor(self):
+        for _ in range(3):
+            self.nuevo_pedido()
+        self.client.force_login(self.staff)
+        vistos, cursor, hay_mas = [], 0, True
+        while hay_mas:
+            datos = self.client.get(reverse('api_cambios'), {'desde': cursor, 'limite': 2,
+                                                             'entidad': 'Pedido'}).json()
+            vistos += [c['seq'] for c in datos['cambios']]
+            cursor, hay_mas = datos['siguiente'], datos['hay_mas']
+        self.assertEqual(len(vistos), 3)
+        self.assertEqual(vistos, sorted(vistos))
+
+        salida = StringIO()
+        call_command('exportar_cambios', desde=vistos[0], lote=2, stdout=salida, stderr=StringIO())
+        # Después del primer pedido: su stock y los otros dos pedidos con su variación y su stock
+        self.assertEqual(len(salida.getvalue().splitlines()), 7)
+
+    def test_exportar_con_lote_mayor_al_limite_de_lectura(self):
+        for _ in range(3):
+            self.nuevo_pedido()
+        salida = StringIO()
+        with mock.patch.object(cambios, 'LIMITE_MAXIMO', 2):
+            call_command('exportar_cambios', lote=1000, stdout=salida, stderr=StringIO())
+        self.assertEqual(len(salida.getvalue().splitlines()), EventoCambio.objects.count())
+
+    def test_cambios_desde_el_admin_generan_eventos(self):
+        peticion = mock.Mock(user=self.staff)
+        cliente = Cliente.objects.get(pk='f0')
+        cliente.celular = '999888777'
+        formulario = mock.Mock(changed_data=['celular'], cleaned_data={'version_original': cliente.version})
+        admin.site._registry[Cliente].save_model(peticion, cliente, formulario, True)
+        nuevo = Producto(numero_serie='ADM-1', nombre='Desde el admin', precio=Decimal('5.00'))
+        admin_productos = admin.site._registry[Producto]
+        admin_productos.save_model(peticion, nuevo, mock.Mock(changed_data=[]), False)
+        admin_productos.delete_queryset(peticion, Producto.objects.filter(pk='ADM-1'))
+
+        eventos, _ = cambios.leer()
+        self.assertEqual([(e.entidad, e.clave, e.operacion) for e in eventos], [
+            ('Cliente', 'f0', 'modificacion'), ('Producto', 'ADM-1', 'alta'), ('Producto', 'ADM-1', 'baja'),
+        ])
+        self.assertEqual(eventos[0].datos, {'celular': '999888777', 'version': 2})
+        self.assertEqual(eventos[1].datos['nombre'], 'Desde el admin')
+        self.assertTrue(eventos[2].datos['eliminado'])
+        self.assertTrue(Producto.todos.get(pk='ADM-1').eliminado)   # Baja lógica: la fila queda
+
+
+class EstaticosTests(TestCase):
+    """'collectstatic' deja CSS/JS versionados (hash), minificados y precomprimidos."""
+
+    def test_collectstatic_versiona_minifica_y_comprime(self):
+        with tempfile.TemporaryDirectory() as carpeta, override_settings(STATIC_ROOT=carpeta):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            url = staticfiles_storage.url('gestion/js/registrar_pedido.js')
+            self.assertRegex(url, r'registrar_pedido\.[0-9a-f]{12}\.js$')
+
+            nombre_css = staticfiles_storage.stored_name('gestion/css/registrar_pedido.css')
+            with open(f"{carpeta}/{nombre_css}", encoding='utf-8') as f:
+                css = f.read()
+            self.assertNotIn('\n', css)
+            self.assertIn('.btn-add{background-color:#28a745}', css)
+            with gzip.open(f"{carpeta}/{nombre_css}.gz", 'rt', encoding='utf-8') as f:
+                self.assertEqual(f.read(), css)
+
+            respuesta = self.client.get(reverse('login'))
+            self.assertContains(respuesta, staticfiles_storage.url('gestion/css/login.css'))
+            self.assertNotContains(respuesta, '<style>')
+
+
+class HistorialClienteTests(TestCase):
+    """Historial con líneas en consultas fijas, paginado por cursor, y totales mantenidos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(2, prefijo='h')
+        StockAlmacen.objects.update(stock=1000)
+        cls.usuario = User.objects.create_user('historial', password='x')
+
+    def crear(self, cantidad, n=1):
+        return pedidos.crear_pedidos([{
+            'cliente_dni': 'h1', 'personal_dni': 'Ph',
+            'productos': [{'serie': 'Sh0', 'cantidad': cantidad}, {'serie': 'Sh1', 'cantidad': 1}],
+        }] * n)
+
+    def test_resumen_se_mantiene_y_coincide_con_recalcular(self):
+        self.crear(2, n=2)
+        pedido = Pedido.objects.filter(cliente_id='h1').order_by('-numero_pedido').first()
+        inventario.cancelar_pedido(pedido)
+        resumen = ResumenCliente.objects.get(pk='h1')
+        self.assertEqual((resumen.pedidos, resumen.cancelados, resumen.unidades), (1, 1, 3))
+        self.assertEqual(resumen.importe, Decimal('30.00'))
+
+        # crear_datos() insertó un pedido sin pasar por el servicio: recalcular lo suma
+        historial.recalcular()
+        resumen = ResumenCliente.objects.get(pk='h1')
+        self.assertEqual((resumen.pedidos, resumen.cancelados, resumen.unidades), (2, 1, 4))
+        self.assertEqual(resumen.importe, Decimal('40.00'))
+
+    def test_resumenes_de_un_lote_con_consultas_fijas(self):
+        ResumenCliente.objects.create(cliente_id='h1', pedidos=5)   # 'h0' no tiene fila todavía
+        fecha = timezone.now()
+        lote = [(Pedido(cliente_id=dni, fecha_pedido=fecha), 2, Decimal('7.50')) for dni in ('h0', 'h1', 'h0')]
+        with CaptureQueriesContext(connection) as consultas:
+            historial.registrar_pedidos(lote)
+        self.assertLessEqual(len(consultas), 3)   # Altas en cero, bloqueo en orden y UN UPDATE
+        resumenes = {r.cliente_id: r for r in ResumenCliente.objects.all()}
+        self.assertEqual((resumenes['h0'].pedidos, resumenes['h0'].unidades, resumenes['h0'].importe),
+                         (2, 4, Decimal('15.00')))
+        self.assertEqual((resumenes['h1'].pedidos, resumenes['h1'].unidades), (6, 2))
+        self.assertEqual((resumenes['h0'].primer_pedido, resumenes['h0'].ultimo_pedido), (fecha, fecha))
+
+    def test_consultas_fijas_y_paginacion_por_cursor(self):
+        self.client.force_login(self.usuario)
+        url = reverse('cliente_historial', args=['h1'])
+        self.crear(1)
+        with CaptureQueriesContext(connection) as pocas:
+            self.client.get(url)
+        self.crear(1, n=historial.TAMANO_PAGINA)
+        with CaptureQueriesContext(connection) as muchas:
+            respuesta = self.client.get(url)
+        self.assertEqual(len(muchas), len(pocas))
+
+        numeros = [p.numero_pedido for p in respuesta.context['pedidos']]
+        self.assertEqual(len(numeros), historial.TAMANO_PAGINA)
+        self.assertEqual(numeros, sorted(numeros, reverse=True))
+        respuesta = self.client.get(url, {'antes': respuesta.context['siguiente']})
+        resto = [p.numero_pedido for p in respuesta.context['pedidos']]
+        self.assertEqual(len(resto), 2)   # El del servicio más antiguo y el de crear_datos()
+        self.assertLess(max(resto), min(numeros))
+        self.assertIsNone(respuesta.context['siguiente'])
+
+
+class StockPorAlmacenTests(TestCase):
+    """Cada venta descuenta la fila de un almacén; Producto.stock es el total tras el commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(1, prefijo='a')   # 'Sa0': 10 unidades en el almacén principal
+        Cliente.objects.create(dni='surco', nombres="Cliente", apellidos="Surco", correo="s@correo.com",
+                               distrito="Surco")
+        cls.principal = Almacen.objects.get(pk=inventario.almacen_principal())
+        cls.surco = Almacen.objects.create(nombre="Surco", distrito="SURCO", prioridad=5)
+        StockAlmacen.objects.filter(producto_id='Sa0').update(stock=5)
+        StockAlmacen.objects.create(producto_id='Sa0', almacen=cls.surco, stock=5)
+
+    def pedir(self, dni, cantidad):
+        with self.captureOnCommitCallbacks(execute=True):
+            return pedidos.crear_pedidos([{
+                'cliente_dni': dni, 'personal_dni': 'Pa', 'productos': [{'serie': 'Sa0', 'cantidad': cantidad}],
+            }])[0]
+
+    def stock(self):
+        filas = dict(StockAlmacen.objects.filter(producto_id='Sa0').values_list('almacen__nombre', 'stock'))
+        return filas['Principal'], filas['Surco'], Producto.objects.get(pk='Sa0').stock
+
+    def test_elige_el_almacen_del_distrito_y_reparte_si_no_alcanza(self):
+        self.assertTrue(self.pedir('surco', 3)['ok'])
+        self.assertEqual(self.stock(), (5, 2, 7))
+        self.assertTrue(self.pedir('a0', 1)['ok'])      # Lince: sin almacén propio, va el de mayor prioridad
+        self.assertEqual(self.stock(), (4, 2, 6))
+        resultado = self.pedir('surco', 5)               # Ninguno tiene 5: 2 de Surco y 3 del principal
+        self.assertTrue(resultado['ok'])
+        self.assertEqual(self.stock(), (1, 0, 1))
+        salidas = MovimientoStock.objects.filter(pedido_id=resultado['numero_pedido'])
+        self.assertEqual(sorted(salidas.values_list('almacen__nombre', 'cantidad')), [('Principal', -3), ('Surco', -2)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventario.cancelar_pedido(Pedido.objects.get(pk=resultado['numero_pedido']))
+        self.assertEqual(self.stock(), (4, 2, 6))        # Vuelve a los almacenes de donde salió
+
+    def test_sin_stock_suficiente_no_descuenta_nada(self):
+        resultado = self.pedir('surco', 11)
+        self.assertEqual(resultado, {'ok': False, 'error': "Stock insuficiente para Producto 0. Disponible: 10"})
+        self.assertEqual(self.stock(), (5, 5, 10))
+
+    def test_pedido_rechazado_no_consume_stock_de_los_siguientes_del_lote(self):
+        Producto.objects.create(numero_serie='Sb0', nombre="Agotado", precio=Decimal('1.00'),
+                                categoria=Producto.objects.get(pk='Sa0').categoria)
+        with self.captureOnCommitCallbacks(execute=True):
+            resultados = pedidos.crear_pedidos([
+                {'cliente_dni': 'a0', 'personal_dni': 'Pa',
+                 'productos': [{'serie': 'Sa0', 'cantidad': 10}, {'serie': 'Sb0', 'cantidad': 1}]},
+                {'cliente_dni': 'a0', 'personal_dni': 'Pa', 'productos': [{'serie': 'Sa0', 'cantidad': 10}]},
+            ])
+        self.assertEqual([r['ok'] for r in resultados], [False, True])
+        self.assertEqual(resultados[0]['error'], "Stock insuficiente para Agotado. Disponible: 0")
+        self.assertEqual(self.stock(), (0, 0, 0))
+
+    def test_foto_vieja_se_repite_con_las_filas_bloqueadas(self):
+        # Otra venta se lleva 3 unidades de Surco entre la foto y el UPDATE
+        original = inventario.existencias
+
+        def foto_vieja(series, bloquear=False):
+            foto = original(series, bloquear)
+            if not bloquear:
+                StockAlmacen.objects.filter(almacen=self.surco).update(stock=F('stock') - 3)
+            return foto
+
+        with mock.patch.object(inventario, 'existencias', side_effect=foto_vieja):
+            resultado = self.pedir('surco', 3)
+        self.assertTrue(resultado['ok'])                 # Surco ya no tiene 3: sale del principal
+        self.assertEqual(self.stock(), (2, 2, 4))
+
+    def test_un_update_de_stock_por_lote(self):
+        solicitud = {'cliente_dni': 'a0', 'personal_dni': 'Pa', 'productos': [{'serie': 'Sa0', 'cantidad': 1}]}
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertTrue(all(r['ok'] for r in pedidos.crear_pedidos([solicitud] * 8)))
+        descuentos = [q['sql'] for q in consultas if q['sql'].startswith('UPDATE "gestion_stockalmacen"')]
+        self.assertEqual(len(descuentos), 1)
+
+    def test_error_al_recalcular_el_total_no_afecta_al_pedido_grabado(self):
+        with mock.patch.object(inventario, '_actualizar_totales', side_effect=DatabaseError("Lock wait timeout")), \
+                self.assertLogs(level='ERROR'):
+            resultado = self.pedir('a0', 2)
+        self.assertTrue(resultado['ok'])
+        self.assertEqual(self.stock(), (3, 5, 10))      # El total queda desfasado hasta reconciliar_stock
+        inventario.actualizar_totales(['Sa0'])
+        self.assertEqual(self.stock(), (3, 5, 8))
+
+    def test_fila_tomada_por_otra_edicion_se_espera_al_final(self):
+        real = inventario._actualizar_totales
+        llamadas = []
+
+        def fila_tomada(series, esperar=False):
+            # La fila la tiene una edición del producto: skip_locked la salta en cada vuelta
+            llamadas.append(esperar)
+            if esperar:
+                real(series, esperar=True)
+
+        with mock.patch.object(inventario, '_actualizar_totales', side_effect=fila_tomada):
+            self.assertTrue(self.pedir('a0', 2)['ok'])
+        self.assertEqual(llamadas, [False] * inventario.MAX_VUELTAS_TOTALES + [True])
+        self.assertEqual(self.stock(), (3, 5, 8))
+
+    def test_reconciliar_corrige_totales_desfasados(self):
+        # Los datos de prueba no tienen kardex: solo interesa la verificación contra los almacenes
+        Producto.objects.filter(pk='Sa0').update(stock=99)
+        with self.assertRaisesMessage(CommandError, "1 con sus almacenes"):
+            call_command('reconciliar_stock', stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "0 con sus almacenes"):
+            call_command('reconciliar_stock', '--corregir-totales', stdout=StringIO())
+        self.assertEqual(Producto.objects.get(pk='Sa0').stock, 10)
+
+
+class SaludMetricasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(1, prefijo='m')
+
+    def test_sondas_sin_login(self):
+        with self.assertNumQueries(0):
+            respuesta = self.client.get('/healthz')
+        self.assertEqual((respuesta.status_code, respuesta.content), (200, b'ok'))
+
+        respuesta = self.client.get('/readyz')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['comprobaciones'],
+                         {'base_de_datos': 'ok', 'cache': 'ok', 'migraciones': 'ok'})
+
+        with mock.patch.dict(salud.COMPROBACIONES, cache=mock.Mock(side_effect=ConnectionError("caído"))):
+            respuesta = self.client.get('/readyz')
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta.json()['comprobaciones']['cache'], 'error')
+
+    def test_metricas_por_vista_pedidos_y_reservas(self):
+        peticiones = metricas.PETICIONES.valor('login', 'GET', 200)
+        creados = metricas.PEDIDOS_CREADOS.valor()
+        fallidas = metricas.RESERVAS_FALLIDAS.valor()
+
+        self.client.get(reverse('login'))
+        with self.captureOnCommitCallbacks(execute=True):
+            pedidos.crear_pedidos([
+                {'cliente_dni': 'm0', 'personal_dni': 'Pm', 'productos': [{'serie': 'Sm0', 'cantidad': 1}]},
+                {'cliente_dni': 'm0', 'personal_dni': 'Pm', 'productos': [{'serie': 'Sm0', 'cantidad': 500}]},
+            ])
+        self.assertEqual(metricas.PETICIONES.valor('login', 'GET', 200), peticiones + 1)
+        self.assertEqual(metricas.PEDIDOS_CREADOS.valor(), creados + 1)
+        self.assertEqual(metricas.RESERVAS_FALLIDAS.valor(), fallidas + 1)
+
+        self.client.get('/readyz')
+        texto = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE libreria_http_duracion_segundos histogram', texto)
+        self.assertIn('libreria_http_duracion_segundos_bucket{vista="login",le="+Inf"}', texto)
+        self.assertIn('libreria_db_consultas_total{vista="readyz"}', texto)
+        self.assertIn(f'libreria_pedidos_creados_total {creados + 1}', texto)
+
+    def test_histograma_acumula_cubetas(self):
+        histograma = metricas.Histograma('prueba_segundos', "Prueba.", limites=(0.1, 1))
+        metricas.REGISTRO.remove(histograma)
+        for valor in (0.05, 0.1, 0.5, 3):
+            histograma.observar(valor)
+        self.assertEqual(list(histograma.muestras()), [
+            'prueba_segundos_bucket{le="0.1"} 2',
+            'prueba_segundos_bucket{le="1.0"} 3',
+            'prueba_segundos_bucket{le="+Inf"} 4',
+            'prueba_segundos_sum 3.65',
+            'prueba_segundos_count 4',
+        ])
+
+    @override_settings(METRICAS_TOKEN='secreto')
+    def test_metricas_con_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        respuesta = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+class SeedTests(TestCase):
+
+    def sembrar(self):
+        call_command('seed', '--pedidos', '300', '--clientes', '40', '--repartidores', '3', '--productos', '60',
+                     '--almacenes', '2', '--hasta', '2026-01-31', '--lote', '70', '--semilla', '3', stdout=StringIO())
+        return list(DetallePedido.objects.order_by('id').values_list('pedido__cliente_id', 'producto_id', 'cantidad'))
+
+    def test_datos_coherentes_y_deterministas(self):
+        primera = self.sembrar()
+        self.assertEqual(Pedido.objects.count(), 300)
+        self.assertTrue(all(len(dni) == 8 and dni.isdigit() for dni in Cliente.objects.values_list('dni', flat=True)))
+        self.assertEqual(Pedido.objects.latest('numero_pedido').fecha_pedido.date().isoformat(), '2026-01-31')
+        # El kardex, los almacenes y los resúmenes cuadran con lo generado
+        call_command('reconciliar_stock', stdout=StringIO())
+        self.assertEqual(sum(ResumenCliente.objects.values_list('pedidos', flat=True)),
+                         Pedido.objects.exclude(estado_pedido='Cancelado').count())
+        with self.assertRaisesMessage(CommandError, "BD vacía"):
+            self.sembrar()
+
+        # Misma semilla, mismos datos
+        MovimientoStock.objects.all().delete()
+        Pedido.objects.all().delete()
+        Producto.todos.all().delete()
+        Cliente.todos.all().delete()
+        PersonalDelivery.objects.all().delete()
+        Almacen.objects.exclude(pk=inventario.almacen_principal()).delete()
+        Categoria.objects.all().delete()
+        self.assertEqual(self.sembrar(), primera)
+
+
+@mock.patch.object(cambios, 'MARGEN_LECTURA', timedelta(0))
+class RepartoTests(TestCase):
+    """App del repartidor: pendientes por delta y entregas sin conexión en un lote idempotente."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(3, prefijo='r')   # Pendientes de 'Pr'
+        crear_datos(1, prefijo='q')   # Uno de otro repartidor
+        cls.usuario = User.objects.create_user('repartidor', 'r@correo.com', 'clave')
+        PersonalDelivery.objects.filter(dni='Pr').update(usuario=cls.usuario)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def sincronizar(self, token=None):
+        return self.client.get(reverse('api_repartidor_pedidos'), {'token': token} if token is not None else {}).json()
+
+    def subir(self, entregas):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('api_repartidor_entregas'), {'entregas': entregas},
+                                    content_type='application/json').json()
+
+    def test_delta_de_pendientes(self):
+        completa = self.sincronizar()
+        self.assertTrue(completa['completo'])
+        numeros = [p['numero_pedido'] for p in completa['pedidos']]
+        self.assertEqual(len(numeros), 3)
+        self.assertEqual(completa['pedidos'][0]['productos'], [['Sr0', 'Producto 0', 1]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = pedidos.crear_pedidos([{'cliente_dni': 'r1', 'personal_dni': 'Pr',
+                                            'productos': [{'serie': 'Sr1', 'cantidad': 2}]}])[0]['numero_pedido']
+            pedidos.registrar_entrega(numeros[0], '2026-03-01')
+
+        with self.assertNumQueries(6):   # Sesión, usuario, repartidor + eventos, pedidos cambiados y sus líneas
+            delta = self.sincronizar(completa['token'])
+        self.assertFalse(delta['completo'])
+        self.assertEqual([p['numero_pedido'] for p in delta['pedidos']], [nuevo])
+        self.assertEqual(delta['eliminados'], [numeros[0]])
+        self.assertEqual(self.sincronizar(delta['token'])['pedidos'], [])
+
+    def test_entregas_sin_conexion_idempotentes_y_con_conflictos(self):
+        r0, r1, r2 = Pedido.objects.filter(personal_delivery_id='Pr').order_by('pk').values_list('pk', flat=True)
+        ajeno = Pedido.objects.get(personal_delivery_id='Pq').pk
+        pedidos.registrar_entrega(r1, '2026-03-01')   # Lo entregaron desde la oficina
+        lote = [
+            {'id': '00000000-0000-0000-0000-000000000001', 'numero_pedido': r0, 'fecha_entrega': '2026-03-02',
+             'observaciones': 'Dejado en portería'},
+            {'id': '00000000-0000-0000-0000-000000000002', 'numero_pedido': r1, 'fecha_entrega': '2026-03-02'},
+            {'id': '00000000-0000-0000-0000-000000000003', 'numero_pedido': ajeno, 'fecha_entrega': '2026-03-02'},
+            {'id': 'no-es-uuid', 'numero_pedido': r2, 'fecha_entrega': '2026-03-02'},
+        ]
+        respuesta = self.subir(lote)
+        self.assertEqual((respuesta['aplicadas'], respuesta['conflictos']), (1, 2))
+        self.assertEqual([(r['resultado'], r['motivo']) for r in respuesta['resultados'][:3]],
+                         [('aplicada', None), ('conflicto', 'ya_entregado'), ('conflicto', 'asignado_a_otro')])
+        self.assertEqual(respuesta['resultados'][3]['resultado'], 'invalida')
+        entregado = Pedido.objects.get(pk=r0)
+        self.assertEqual((entregado.estado_pedido, entregado.fecha_entrega.isoformat()), ('Entregado', '2026-03-02'))
+        self.assertIn('Dejado en portería', entregado.observaciones)
+
+        # Reintento del mismo lote (p. ej. se cortó la conexión antes de la respuesta)
+        eventos = EventoCambio.objects.count()
+        self.assertEqual(self.subir(lote), respuesta)
+        self.assertEqual(EventoCambio.objects.count(), eventos)
+        self.assertEqual(EntregaSincronizada.objects.count(), 3)
+
+    def test_reintento_simultaneo_devuelve_los_resultados_del_otro(self):
+        r0 = Pedido.objects.filter(personal_delivery_id='Pr').order_by('pk').values_list('pk', flat=True)[0]
+        lote = [{'id': '00000000-0000-0000-0000-000000000009', 'numero_pedido': r0, 'fecha_entrega': '2026-03-02'}]
+        respuesta = self.subir(lote)
+        # El segundo envío leyó las previas antes del commit del primero: su INSERT choca en el id
+        leer_previas = EntregaSincronizada.objects.in_bulk
+        with mock.patch.object(EntregaSincronizada.objects, 'in_bulk',
+                               side_effect=[{}, leer_previas(['00000000-0000-0000-0000-000000000009'])]) as previas:
+            self.assertEqual(self.subir(lote), respuesta)
+        self.assertEqual(previas.call_count, 2)
+        self.assertEqual(EntregaSincronizada.objects.get().resultado, 'aplicada')
+
+    def test_solo_repartidores(self):
+        self.client.force_login(User.objects.create_user('otro', 'o@correo.com', 'clave'))
+        self.assertEqual(self.client.get(reverse('api_repartidor_pedidos')).status_code, 403)
+
+    def test_staff_con_repartidor_inexistente(self):
+        self.client.force_login(User.objects.create_user('jefe', 'j@correo.com', 'clave', is_staff=True))
+        url = reverse('api_repartidor_entregas') + '?repartidor=99999999'
+        lote = [{'id': '00000000-0000-0000-0000-000000000001', 'numero_pedido': 1, 'fecha_entrega': '2026-03-02'}]
+        respuesta = self.client.post(url, {'entregas': lote}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 404)
+        self.assertFalse(EntregaSincronizada.objects.exists())
+        self.assertEqual(self.client.get(reverse('api_repartidor_pedidos'), {'repartidor': 'Pr'}).status_code, 200)
+
+
+class FacetasTests(TestCase):
+    """Los conteos mantenidos con deltas deben coincidir siempre con recalcularlos desde cero."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@correo.com', 'clave'))
+        self.utiles = Categoria.objects.create(nombre="Útiles")
+        self.papeles = Categoria.objects.create(nombre="Papeles")
+        for i, (color, precio) in enumerate([('Rojo', '5.00'), ('rojo ', '12.00'), ('Azul', '30.00'), (None, '300')]):
+            Producto.objects.create(numero_serie=f"F{i}", nombre=f"Producto {i}", precio=Decimal(precio),
+                                    categoria=self.utiles, color=color, dimensiones='A4')
+        facetas.recalcular()
+
+    def conteos(self):
+        return sorted(ConteoFaceta.objects.filter(productos__gt=0).values_list('categoria', 'faceta', 'valor', 'productos'))
+
+    def assertConteosAlDia(self):
+        mantenidos = self.conteos()
+        facetas.recalcular()
+        self.assertEqual(mantenidos, self.conteos())
+
+    def test_conteos_siguen_a_los_cambios(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('producto_list'), {
+                'numero_serie': 'N1', 'nombre': "Resma", 'precio': '20.00', 'stock': '5',
+                'categoria': self.papeles.id, 'color': 'Blanco', 'dimensiones': 'A4',
+            })
+        self.assertConteosAlDia()
+        self.assertEqual(facetas.contar(self.papeles.id)['stock'], [('si', 1)])
+
+        producto = Producto.objects.get(pk='F0')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('producto_update', args=['F0']), {
+                'version': producto.version, 'nombre': producto.nombre, 'descripcion': '', 'precio': '60.00',
+                'stock': 3, 'categoria': self.papeles.id, 'color': 'Verde', 'dimensiones': '',
+            })
+        self.assertConteosAlDia()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventario.registrar_movimiento(Producto.objects.get(pk='N1'), 'Ajuste', -5)   # Se agota
+        self.assertConteosAlDia()
+        self.client.post(reverse('producto_delete', args=['F1']))
+        self.assertConteosAlDia()
+        self.utiles.delete()                              # Sus productos quedan sin categoría
+        self.assertConteosAlDia()
+        self.assertEqual(facetas.contar()['categoria'], {0: 2, self.papeles.id: 2})
+
+    def test_conteos_por_categoria_y_pagina_por_cursor(self):
+        with self.assertNumQueries(1):
+            conteos = facetas.contar(self.utiles.id)
+        self.assertEqual(conteos['color'], [('rojo', 2), ('', 1), ('azul', 1)])
+        self.assertEqual(conteos['precio'], [('0-10', 1), ('10-25', 1), ('25-50', 1), ('250+', 1)])
+        self.assertEqual(conteos['categoria'], {self.utiles.id: 4})
+
+        elegidos = {'categoria': self.utiles.id, 'color': 'rojo'}
+        primera, cursor = facetas.pagina_productos(elegidos, tamano=1)
+        segunda, fin = facetas.pagina_productos(elegidos, despues=cursor, tamano=1)
+        self.assertEqual(([p.pk for p in primera], [p.pk for p in segunda], fin), (['F0'], ['F1'], None))
+        self.assertEqual([p.pk for p in facetas.pagina_productos({'precio': '250+'})[0]], ['F3'])
+
+        respuesta = self.client.get(reverse('producto_list'), {'categoria': self.utiles.id, 'color': ''})
+        self.assertEqual([p.pk for p in respuesta.context['productos']], ['F3'])
+        self.assertContains(respuesta, "Sin dato (1)")
+
+    def test_sin_dato_incluye_los_valores_en_blanco(self):
+        Producto.objects.create(numero_serie='F4', nombre="Blanco", precio=Decimal('8.00'),
+                                categoria=self.utiles, color='  ', dimensiones='A4')
+        facetas.recalcular()
+        self.assertIn(('', 2), facetas.contar(self.utiles.id)['color'])
+        sin_dato = facetas.filtrar(Producto.objects.order_by('pk'), categoria=self.utiles.id, color='')
+        self.assertEqual([p.pk for p in sin_dato], ['F3', 'F4'])
+        self.assertEqual(sorted(p.pk for p in facetas.filtrar(Producto.objects.all(), color=' ')), ['F3', 'F4'])
+
+
+class DisponibilidadTests(TestCase):
+    """El formulario de pedidos consulta el stock del carrito al cache, que se refresca con cada cambio."""
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos(2, prefijo='d')   # 'Sd0' y 'Sd1' con 10 unidades
+        cls.usuario = User.objects.create_user('vendedor', 'v@correo.com', 'clave')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def stock(self, *series):
+        return self.client.get(reverse('api_stock'), {'serie': series}).json()['stock']
+
+    def test_stock_desde_el_cache_refrescado_tras_cada_cambio(self):
+        self.assertEqual(self.stock('Sd0', 'Sd1', 'NOEXISTE'), {'Sd0': 10, 'Sd1': 10, 'NOEXISTE': None})
+        with self.assertNumQueries(2):                   # Sesión y usuario: el stock sale del cache
+            self.assertEqual(self.stock('Sd0', 'Sd1'), {'Sd0': 10, 'Sd1': 10})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pedidos.crear_pedidos([{'cliente_dni': 'd0', 'personal_dni': 'Pd',
+                                    'productos': [{'serie': 'Sd0', 'cantidad': 3}]}])
+        with self.assertNumQueries(2):
+            self.assertEqual(self.stock('Sd0', 'Sd1'), {'Sd0': 7, 'Sd1': 10})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            archivo.eliminar_logico(Producto, 'Sd1')
+        self.assertEqual(self.stock('Sd0', 'Sd1'), {'Sd0': 7, 'Sd1': None})
+
+    def test_un_refresco_atrasado_no_pisa_uno_mas_nuevo(self):
+        version = Producto.objects.get(pk='Sd0').version
+        disponibilidad.refrescar({'Sd0': (7, version + 2)})
+        disponibilidad.refrescar({'Sd0': (9, version + 1), 'Sd1': (4, version + 1)})   # Llegó tarde
+        self.assertEqual(disponibilidad.consultar(['Sd0', 'Sd1']), {'Sd0': 7, 'Sd1': 4})
+        disponibilidad.refrescar({'Sd0': (5, version + 3)})
+        self.assertEqual(disponibilidad.consultar(['Sd0']), {'Sd0': 5})
+
+    def test_valida_la_consulta(self):
+        self.assertEqual(self.client.get(reverse('api_stock')).status_code, 400)
+        demasiadas = [f"S{i}" for i in range(disponibilidad.MAX_SERIES + 1)]
+        self.assertEqual(self.client.get(reverse('api_stock'), {'serie': demasiadas}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_stock'), {'serie': 'Sd0'}).status_code, 401)
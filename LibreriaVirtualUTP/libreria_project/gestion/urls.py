@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views  # Importa las vistas (lógica) de la app 'gestion'
+from . import api  # API JSON para integraciones
 
 urlpatterns = [
     # Página de inicio (será nuestro menú principal)
@@ -13,6 +14,7 @@ urlpatterns = [
     path('pedidos/nuevo/', views.registrar_pedido_view, name='registrar_pedido'),
     
     path('clientes/', views.cliente_list_view, name='cliente_list'),
+    path('clientes/<str:dni>/historial/', views.cliente_historial_view, name='cliente_historial'),
     path('clientes/modificar/<str:dni>/', views.cliente_update_view, name='cliente_update'),
     path('clientes/eliminar/<str:dni>/', views.cliente_delete_view, name='cliente_delete'),
     path('productos/', views.producto_list_view, name='producto_list'),
@@ -30,4 +32,15 @@ urlpatterns = [
     
     path('pedidos/buscar/', views.buscar_pedidos_view, name='buscar_pedidos'),
     path('pedidos/consultar-delivery/', views.consultar_delivery_view, name='consultar_delivery'),
+    path('reportes/ventas/', views.reporte_ventas_view, name='reporte_ventas'),
+
+    # --- API JSON ---
+    path('api/pedidos/', api.api_pedidos_view, name='api_pedidos'),
+    path('api/cotizar/', api.api_cotizar_view, name='api_cotizar'),
+    path('api/stock/', api.api_stock_view, name='api_stock'),
+    path('api/cambios/', api.api_cambios_view, name='api_cambios'),
+    # App del repartidor: pendientes (delta por token) y entregas registradas sin conexión
+    path('api/repartidor/pedidos/', api.api_repartidor_pedidos_view, name='api_repartidor_pedidos'),
+    path('api/repartidor/entregas/', api.api_repartidor_entregas_view, name='api_repartidor_entregas'),
+    path('api/metricas/login/', api.api_metricas_login_view, name='api_metricas_login'),
 ]
\ No newline at end of file
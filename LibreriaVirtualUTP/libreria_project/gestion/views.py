@@ -3,9 +3,12 @@ from django.db import transaction  # Importante para transacciones
 from django.contrib import messages # Para enviar mensajes de éxito/error
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required # Para proteger vistas
-from .models import Cliente, Producto, PersonalDelivery, Pedido, DetallePedido, Categoria
+from .models import Cliente, Producto, PersonalDelivery, Pedido, Categoria
+from . import inventario, asignacion, archivo, pedidos, precios, limitador, analitica, cambios, historial, facetas
+from .concurrencia import guardar_con_version, EdicionConcurrenteError
 from django.db.models import Q
-from decimal import Decimal
+from django.core.cache import cache
+from django.utils.dateparse import parse_date
 
 # Esta es la función que definimos en urls.py
 @login_required # Proteger esta vista
@@ -29,19 +32,29 @@ def login_view(request):
         # 1. Obtener datos del formulario 
         usuario = request.POST.get('usuario')
         contrasena = request.POST.get('contrasena')
+
+        # 2. Rechazar el exceso de intentos ANTES de calcular el hash (es caro)
+        ip = limitador.ip_cliente(request)
+        espera = limitador.verificar(ip, usuario)
+        if espera is not None:
+            messages.error(request, f'Demasiados intentos de inicio de sesión. Intente nuevamente en {espera} segundos.')
+            respuesta = render(request, 'gestion/login.html', status=429)
+            respuesta['Retry-After'] = str(espera)
+            return respuesta
         
-        # 2. Autenticar al usuario
+        # 3. Autenticar al usuario
         # 'authenticate' verifica si el usuario y contraseña son correctos
         # (Usa el "superuser" que creamos con 'manage.py createsuperuser')
         user = authenticate(request, username=usuario, password=contrasena)
+        limitador.registrar_intento(ip, usuario, exitoso=user is not None)
         
         if user is not None:
-            # 3. Si es correcto, iniciar sesión
+            # 4. Si es correcto, iniciar sesión
             login(request, user)
             # Redirigir a la página principal
             return redirect('home')
         else:
-            # 4. Si no es correcto, enviar error
+            # 5. Si no es correcto, enviar error
             messages.error(request, 'Usuario o contraseña incorrectos.')
             return render(request, 'gestion/login.html')
             
@@ -77,57 +90,26 @@ def registrar_pedido_view(request):
                 messages.error(request, "No se añadieron productos al pedido.")
                 return redirect('registrar_pedido')
 
-            # --- INICIO DE LA TRANSACCIÓN ---
-            # 'atomic' asegura que si algo falla, se revierte todo.
-            with transaction.atomic():
-                
-                # 3. Buscar los objetos de Cliente y Personal
-                cliente = Cliente.objects.get(dni=cliente_dni)
-                personal = PersonalDelivery.objects.get(dni=personal_dni)
-                
-                # 4. Crear la cabecera del Pedido
-                pedido = Pedido.objects.create(
-                    cliente=cliente,
-                    personal_delivery=personal,
-                    fecha_entrega=fecha_entrega,
-                    observaciones=observaciones,
-                    estado_pedido='Pendiente'
-                )
-                
-                subtotal_total = 0
-
-                # 5. Iterar sobre los productos para crear detalles y restar stock
-                for serie, cant_str in zip(series_productos, cantidades):
-                    cantidad = int(cant_str)
-                    producto = Producto.objects.get(numero_serie=serie)
-                    
-                    # 5a. Validar Stock
-                    if producto.stock < cantidad:
-                        # Esto causa un error y revierte la transacción
-                        raise Exception(f"Stock insuficiente para {producto.nombre}. Disponible: {producto.stock}")
-                    
-                    # 5b. Crear el detalle
-                    precio_venta = producto.precio
-                    DetallePedido.objects.create(
-                        pedido=pedido,
-                        producto=producto,
-                        cantidad=cantidad,
-                        precio_unitario=precio_venta
-                    )
-                    
-                    # 5c. Actualizar Stock
-                    producto.stock -= cantidad
-                    producto.save()
-                    
-                    subtotal_total += (precio_venta * cantidad)
-                
-                # 6. Calcular Totales (Aquí puedes guardar el total en el pedido si quieres)
-                igv = subtotal_total * Decimal('0.18') 
-                total = subtotal_total + igv 
-
-            # --- FIN DE LA TRANSACCIÓN ---
+            # 3. Registrar el pedido (validación, stock y kardex en UNA transacción)
+            resultado = pedidos.crear_pedidos([{
+                'cliente_dni': cliente_dni,
+                'personal_dni': personal_dni,  # Vacío: lo decide el motor de asignación
+                'fecha_entrega': fecha_entrega,
+                'observaciones': observaciones,
+                'productos': [
+                    {'serie': serie, 'cantidad': cant_str}
+                    for serie, cant_str in zip(series_productos, cantidades)
+                ],
+            }])[0]
+
+            if not resultado['ok']:
+                # Si algo falló (Stock, DNI no existe, etc.), mostrar error
+                messages.error(request, f"Error al registrar el pedido: {resultado['error']}")
+                return redirect('registrar_pedido')
             
-            messages.success(request, f"¡Pedido N° {pedido.numero_pedido} registrado exitosamente! Total: S/ {total:.2f}")
+            messages.success(request, f"¡Pedido N° {resultado['numero_pedido']} registrado exitosamente! Total: S/ {resultado['total']:.2f}")
+            if resultado['personal_dni'] is None:
+                messages.warning(request, "Ningún personal de delivery tiene capacidad libre: el pedido quedó sin asignar.")
             return redirect('registrar_pedido') # Redirigir a la misma página
 
         except Exception as e:
@@ -147,6 +129,9 @@ def registrar_pedido_view(request):
             'clientes': clientes,
             'productos': productos,
             'personal_delivery': personal,
+            # Solo para mostrar: los montos los calcula el motor de precios
+            'tasa_igv': precios.tasa_igv(),
+            'tasa_igv_porcentaje': precios.tasa_igv() * 100,
         }
         # 3. Renderizamos la plantilla HTML
         return render(request, 'gestion/registrar_pedido.html', context)
@@ -161,15 +146,17 @@ def cliente_list_view(request):
     # Lógica de REGISTRAR (Create)
     if request.method == 'POST':
         try:
-            Cliente.objects.create(
-                dni=request.POST.get('dni'),
-                nombres=request.POST.get('nombres'),
-                apellidos=request.POST.get('apellidos'),
-                direccion=request.POST.get('direccion'),
-                distrito=request.POST.get('distrito'),
-                correo=request.POST.get('correo'),
-                celular=request.POST.get('celular'),
-            )
+            with transaction.atomic():
+                cliente = Cliente.objects.create(
+                    dni=request.POST.get('dni'),
+                    nombres=request.POST.get('nombres'),
+                    apellidos=request.POST.get('apellidos'),
+                    direccion=request.POST.get('direccion'),
+                    distrito=request.POST.get('distrito'),
+                    correo=request.POST.get('correo'),
+                    celular=request.POST.get('celular'),
+                )
+                cambios.registrar(cliente, 'alta')
             messages.success(request, "Cliente registrado exitosamente.")
         except Exception as e:
             # Manejar error de DNI/correo duplicado
@@ -201,16 +188,24 @@ def cliente_update_view(request, dni):
 
     if request.method == 'POST':
         try:
-            # Actualiza los campos del cliente
-            cliente.nombres = request.POST.get('nombres')
-            cliente.apellidos = request.POST.get('apellidos')
-            cliente.direccion = request.POST.get('direccion')
-            cliente.distrito = request.POST.get('distrito')
-            cliente.correo = request.POST.get('correo')
-            cliente.celular = request.POST.get('celular')
-            cliente.save() # Guarda los cambios
+            # Actualiza solo los campos que cambiaron, si nadie modificó el cliente mientras tanto
+            with transaction.atomic():
+                campos = guardar_con_version(cliente, request.POST.get('version'), {
+                    'nombres': request.POST.get('nombres'),
+                    'apellidos': request.POST.get('apellidos'),
+                    'direccion': request.POST.get('direccion'),
+                    'distrito': request.POST.get('distrito'),
+                    'correo': request.POST.get('correo'),
+                    'celular': request.POST.get('celular'),
+                })
+                if campos:
+                    cambios.registrar(cliente, 'modificacion', campos + ['version'])
             
             messages.success(request, "Cliente modificado exitosamente.")
+        except EdicionConcurrenteError:
+            messages.error(request, "El cliente fue modificado por otro usuario mientras lo editaba. "
+                                    "Revise los datos actuales y vuelva a guardar.")
+            return redirect('cliente_update', dni=dni)
         except Exception as e:
             messages.error(request, f"Error al modificar cliente: {e}")
             
@@ -222,6 +217,38 @@ def cliente_update_view(request, dni):
     }
     return render(request, 'gestion/cliente_update.html', context)
 
+@login_required
+def cliente_historial_view(request, dni):
+    """
+    Historial de pedidos de un cliente con sus líneas y productos, y sus
+    totales históricos (de ResumenCliente, no se suman en cada visita).
+    Paginado por cursor: ?antes=<número del último pedido mostrado>.
+    """
+    try:
+        # También los clientes dados de baja: su historial sigue existiendo
+        cliente = Cliente.todos.select_related('resumen').get(dni=dni)
+    except Cliente.DoesNotExist:
+        messages.error(request, "Cliente no encontrado.")
+        return redirect('cliente_list')
+
+    antes = request.GET.get('antes')
+    try:
+        antes = int(antes) if antes else None
+    except ValueError:
+        antes = None
+    incluir_archivo = request.GET.get('incluir_archivo', '1') == '1'
+
+    pedidos_cliente, siguiente = historial.pagina_pedidos(dni, antes, incluir_archivo)
+    context = {
+        'cliente': cliente,
+        'resumen': historial.obtener_resumen(cliente),
+        'pedidos': pedidos_cliente,
+        'siguiente': siguiente,
+        'es_primera_pagina': antes is None,
+        'incluir_archivo': incluir_archivo,
+    }
+    return render(request, 'gestion/cliente_historial.html', context)
+
 @login_required
 def cliente_delete_view(request, dni):
     """
@@ -230,17 +257,13 @@ def cliente_delete_view(request, dni):
     # Usamos POST para eliminar por seguridad
     if request.method == 'POST':
         try:
-            cliente = Cliente.objects.get(dni=dni)
-            cliente.delete()
-            messages.success(request, "Cliente eliminado exitosamente.")
-        except Cliente.DoesNotExist:
-            messages.error(request, "Cliente no encontrado.")
-        except Exception as e:
-            # Maneja error de clave foránea (cliente con pedidos)
-            if 'FOREIGN KEY constraint' in str(e):
-                messages.error(request, "Error: No se puede eliminar. El cliente tiene pedidos asociados.")
+            # Borrado lógico: sus pedidos (vigentes y archivados) lo siguen referenciando
+            if archivo.eliminar_logico(Cliente, dni):
+                messages.success(request, "Cliente eliminado exitosamente.")
             else:
-                messages.error(request, f"Error al eliminar cliente: {e}")
+                messages.error(request, "Cliente no encontrado.")
+        except Exception as e:
+            messages.error(request, f"Error al eliminar cliente: {e}")
                 
     return redirect('cliente_list')
 
@@ -258,17 +281,24 @@ def producto_list_view(request):
             categoria_id = request.POST.get('categoria')
             categoria_obj = Categoria.objects.get(id=categoria_id)
             
-            # 2. Crear el Producto
-            Producto.objects.create(
-                numero_serie=request.POST.get('numero_serie'),
-                nombre=request.POST.get('nombre'),
-                descripcion=request.POST.get('descripcion'),
-                precio=request.POST.get('precio'),
-                stock=request.POST.get('stock'),
-                categoria=categoria_obj, # Asignar el objeto Categoría
-                color=request.POST.get('color'),
-                dimensiones=request.POST.get('dimensiones'),
-            )
+            # 2. Crear el Producto (con stock 0: el stock inicial entra por el kardex)
+            stock_inicial = int(request.POST.get('stock') or 0)
+            with transaction.atomic():
+                producto = Producto.objects.create(
+                    numero_serie=request.POST.get('numero_serie'),
+                    nombre=request.POST.get('nombre'),
+                    descripcion=request.POST.get('descripcion'),
+                    precio=request.POST.get('precio'),
+                    stock=0,
+                    categoria=categoria_obj, # Asignar el objeto Categoría
+                    color=request.POST.get('color'),
+                    dimensiones=request.POST.get('dimensiones'),
+                )
+                cambios.registrar(producto, 'alta')
+                facetas.registrar([], facetas.de_producto(producto))
+                if stock_inicial:
+                    inventario.registrar_movimiento(producto, 'Importacion', stock_inicial,
+                                                    observaciones="Stock inicial")
             messages.success(request, "Producto registrado exitosamente.")
         except Exception as e:
             if 'UNIQUE constraint' in str(e) or 'Duplicate entry' in str(e):
@@ -278,18 +308,85 @@ def producto_list_view(request):
         
         return redirect('producto_list')
 
-    # Lógica de LISTAR (Read)
-    # Si es GET, solo muestra la página
-    productos = Producto.objects.all().select_related('categoria') # Optimización: trae la categoría en la misma consulta
-    categorias = Categoria.objects.all() # Para el formulario
-    
+    # Lógica de LISTAR (Read): filtrado por facetas y paginado por cursor (?despues=<serie>)
+    elegidos = _facetas_elegidas(request.GET)
+    try:
+        productos, siguiente = facetas.pagina_productos(elegidos, request.GET.get('despues') or None)
+    except ValueError:
+        # Un rango de precio que no existe (URL editada a mano): se ignora
+        elegidos.pop('precio')
+        productos, siguiente = facetas.pagina_productos(elegidos, request.GET.get('despues') or None)
+    categorias = list(Categoria.objects.all()) # Para el formulario y la faceta de categoría
+
     context = {
         'productos': productos,
-        'categorias': categorias # Enviamos las categorías al <select>
+        'categorias': categorias, # Enviamos las categorías al <select>
+        'facetas': _enlaces_facetas(request.GET, elegidos, facetas.contar(elegidos.get('categoria')), categorias),
+        'hay_filtros': bool(elegidos),
+        'siguiente': siguiente,
+        'consulta_siguiente': _consulta(request.GET, despues=siguiente) if siguiente else None,
+        'es_primera_pagina': not request.GET.get('despues'),
+        'consulta_primera': _consulta(request.GET, despues=None),
     }
     return render(request, 'gestion/productos.html', context)
 
 
+ETIQUETAS_FACETAS = {'categoria': 'Categoría', 'color': 'Color', 'precio': 'Precio (S/)',
+                     'dimensiones': 'Dimensiones', 'stock': 'Stock'}
+
+
+def _facetas_elegidas(get):
+    """Los valores elegidos en la URL, como kwargs de facetas.filtrar."""
+    elegidos = {}
+    if get.get('categoria') is not None:
+        try:
+            elegidos['categoria'] = int(get['categoria'])
+        except ValueError:
+            pass
+    for faceta in ('color', 'precio', 'dimensiones'):
+        if faceta in get:
+            elegidos[faceta] = get[faceta]
+    if get.get('stock') in ('si', 'no'):
+        elegidos['stock'] = get['stock']
+    return elegidos
+
+
+def _consulta(get, **cambios_url):
+    """La query string actual con 'cambios_url' aplicados (None quita el parámetro)."""
+    consulta = get.copy()
+    for clave, valor in cambios_url.items():
+        consulta.pop(clave, None)
+        if valor is not None:
+            consulta[clave] = valor
+    return consulta.urlencode()
+
+
+def _enlaces_facetas(get, elegidos, conteos, categorias):
+    """[(etiqueta, [(texto, cantidad, elegido, query string que lo activa o lo quita)])] para la plantilla."""
+    nombres = {c.id: c.nombre for c in categorias}
+    valores = {
+        'categoria': sorted(((cat, n) for cat, n in conteos['categoria'].items()),
+                            key=lambda par: nombres.get(par[0], '')),
+        **{faceta: conteos[faceta] for faceta in facetas.FACETAS},
+    }
+    resultado = []
+    for faceta, pares in valores.items():
+        enlaces = []
+        for valor, cantidad in pares:
+            if faceta == 'categoria':
+                texto = nombres.get(valor, 'Sin categoría')
+            elif faceta == 'stock':
+                texto = 'Con stock' if valor == 'si' else 'Sin stock'
+            else:
+                texto = valor or 'Sin dato'
+            elegido = elegidos.get(faceta) == valor
+            # Cambiar de faceta vuelve a la primera página
+            enlaces.append((texto, cantidad, elegido, _consulta(get, despues=None, **{faceta: None if elegido else valor})))
+        if enlaces:
+            resultado.append((ETIQUETAS_FACETAS[faceta], enlaces))
+    return resultado
+
+
 @login_required
 def producto_update_view(request, serie):
     """
@@ -308,17 +405,37 @@ def producto_update_view(request, serie):
             categoria_id = request.POST.get('categoria')
             categoria_obj = Categoria.objects.get(id=categoria_id)
             
-            # 2. Actualizar los campos
-            producto.nombre = request.POST.get('nombre')
-            producto.descripcion = request.POST.get('descripcion')
-            producto.precio = request.POST.get('precio')
-            producto.stock = request.POST.get('stock')
-            producto.categoria = categoria_obj # Asignar la nueva categoría
-            producto.color = request.POST.get('color')
-            producto.dimensiones = request.POST.get('dimensiones')
-            producto.save() # Guarda los cambios
+            nuevo_stock = int(request.POST.get('stock'))
+
+            with transaction.atomic():
+                producto = Producto.objects.select_for_update().get(numero_serie=serie)
+                antes = facetas.de_producto(producto)
+
+                # 2. Actualizar solo los campos que cambiaron (el stock NO se sobrescribe aquí).
+                # Si hubo una venta o edición desde que se abrió el formulario, la versión
+                # ya no coincide y se rechaza el cambio.
+                campos = guardar_con_version(producto, request.POST.get('version'), {
+                    'nombre': request.POST.get('nombre'),
+                    'descripcion': request.POST.get('descripcion'),
+                    'precio': request.POST.get('precio'),
+                    'categoria_id': categoria_obj.id, # Asignar la nueva categoría
+                    'color': request.POST.get('color'),
+                    'dimensiones': request.POST.get('dimensiones'),
+                })
+                if campos:
+                    cambios.registrar(producto, 'modificacion', campos + ['version'])
+                    facetas.registrar(antes, facetas.de_producto(producto))
+
+                # 3. Si cambió el stock, la diferencia entra al kardex como ajuste
+                if nuevo_stock != producto.stock:
+                    inventario.registrar_movimiento(producto, 'Ajuste', nuevo_stock - producto.stock,
+                                                    observaciones=f"Ajuste manual por {request.user.username}")
             
             messages.success(request, "Producto modificado exitosamente.")
+        except EdicionConcurrenteError:
+            messages.error(request, "El producto cambió mientras lo editaba (p. ej. por una venta). "
+                                    "Se muestran los datos actuales: revíselos y vuelva a guardar.")
+            return redirect('producto_update', serie=serie)
         except Exception as e:
             messages.error(request, f"Error al modificar producto: {e}")
             
@@ -338,16 +455,13 @@ def producto_delete_view(request, serie):
     """
     if request.method == 'POST':
         try:
-            producto = Producto.objects.get(numero_serie=serie)
-            producto.delete()
-            messages.success(request, "Producto eliminado exitosamente.")
-        except Producto.DoesNotExist:
-            messages.error(request, "Producto no encontrado.")
-        except Exception as e:
-            if 'FOREIGN KEY constraint' in str(e):
-                messages.error(request, "Error: No se puede eliminar. El producto está asociado a pedidos.")
+            # Borrado lógico: el producto sigue en los pedidos y en el kardex
+            if archivo.eliminar_logico(Producto, serie):
+                messages.success(request, "Producto eliminado exitosamente.")
             else:
-                messages.error(request, f"Error al eliminar producto: {e}")
+                messages.error(request, "Producto no encontrado.")
+        except Exception as e:
+            messages.error(request, f"Error al eliminar producto: {e}")
                 
     return redirect('producto_list')
 
@@ -446,7 +560,9 @@ def personal_list_view(request):
                 nombres=request.POST.get('nombres'),
                 apellidos=request.POST.get('apellidos'),
                 celular=request.POST.get('celular'),
+                capacidad=request.POST.get('capacidad') or 20,
             )
+            asignacion.invalidar()
             messages.success(request, "Personal de delivery registrado exitosamente.")
         except Exception as e:
             if 'UNIQUE constraint' in str(e) or 'Duplicate entry' in str(e):
@@ -479,7 +595,9 @@ def personal_update_view(request, dni):
             personal.nombres = request.POST.get('nombres')
             personal.apellidos = request.POST.get('apellidos')
             personal.celular = request.POST.get('celular')
+            personal.capacidad = request.POST.get('capacidad') or personal.capacidad
             personal.save()
+            asignacion.invalidar()
             
             messages.success(request, "Personal modificado exitosamente.")
         except Exception as e:
@@ -502,6 +620,7 @@ def personal_delete_view(request, dni):
         try:
             personal = PersonalDelivery.objects.get(dni=dni)
             personal.delete()
+            asignacion.invalidar()
             messages.success(request, "Personal eliminado exitosamente.")
         except PersonalDelivery.DoesNotExist:
             messages.error(request, "Personal no encontrado.")
@@ -561,20 +680,12 @@ def registrar_entrega_view(request):
     if 'registrar' in request.POST:
         try:
             pedido_id = request.POST.get('pedido_id')
-            pedido = Pedido.objects.get(numero_pedido=pedido_id, estado_pedido='Pendiente')
-            
-            # 
-            fecha_entrega = request.POST.get('fecha_entrega')
-            observaciones = request.POST.get('observaciones_entrega', '')
-            
-            # Actualizamos el pedido
-            pedido.estado_pedido = 'Entregado'
-            pedido.fecha_entrega = fecha_entrega
-            # Añadimos las observaciones de entrega a las existentes
-            obs_original = pedido.observaciones if pedido.observaciones else ""
-            pedido.observaciones = f"{obs_original}\n[ENTREGA {fecha_entrega}]: {observaciones}".strip()
-            
-            pedido.save()
+            # Estado, fecha y observaciones de entrega (y su evento en el feed de cambios)
+            pedidos.registrar_entrega(
+                pedido_id,
+                request.POST.get('fecha_entrega'),
+                request.POST.get('observaciones_entrega', ''),
+            )
             messages.success(request, f"Entrega registrada exitosamente para el Pedido N° {pedido_id}.")
             
         except Pedido.DoesNotExist:
@@ -602,11 +713,10 @@ def buscar_pedidos_view(request):
     apellido_b = request.GET.get('apellido_cliente', '')
     fecha_desde_b = request.GET.get('fecha_desde', '')
     fecha_hasta_b = request.GET.get('fecha_hasta', '')
+    incluir_archivo = bool(request.GET.get('incluir_archivo'))
 
-    # Iniciamos la consulta base (todos los pedidos)
-    # .select_related() optimiza la consulta trayendo los datos
-    # de Cliente y PersonalDelivery en un solo viaje a la BD.
-    queryset = Pedido.objects.all().select_related('cliente', 'personal_delivery')
+    # Acumulamos los filtros en un Q() para poder aplicarlos también al archivo histórico
+    filtros = Q()
 
     if 'buscar' in request.GET:
         # Filtro 1: Por Nombre o Apellido [cite: 154-155]
@@ -620,20 +730,25 @@ def buscar_pedidos_view(request):
             if apellido_b:
                 query_nombre |= Q(cliente__apellidos__icontains=apellido_b)
                 
-            queryset = queryset.filter(query_nombre)
+            filtros &= query_nombre
 
         # Filtro 2: Por Rango de Fechas [cite: 156]
         if fecha_desde_b and fecha_hasta_b:
             # __range es como "BETWEEN fecha1 AND fecha2"
-            try:
-                queryset = queryset.filter(fecha_pedido__date__range=[fecha_desde_b, fecha_hasta_b])
-            except Exception as e:
-                messages.error(request, "Formato de fechas incorrecto.")
+            filtros &= Q(fecha_pedido__date__range=[fecha_desde_b, fecha_hasta_b])
 
-        pedidos_encontrados = queryset.order_by('-fecha_pedido') # Mostrar los más nuevos primero
+        try:
+            # .select_related() trae Cliente y PersonalDelivery en el mismo viaje a la BD.
+            # Los más nuevos primero; el archivo histórico solo si se pidió.
+            pedidos_encontrados = archivo.pedidos_con_archivo(filtros, '-fecha_pedido', incluir_archivo)
+        except Exception as e:
+            messages.error(request, "Formato de fechas incorrecto.")
         
         if not pedidos_encontrados:
             messages.info(request, "No se encontraron pedidos con esos criterios.")
+        elif len(pedidos_encontrados) == archivo.LIMITE_RESULTADOS:
+            messages.info(request, f"Se muestran los {archivo.LIMITE_RESULTADOS} pedidos más recientes; "
+                                   "acote la búsqueda por fechas para ver los demás.")
 
     context = {
         'pedidos': pedidos_encontrados,
@@ -643,6 +758,7 @@ def buscar_pedidos_view(request):
             'apellido': apellido_b,
             'desde': fecha_desde_b,
             'hasta': fecha_hasta_b,
+            'incluir_archivo': incluir_archivo,
         }
     }
     return render(request, 'gestion/buscar_pedidos.html', context)
@@ -661,6 +777,7 @@ def consultar_delivery_view(request):
     dni_b = request.GET.get('dni_personal', '')
     nombres_b = request.GET.get('nombres_personal', '')
     apellidos_b = request.GET.get('apellidos_personal', '')
+    incluir_archivo = bool(request.GET.get('incluir_archivo'))
 
     if 'buscar' in request.GET:
         # 1. Buscar al Personal de Delivery 
@@ -682,13 +799,15 @@ def consultar_delivery_view(request):
             if personal_encontrado:
                 # 2. Si se encuentra, buscar sus pedidos ENTREGADOS 
                 messages.success(request, f"Mostrando pedidos entregados por: {personal_encontrado.nombres} {personal_encontrado.apellidos}")
-                pedidos_entregados = Pedido.objects.filter(
-                    personal_delivery=personal_encontrado,
-                    estado_pedido='Entregado'
-                ).select_related('cliente').order_by('-fecha_entrega')
+                pedidos_entregados = archivo.pedidos_con_archivo(
+                    Q(personal_delivery=personal_encontrado, estado_pedido='Entregado'),
+                    '-fecha_entrega', incluir_archivo,
+                )
                 
                 if not pedidos_entregados:
                     messages.info(request, "Este personal no tiene pedidos entregados registrados.")
+                elif len(pedidos_entregados) == archivo.LIMITE_RESULTADOS:
+                    messages.info(request, f"Se muestran las {archivo.LIMITE_RESULTADOS} entregas más recientes.")
             elif query_personal:
                 messages.error(request, "No se encontró personal de delivery con esos criterios.")
                 
@@ -703,6 +822,62 @@ def consultar_delivery_view(request):
             'dni': dni_b,
             'nombres': nombres_b,
             'apellidos': apellidos_b,
+            'incluir_archivo': incluir_archivo,
         }
     }
-    return render(request, 'gestion/consultar_delivery.html', context)
\ No newline at end of file
+    return render(request, 'gestion/consultar_delivery.html', context)
+
+# El reporte recorre todas las líneas de pedido: se guarda unos minutos en el cache
+SEGUNDOS_CACHE_REPORTE = 600
+TOP_PRODUCTOS_REPORTE = 20
+
+@login_required
+def reporte_ventas_view(request):
+    """
+    Reporte de ventas: ingresos por mes, categoría, distrito y repartidor,
+    clasificación ABC de productos y retención por cohorte de clientes.
+    """
+    desde_b = request.GET.get('desde', '')
+    hasta_b = request.GET.get('hasta', '')
+    # Al abrir la página el archivo histórico va incluido (es donde está la historia)
+    incluir_archivo = bool(request.GET.get('incluir_archivo')) if 'generar' in request.GET else True
+    reporte = None
+
+    if 'generar' in request.GET:
+        try:
+            desde = parse_date(desde_b) if desde_b else None
+            hasta = parse_date(hasta_b) if hasta_b else None
+        except ValueError:
+            desde = hasta = None
+            messages.error(request, "Formato de fechas incorrecto.")
+        else:
+            clave = f"analitica:reporte:{desde}:{hasta}:{incluir_archivo}"
+            reporte = cache.get(clave)
+            if reporte is None:
+                try:
+                    reporte = analitica.reporte_ventas(desde, hasta, incluir_archivo)
+                except analitica.AnaliticaNoDisponible as e:
+                    messages.error(request, str(e))
+                else:
+                    cache.set(clave, reporte, SEGUNDOS_CACHE_REPORTE)
+
+    top_productos = []
+    cohortes = []
+    if reporte:
+        cohortes = [{**c, 'retencion': c['retencion'][:analitica.MESES_RETENCION]} for c in reporte['cohortes']]
+        top = reporte['productos_abc'][:TOP_PRODUCTOS_REPORTE]
+        nombres = analitica.nombres_productos([p['serie'] for p in top])
+        top_productos = [{**p, 'nombre': nombres.get(p['serie'], p['serie'])} for p in top]
+
+    context = {
+        'reporte': reporte,
+        'top_productos': top_productos,
+        'cohortes': cohortes,
+        'meses_retencion': range(analitica.MESES_RETENCION),
+        'valores_busqueda': {
+            'desde': desde_b,
+            'hasta': hasta_b,
+            'incluir_archivo': incluir_archivo,
+        },
+    }
+    return render(request, 'gestion/reporte_ventas.html', context)
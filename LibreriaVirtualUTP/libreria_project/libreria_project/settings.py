@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gestion.metricas.MetricasMiddleware',  # Primero: mide todo lo demás (ver gestion/metricas.py)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -120,8 +123,67 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'  # Destino de 'manage.py collectstatic'
+
+# 'collectstatic' deja los CSS/JS con el hash del contenido en el nombre,
+# minificados y con su versión .gz/.br al lado (gestion/estaticos.py).
+# Esos archivos se pueden servir con caché de un año, p. ej. en nginx:
+#   location /static/ { alias <STATIC_ROOT>/; gzip_static on; expires max; }
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'gestion.estaticos.EstaticosComprimidos'},
+}
+
+# Sin nginx delante, WhiteNoise (opcional: pip install whitenoise) sirve los
+# estáticos desde Django: las versiones precomprimidas según Accept-Encoding
+# y los archivos con hash con caché "immutable" de un año.
+if find_spec('whitenoise'):
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'whitenoise.middleware.WhiteNoiseMiddleware')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Impuesto General a las Ventas que aplica el motor de precios (gestion/precios.py)
+TASA_IGV = '0.18'
+
+# Límite de intentos de login (gestion/limitador.py): (intentos, segundos) por IP y por usuario.
+# Los contadores viven en el cache: con varios workers hay que usar un cache
+# compartido (Redis/Memcached); el cache local por defecto cuenta por proceso.
+LIMITES_LOGIN = {
+    'ip': (30, 300),
+    'usuario': (5, 900),
+}
+LOGIN_CONFIAR_PROXY = False  # True solo detrás de un proxy propio que ponga X-Forwarded-For
+
+# /metrics (gestion/salud.py): si se define, Prometheus debe enviar 'Authorization: Bearer <token>'.
+# Sin token, restringir la ruta en el proxy a la red interna.
+METRICAS_TOKEN = os.environ.get('LIBRERIA_METRICAS_TOKEN')
+
+# Cache: local del proceso por defecto. Con varios workers (y para las
+# sesiones en cache) definir LIBRERIA_REDIS_URL, p. ej. redis://127.0.0.1:6379/1
+# (requiere el paquete 'redis').
+if os.environ.get('LIBRERIA_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['LIBRERIA_REDIS_URL'],
+        }
+    }
+
+# Almacenamiento de sesiones, según LIBRERIA_SESIONES:
+#   db        -> tabla django_session: una lectura por request autenticado (por defecto)
+#   cached_db -> cache + tabla: lee del cache, escribe en ambos (sobrevive a un reinicio del cache)
+#   cache     -> solo cache: ninguna consulta; requiere un cache compartido (Redis)
+#   cookie    -> cookie firmada con SECRET_KEY: ninguna consulta ni cache, pero un
+#                logout no invalida copias robadas de la cookie hasta que venza
+# Las sesiones vencidas de db/cached_db se borran con 'manage.py limpiar_sesiones'.
+MOTORES_SESION = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = MOTORES_SESION[os.environ.get('LIBRERIA_SESIONES', 'db')]
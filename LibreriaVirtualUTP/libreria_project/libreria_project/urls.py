@@ -1,7 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include  # <-- Asegúrate de importar 'include'
 
+from gestion import salud
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Sondas del orquestador y métricas (sin login; ver gestion/salud.py)
+    path('healthz', salud.healthz_view, name='healthz'),
+    path('readyz', salud.readyz_view, name='readyz'),
+    path('metrics', salud.metricas_view, name='metricas'),
     path('', include('gestion.urls')),  # <-- Añade esta línea
 ]
\ No newline at end of file